@@ -1,13 +1,25 @@
 #!/usr/bin/env python3
 """
 Bulk Song Analysis Tool - Analyze a CSV of songs using ALL 10 Spotify MCP Tools
+
+Usage:
+    python analyze_songs.py [csv_file]          (interactive menus)
+    python analyze_songs.py [csv_file] --baseline
+                                                (option 9 also times a sequential run)
+
+Batch mode (no prompts, for nightly runs over many files):
+    python analyze_songs.py --batch events/*.csv
+    python analyze_songs.py --batch a.csv b.ndjson --analyses explicitness,genres --workers 8 --output-dir reports
 """
 
 import asyncio
+import contextvars
+import io
 import os
 import sys
 import json
 import csv
+import time
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -401,16 +413,243 @@ async def tool_12_find_missing(songs):
 
     print_separator()
 
-async def run_all_analyses(songs):
-    """Run all 6 collection-based tools"""
+# Output buffer of the analysis task that is currently printing (if any)
+_task_output = contextvars.ContextVar("task_output", default=None)
+
+class TaskBufferedStdout:
+    """sys.stdout stand-in that sends each analysis task's prints to its own buffer"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        buffer = _task_output.get()
+        return (buffer if buffer is not None else self.stream).write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, attr):
+        return getattr(self.stream, attr)
+
+async def run_buffered(analysis, songs):
+    """Run one analysis with its printed report captured; returns (report, seconds)"""
+    buffer = io.StringIO()
+    _task_output.set(buffer)
+    started = time.perf_counter()
+    try:
+        await analysis(songs)
+    except Exception as e:
+        print(f"\n[ERROR] {analysis.__name__} failed: {e}")
+    return buffer.getvalue(), time.perf_counter() - started
+
+async def timed_pass(analyses, songs, concurrent):
+    """Wall time of one more pass over the analyses, reports discarded
+
+    Calls skip the tools' response caches (full_responses), so every pass
+    does the same work on the same warm resolution caches.
+    """
+    async def quiet(analysis):
+        server.full_responses.set(True)
+        await run_buffered(analysis, songs)
+
+    started = time.perf_counter()
+    if concurrent:
+        await asyncio.gather(*(quiet(a) for a in analyses))
+    else:
+        for analysis in analyses:
+            # A task of its own, so its context changes stay with it
+            await asyncio.create_task(quiet(analysis))
+    return time.perf_counter() - started
+
+async def run_all_analyses(songs, baseline=False):
+    """Run the four collection analyses concurrently, printing reports in order
+
+    All four start at once; their Spotify calls are bounded by the server's
+    shared rate budget and per-tool limits. With baseline, the analyses are
+    then timed again on the now warm caches, once concurrently and once one
+    after another.
+    """
     print("\n" + "=" * 70)
     print("  RUNNING ALL COLLECTION ANALYSES")
     print("=" * 70)
 
-    await tool_1_explicitness(songs)
-    await tool_2_diversity(songs)
-    await tool_3_genres(songs)
-    await tool_4_top_artists(songs)
+    analyses = [tool_1_explicitness, tool_2_diversity, tool_3_genres, tool_4_top_artists]
+    started = time.perf_counter()
+
+    real_stdout = sys.stdout
+    sys.stdout = TaskBufferedStdout(real_stdout)
+    try:
+        outputs = await asyncio.gather(*(run_buffered(a, songs) for a in analyses))
+        wall_seconds = time.perf_counter() - started
+        if baseline:
+            concurrent_seconds = await timed_pass(analyses, songs, concurrent=True)
+            sequential_seconds = await timed_pass(analyses, songs, concurrent=False)
+    finally:
+        sys.stdout = real_stdout
+
+    for report, _ in outputs:
+        print(report, end="")
+
+    print(f"\nTotal wall time: {wall_seconds:.2f}s")
+    if baseline:
+        print(f"Warm caches: {concurrent_seconds:.2f}s concurrent vs. {sequential_seconds:.2f}s sequential")
+
+# Batch mode analysis names -> server tools
+BATCH_ANALYSES = {
+    "explicitness": "analyze_explicitness",
+    "diversity": "analyze_collection_diversity",
+    "genres": "analyze_genres_in_collection",
+    "top_artists": "get_top_artists_from_collection",
+    "taste": "compare_to_my_taste",
+    "missing": "find_whats_missing",
+}
+DEFAULT_BATCH_ANALYSES = ["explicitness", "diversity", "genres", "top_artists"]
+
+async def run_tool_for_report(tool_name, arguments):
+    """Call a tool and return (parsed result or error, seconds taken)"""
+    # Reports keep every song, whatever the server's response size limit
+    server.full_responses.set(True)
+    started = time.perf_counter()
+    result = await server.call_tool(tool_name, arguments)
+    seconds = round(time.perf_counter() - started, 3)
+    try:
+        return json.loads(result[0].text), seconds
+    except json.JSONDecodeError:
+        return {"error": result[0].text}, seconds
+
+def report_names(files):
+    """Report file name (under the output dir) for each input file
+
+    Names follow the files' paths below their common folder, so
+    events/2024/oct.csv and events/2025/oct.csv get 2024/oct.report.json and
+    2025/oct.report.json. Names that still clash (oct.csv next to
+    oct.ndjson, a file listed twice) get a number; returns (names, collisions).
+    """
+    paths = [os.path.abspath(f) for f in files]
+    try:
+        common = os.path.commonpath([os.path.dirname(p) for p in paths])
+    except ValueError:      # Windows: files on different drives
+        common = None
+    names, collisions, taken = [], [], {}
+    for file, path in zip(files, paths):
+        stem = os.path.splitext(os.path.relpath(path, common) if common else os.path.basename(path))[0]
+        name = stem + ".report.json"
+        number = 2
+        # Compared case-insensitively, as the output folder may be
+        while name.casefold() in taken:
+            name = f"{stem}.{number}.report.json"
+            number += 1
+        if number > 2:
+            collisions.append({"file": file, "clashes_with": taken[(stem + ".report.json").casefold()],
+                               "report": name})
+        taken[name.casefold()] = file
+        names.append(name)
+    return names, collisions
+
+async def analyze_file_for_batch(path, analyses, output_dir, report_name):
+    """Run the requested analyses on one file and write its JSON report"""
+    started = time.perf_counter()
+    report = {"file": path, "analyses": {}, "timings": {}}
+
+    # Songs are streamed from disk by the server, not loaded here. The
+    # analyses are independent, so they run concurrently.
+    arguments = {"songs_source": os.path.abspath(path)}
+    outcomes = await asyncio.gather(
+        *(run_tool_for_report(BATCH_ANALYSES[analysis], arguments) for analysis in analyses)
+    )
+    for analysis, (data, seconds) in zip(analyses, outcomes):
+        report["analyses"][analysis] = data
+        report["timings"][analysis] = seconds
+
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    report["errors"] = [name for name, data in report["analyses"].items() if "error" in data]
+
+    report_path = os.path.join(output_dir, report_name)
+    os.makedirs(os.path.dirname(report_path), exist_ok=True)
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    return {
+        "file": path,
+        "report": report_path,
+        "seconds": report["seconds"],
+        "timings": report["timings"],
+        "errors": report["errors"]
+    }
+
+async def run_batch(files, analyses, output_dir, workers=4):
+    """Analyze many files in parallel and write one report per file plus a run summary"""
+    os.makedirs(output_dir, exist_ok=True)
+    semaphore = asyncio.Semaphore(workers)
+    started = time.perf_counter()
+
+    names, collisions = report_names(files)
+    for collision in collisions:
+        print(f"[WARNING] {collision['file']} has the same report name as {collision['clashes_with']}; "
+              f"writing {collision['report']}")
+
+    async def worker(path, report_name):
+        async with semaphore:
+            try:
+                summary = await analyze_file_for_batch(path, analyses, output_dir, report_name)
+            except Exception as e:
+                summary = {"file": path, "errors": [str(e)]}
+            status = "OK" if not summary["errors"] else "ERROR"
+            print(f"[{status}] {path} ({summary.get('seconds', 0)}s)")
+            return summary
+
+    # All workers share the server process, so they share its resolution cache
+    results = await asyncio.gather(*(worker(path, name) for path, name in zip(files, names)))
+
+    run_summary = {
+        "files": len(files),
+        "failed": sum(1 for r in results if r["errors"]),
+        "analyses": analyses,
+        "workers": workers,
+        "wall_seconds": round(time.perf_counter() - started, 3),
+        "sum_of_file_seconds": round(sum(r.get("seconds", 0) for r in results), 3),
+        "report_name_collisions": collisions,
+        "cache_stats": server.server_stats(),
+        "results": results
+    }
+    summary_path = os.path.join(output_dir, "run_summary.json")
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(run_summary, f, indent=2, ensure_ascii=False)
+
+    print(f"\n[OK] {len(files)} files, {run_summary['failed']} failed, "
+          f"{run_summary['wall_seconds']}s wall time")
+    print(f"[OK] Summary written to {summary_path}")
+    return run_summary
+
+def batch_main(argv):
+    """Parse batch-mode arguments and run the batch"""
+    options = {"--analyses": None, "--workers": "4", "--output-dir": "reports"}
+    files = []
+    args = iter(argv)
+    for arg in args:
+        if arg in options:
+            options[arg] = next(args, None)
+        elif arg != "--batch":
+            files.append(arg)
+
+    analyses = options["--analyses"].split(",") if options["--analyses"] else DEFAULT_BATCH_ANALYSES
+    unknown = [a for a in analyses if a not in BATCH_ANALYSES]
+    if not files or unknown:
+        if unknown:
+            print(f"[ERROR] Unknown analyses: {', '.join(unknown)}")
+        print("Usage: python analyze_songs.py --batch <file> [<file> ...] "
+              "[--analyses a,b] [--workers N] [--output-dir DIR]")
+        print(f"Analyses: {', '.join(BATCH_ANALYSES)}")
+        sys.exit(1)
+
+    missing = [f for f in files if not os.path.exists(f)]
+    if missing:
+        print(f"[ERROR] File(s) not found: {', '.join(missing)}")
+        sys.exit(1)
+
+    summary = asyncio.run(run_batch(files, analyses, options["--output-dir"], int(options["--workers"])))
+    sys.exit(1 if summary["failed"] else 0)
 
 async def main():
     """Main function"""
@@ -444,8 +683,9 @@ async def main():
     else:
         # CSV mode (default)
         csv_file = "song_list_template.csv"
-        if len(sys.argv) > 1:
-            csv_file = sys.argv[1]
+        files = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+        if files:
+            csv_file = files[0]
         else:
             # Ask for CSV filename
             custom_file = input(f"\nEnter CSV filename (or press Enter for '{csv_file}'): ").strip()
@@ -454,7 +694,7 @@ async def main():
 
         if not os.path.exists(csv_file):
             print(f"\n[ERROR] CSV file not found: {csv_file}")
-            print("\nUsage: python analyze_songs.py [csv_file]")
+            print("\nUsage: python analyze_songs.py [csv_file] [--baseline]")
             print("Default: song_list_template.csv")
             return
 
@@ -507,7 +747,7 @@ async def main():
     elif choice == "8":
         await tool_12_find_missing(songs)
     elif choice == "9":
-        await run_all_analyses(songs)
+        await run_all_analyses(songs, baseline="--baseline" in sys.argv)
     elif choice == "10":
         query = input("Search for: ").strip()
         if query:
@@ -570,4 +810,7 @@ async def main():
         print("\n[ERROR] Invalid option")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if "--batch" in sys.argv:
+        batch_main(sys.argv[1:])
+    else:
+        asyncio.run(main())
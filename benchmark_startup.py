@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Startup Benchmark - How long until the MCP server can answer list_tools?
+
+Measures, in fresh interpreters so nothing is cached between runs:
+  1. Importing music_server_updated_2025 (what spotify_cli.py, analyze_songs.py
+     and test_mcp_server.py pay before doing anything)
+  2. Import + first list_tools() call, and whether spotipy got imported
+  3. A full MCP handshake over stdio (spawn, initialize, list_tools)
+
+Usage:
+    python benchmark_startup.py
+    python benchmark_startup.py --runs 10
+"""
+
+import asyncio
+import os
+import sys
+import json
+import time
+import statistics
+import subprocess
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_SCRIPT = os.path.join(SERVER_DIR, "music_server_updated_2025.py")
+
+# list_tools never needs real credentials; placeholders keep the benchmark
+# runnable on machines without a .env file.
+BENCH_ENV = dict(os.environ)
+BENCH_ENV.setdefault("SPOTIFY_CLIENT_ID", "benchmark-client-id")
+BENCH_ENV.setdefault("SPOTIFY_CLIENT_SECRET", "benchmark-client-secret")
+
+IMPORT_PROBE = """
+import sys, time, json, asyncio
+sys.path.insert(0, {server_dir!r})
+started = time.perf_counter()
+import music_server_updated_2025 as server
+imported = time.perf_counter()
+tools = asyncio.run(server.list_tools())
+listed = time.perf_counter()
+print(json.dumps({{
+    "import_seconds": imported - started,
+    "list_tools_seconds": listed - started,
+    "tools": len(tools),
+    "spotipy_imported": "spotipy" in sys.modules
+}}))
+"""
+
+
+def run_import_probe():
+    """Import the server and call list_tools in a fresh interpreter."""
+    probe = IMPORT_PROBE.format(server_dir=SERVER_DIR)
+    output = subprocess.run(
+        [sys.executable, "-c", probe],
+        capture_output=True, text=True, env=BENCH_ENV, check=True
+    )
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+async def run_handshake():
+    """Spawn the server over stdio and time initialize + list_tools."""
+    from mcp import ClientSession
+    from mcp.client.stdio import StdioServerParameters, stdio_client
+
+    params = StdioServerParameters(command=sys.executable, args=[SERVER_SCRIPT], env=BENCH_ENV)
+    started = time.perf_counter()
+    async with stdio_client(params) as (read_stream, write_stream):
+        async with ClientSession(read_stream, write_stream) as session:
+            await session.initialize()
+            initialized = time.perf_counter()
+            tools = await session.list_tools()
+            listed = time.perf_counter()
+    return {
+        "initialize_seconds": initialized - started,
+        "list_tools_seconds": listed - started,
+        "tools": len(tools.tools)
+    }
+
+
+def describe(label, samples):
+    """Print median/min/max for a list of timings in seconds."""
+    print(f"  {label:<32} median {statistics.median(samples) * 1000:7.1f} ms"
+          f"   min {min(samples) * 1000:7.1f} ms   max {max(samples) * 1000:7.1f} ms")
+
+
+def main():
+    runs = 5
+    if "--runs" in sys.argv:
+        runs = int(sys.argv[sys.argv.index("--runs") + 1])
+
+    print("=" * 70)
+    print(f"  MCP SERVER STARTUP BENCHMARK ({runs} runs)")
+    print("=" * 70)
+
+    probes = [run_import_probe() for _ in range(runs)]
+    describe("import module", [p["import_seconds"] for p in probes])
+    describe("import + list_tools", [p["list_tools_seconds"] for p in probes])
+    print(f"  tools listed: {probes[0]['tools']}   spotipy imported: {probes[0]['spotipy_imported']}")
+
+    handshakes = [asyncio.run(run_handshake()) for _ in range(runs)]
+    describe("stdio spawn + initialize", [h["initialize_seconds"] for h in handshakes])
+    describe("stdio spawn + list_tools", [h["list_tools_seconds"] for h in handshakes])
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
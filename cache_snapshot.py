@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Cache Snapshots - Move the server's caches between machines in one file
+
+A snapshot is a versioned binary container of named sections:
+
+    b"MUSICSNAP" | version (u16) | header length (u32) | header (JSON) | sections
+
+The header lists every section's name, row count and compressed size, so a
+reader can skip the sections it doesn't want. Each section is a dict of
+columns (one list per field, rows aligned by position), JSON-encoded and
+zlib-compressed. Columns of similar values (IDs, feature numbers, names)
+compress much better than the same data as one object per row.
+"""
+
+import os
+import gc
+import json
+import time
+import zlib
+import struct
+
+SNAPSHOT_MAGIC = b"MUSICSNAP"
+SNAPSHOT_VERSION = 1
+_PREAMBLE = struct.Struct("<HI")
+
+
+def to_columns(records: list, keys) -> dict:
+    """{key: [record[key], ...]} for dict records that all have the same keys."""
+    return {key: [record.get(key) for record in records] for key in keys}
+
+
+def from_columns(columns: dict) -> list:
+    """Rows of a to_columns() dict, back as dicts."""
+    keys = list(columns)
+    return [dict(zip(keys, values)) for values in zip(*columns.values())]
+
+
+def write_snapshot(path: str, sections: dict, meta: dict = None) -> dict:
+    """Write {name: columns} sections to path (atomically); returns the header."""
+    blobs = []
+    header = {"created": time.time(), **(meta or {}), "sections": []}
+    for name, columns in sections.items():
+        blob = zlib.compress(json.dumps(columns, ensure_ascii=False).encode("utf-8"), 6)
+        rows = next((len(column) for column in columns.values() if isinstance(column, list)), 0)
+        header["sections"].append({"name": name, "rows": rows, "bytes": len(blob)})
+        blobs.append(blob)
+
+    encoded_header = json.dumps(header).encode("utf-8")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(_PREAMBLE.pack(SNAPSHOT_VERSION, len(encoded_header)))
+        f.write(encoded_header)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_path, path)
+    return header
+
+
+def read_snapshot(path: str, names=None) -> tuple[dict, dict]:
+    """Read a snapshot; returns (header, {name: columns}).
+
+    Only the named sections are decompressed (all of them if names is None).
+    """
+    with open(path, "rb") as f:
+        if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a cache snapshot")
+        version, header_length = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {version} (expected {SNAPSHOT_VERSION})")
+        header = json.loads(f.read(header_length))
+
+        sections = {}
+        # Decoding creates millions of small objects and none of them can be
+        # garbage yet; collections triggered meanwhile would double the time
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for section in header["sections"]:
+                if names is not None and section["name"] not in names:
+                    f.seek(section["bytes"], os.SEEK_CUR)
+                    continue
+                sections[section["name"]] = json.loads(zlib.decompress(f.read(section["bytes"])))
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+    return header, sections
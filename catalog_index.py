@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Local Catalog Index - Resolve song names without a Spotify search
+
+Every track the server resolves through Spotify is added here. Later lookups
+for the same song (even with small spelling/formatting differences, e.g.
+"Sweater Weather (Remastered)" vs "sweater weather") are answered locally
+from a trigram index over normalized title and artist names.
+
+Tracks are kept as TrackRecords (track_record.py), not raw payloads. Tracks
+that only came from the user's own data (saved library, top tracks, IDs from
+their files) are marked private, and export_columns() can leave them out
+along with the aliases, which hold the user's raw queries.
+
+Lookup order:
+    1. Alias   - the exact normalized query was resolved before
+    2. Exact   - normalized title + artist match a known track
+    3. Fuzzy   - trigram similarity above the confidence threshold
+                 (only when an artist is given; a bare title is too ambiguous),
+                 with the same numbers and version markers as the query
+    4. Miss    - the caller falls back to Spotify search and add()s the result
+"""
+
+import os
+import re
+import gc
+import gzip
+import math
+import json
+import time
+import threading
+import unicodedata
+
+from track_record import TrackRecord, from_track_columns, to_track_columns
+
+# Saved indexes (and snapshot sections) hold the tracks as columns of their
+# record fields, with their normalized names so loading skips normalize()
+INDEX_VERSION = 1
+
+# Drops "(feat. X)", "[Remastered 2011]", "- 2011 Remaster" style decorations.
+# Version markers ("- Live", "(Remix)", "(Taylor's Version)") are kept: they
+# name a different recording than the bare title
+_DECORATION_RE = re.compile(
+    r"\s*[\(\[]\s*(feat\.?|ft\.?|featuring|with)\s[^\)\]]*[\)\]]"
+    r"|\s*[\(\[][^\)\]]*(remaster|mono|stereo)[^\)\]]*[\)\]]"
+    r"|\s+-\s+[^-]*(remaster|mono|stereo)[^-]*$",
+    re.IGNORECASE
+)
+_NON_WORD_RE = re.compile(r"[^\w]+")
+
+# Words that tell versions of a song apart; a fuzzy match must agree on them
+_VERSION_WORDS = frozenset((
+    "live", "remix", "mix", "version", "edit", "acoustic", "demo", "instrumental",
+    "karaoke", "unplugged", "cover", "reprise", "extended"
+))
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents, decorations and punctuation."""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    stripped = _DECORATION_RE.sub("", text)
+    # A title that is *only* a decoration keeps its text
+    text = stripped if stripped.strip() else text
+    return " ".join(_NON_WORD_RE.sub(" ", text.casefold()).split())
+
+
+def distinguishing_tokens(text: str) -> frozenset:
+    """Numbers and version markers in a normalized string ("symphony no 7",
+    "hello live"), which similar-looking titles must share to be one song."""
+    return frozenset(
+        token for token in text.split()
+        if token in _VERSION_WORDS or any(c.isdigit() for c in token)
+    )
+
+
+def trigrams(text: str) -> set:
+    """Character trigrams of a normalized string, padded at word edges."""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a: set, b: set) -> float:
+    """Dice coefficient between two trigram sets."""
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+class CatalogIndex:
+    """In-memory trigram index of resolved tracks with match statistics."""
+
+    def __init__(self, threshold: float = 0.85, max_candidates: int = 50):
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        self._tracks = {}       # track id -> TrackRecord
+        self._titles = {}       # track id -> (normalized title, title trigrams)
+        self._artists = {}      # track id -> [(normalized artist, trigrams), ...]
+        self._exact = {}        # (title, artist) -> track id
+        self._aliases = {}      # normalized query -> track id
+        self._postings = {}     # title trigram -> set of track ids
+        self._pending = {}      # track id -> (title, artists) loaded but not yet trigram-indexed
+        self._private = set()   # track ids only seen in the user's own data, never in a search
+        self._lock = threading.RLock()
+        self._dirty = 0
+        self.stats = {
+            "lookups": 0,
+            "alias_hits": 0,
+            "exact_hits": 0,
+            "fuzzy_hits": 0,
+            "misses": 0,
+            "lookup_seconds": 0.0
+        }
+
+    def __len__(self):
+        return len(self._tracks)
+
+    @staticmethod
+    def query_key(song_name: str, artist_name: str = "") -> str:
+        return f"{normalize(song_name)}|{normalize(artist_name)}"
+
+    def add(self, track, song_name: str = None, artist_name: str = "",
+            private: bool = False) -> TrackRecord | None:
+        """Index a resolved track (payload or record), plus the query that found it.
+
+        private marks a track that came from the user's own data rather than
+        a search. Returns the stored record (None for a track without an ID).
+        """
+        track_id = track.get("id")
+        if not track_id:
+            return None
+        track = TrackRecord.from_spotify(track)
+        with self._lock:
+            if track_id not in self._tracks:
+                title = normalize(track.name)
+                artists = [normalize(a.name) for a in track.artists]
+                self._index(track_id, title, artists)
+                for artist in artists:
+                    self._exact.setdefault((title, artist), track_id)
+                if private:
+                    self._private.add(track_id)
+            elif not private:
+                self._private.discard(track_id)
+            self._tracks[track_id] = track
+            if song_name is not None:
+                self._aliases[self.query_key(song_name, artist_name)] = track_id
+            self._dirty += 1
+        return track
+
+    def _index(self, track_id: str, title: str, artists: list):
+        title_grams = trigrams(title)
+        self._titles[track_id] = (title, title_grams)
+        self._artists[track_id] = [(a, trigrams(a)) for a in artists]
+        for gram in title_grams:
+            self._postings.setdefault(gram, set()).add(track_id)
+
+    def _index_pending(self):
+        """Build the trigram index of bulk-loaded tracks (first fuzzy lookup)."""
+        for track_id, (title, artists) in self._pending.items():
+            self._index(track_id, title, artists)
+        self._pending.clear()
+
+    def get(self, track_id: str) -> TrackRecord | None:
+        """An indexed track by Spotify ID."""
+        with self._lock:
+            return self._tracks.get(track_id)
+
+    def is_private(self, track_id: str) -> bool:
+        """Whether a track was only seen in the user's own data."""
+        with self._lock:
+            return track_id in self._private
+
+    def lookup(self, song_name: str, artist_name: str = ""):
+        """Return (track, match_type, score) or (None, "miss", best_score)."""
+        started = time.perf_counter()
+        with self._lock:
+            track, match, score = self._lookup(song_name, artist_name)
+            self.stats["lookups"] += 1
+            self.stats[f"{match}_hits" if track else "misses"] += 1
+            self.stats["lookup_seconds"] += time.perf_counter() - started
+        return track, match, score
+
+    def _lookup(self, song_name: str, artist_name: str):
+        track_id = self._aliases.get(self.query_key(song_name, artist_name))
+        if track_id:
+            return self._tracks[track_id], "alias", 1.0
+
+        title = normalize(song_name)
+        artist = normalize(artist_name)
+        if not artist:
+            # Without an artist, Spotify search picks the most popular match;
+            # a local guess could silently pick a different song.
+            return None, "miss", 0.0
+
+        track_id = self._exact.get((title, artist))
+        if track_id:
+            return self._tracks[track_id], "exact", 1.0
+
+        if self._pending:
+            self._index_pending()
+        title_grams = trigrams(title)
+        title_tokens = distinguishing_tokens(title)
+        artist_grams = trigrams(artist)
+
+        # Prefix filtering: a title similar enough to pass the threshold
+        # shares at least min_shared of the query's grams, so it appears in
+        # one of the rarest len - min_shared + 1 of them. Common grams like
+        # " th" would otherwise touch most of the index on every lookup.
+        min_title = max(0.0, (self.threshold - 0.4) / 0.6)
+        min_shared = len(title_grams) * min_title / (2 - min_title)
+        grams = sorted(title_grams, key=lambda g: len(self._postings.get(g, ())))
+        counts = {}
+        for gram in grams[:len(grams) - math.ceil(min_shared) + 1]:
+            for candidate in self._postings.get(gram, ()):
+                counts[candidate] = counts.get(candidate, 0) + 1
+        candidates = sorted(counts, key=counts.get, reverse=True)[:self.max_candidates]
+
+        best_id, best_score = None, 0.0
+        for candidate in candidates:
+            candidate_title, candidate_grams = self._titles[candidate]
+            # "Symphony No. 7" is not "Symphony No. 5", however alike they look
+            if distinguishing_tokens(candidate_title) != title_tokens:
+                continue
+            title_score = similarity(title_grams, candidate_grams)
+            artist_score = max(
+                (similarity(artist_grams, grams) for _, grams in self._artists[candidate]),
+                default=0.0
+            )
+            score = 0.6 * title_score + 0.4 * artist_score
+            if score > best_score:
+                best_id, best_score = candidate, score
+
+        # Not saved as an alias: a guess shouldn't outlive the tracks it was
+        # made against (a closer track may be added later)
+        if best_id and best_score >= self.threshold:
+            return self._tracks[best_id], "fuzzy", round(best_score, 3)
+        return None, "miss", round(best_score, 3)
+
+    def report(self) -> dict:
+        """Match statistics for the stats resource."""
+        with self._lock:
+            stats = dict(self.stats)
+            lookups = stats["lookups"]
+            hits = stats["alias_hits"] + stats["exact_hits"] + stats["fuzzy_hits"]
+            stats["local_hit_rate"] = round(hits / lookups, 3) if lookups else 0
+            lookup_seconds = stats.pop("lookup_seconds")
+            stats["avg_lookup_microseconds"] = round(lookup_seconds / lookups * 1e6, 1) if lookups else 0
+            stats["indexed_tracks"] = len(self._tracks)
+            stats["pending_trigram_index"] = len(self._pending)
+            stats["private_tracks"] = len(self._private)
+            stats["aliases"] = len(self._aliases)
+            stats["threshold"] = self.threshold
+        return stats
+
+    def export_columns(self, include_private: bool = True) -> dict:
+        """Tracks, their normalized names and the aliases as aligned columns.
+
+        Without include_private, only tracks found by searches are exported,
+        and no aliases.
+        """
+        with self._lock:
+            ids = [
+                track_id for track_id in self._tracks
+                if include_private or track_id not in self._private
+            ]
+            position = {track_id: i for i, track_id in enumerate(ids)}
+            names = [
+                self._pending[track_id] if track_id in self._pending else
+                (self._titles[track_id][0], [a for a, _ in self._artists[track_id]])
+                for track_id in ids
+            ]
+            aliases = [(key, position[track_id]) for key, track_id in self._aliases.items()] if include_private else []
+            return {
+                "tracks": to_track_columns([self._tracks[track_id] for track_id in ids]),
+                "titles": [title for title, _ in names],
+                "artists": [artists for _, artists in names],
+                "alias_keys": [key for key, _ in aliases],
+                "alias_tracks": [index for _, index in aliases],
+                "private_tracks": [i for i, track_id in enumerate(ids) if track_id in self._private]
+            }
+
+    def import_columns(self, columns: dict) -> int:
+        """Bulk-load what export_columns() returned; returns tracks added.
+
+        Alias and exact lookups work right away; the trigram index for fuzzy
+        lookups is built on the first fuzzy lookup.
+        """
+        # Building records allocates a few objects per track and none of them
+        # can be garbage yet; collections triggered meanwhile are wasted
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            tracks = from_track_columns(columns["tracks"])
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        ids = [track.id for track in tracks]
+        private = {ids[index] for index in columns["private_tracks"]}
+        added = 0
+        with self._lock:
+            for track_id, track, title, artists in zip(ids, tracks, columns["titles"], columns["artists"]):
+                if track_id in self._tracks:
+                    if track_id not in private:
+                        self._private.discard(track_id)
+                    continue
+                if track_id in private:
+                    self._private.add(track_id)
+                self._tracks[track_id] = track
+                self._pending[track_id] = (title, artists)
+                for artist in artists:
+                    self._exact.setdefault((title, artist), track_id)
+                added += 1
+            for key, index in zip(columns["alias_keys"], columns["alias_tracks"]):
+                self._aliases.setdefault(key, ids[index])
+            self._dirty += added
+        return added
+
+    def save(self, path: str):
+        """Write the index to a gzipped JSON file (atomically)."""
+        with self._lock:
+            data = {"version": INDEX_VERSION, **self.export_columns()}
+            self._dirty = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            # One dumps() call uses the C encoder; dump() streams through Python
+            f.write(json.dumps(data, ensure_ascii=False))
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> int:
+        """Load a saved index; returns the number of tracks loaded."""
+        if not os.path.exists(path):
+            return 0
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_VERSION:
+            return 0
+        loaded = self.import_columns(data)
+        with self._lock:
+            self._dirty = 0
+        return loaded
+
+    @property
+    def dirty(self) -> int:
+        """Number of additions since the last save/load."""
+        return self._dirty
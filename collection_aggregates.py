@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Collection Aggregates - Re-analyze a growing song list by its changes only
+
+A collection (e.g. an RSVP list that grows by a few songs a day) is kept as
+a multiset of rows plus, for each distinct row, what it contributed to the
+analyses: the resolved track, its artists and their genres. The aggregates
+(artist and genre counts, popularity/year histograms, explicit count) are
+plain counters, so they can be updated by adding or subtracting a row's
+contribution, or merged with another collection's aggregates.
+
+When a new version of the list arrives, diff() returns the rows that were
+added and removed; only those are resolved and applied. Rows that were not
+found record when they were checked, so stale_not_found() can hand them
+back to be resolved again later.
+"""
+
+import os
+import gzip
+import json
+from collections import Counter
+
+AGGREGATES_VERSION = 1
+
+
+def _bump(counter: Counter, key, times: int):
+    """Adjust a count, dropping it at zero so len() and min()/max() stay right."""
+    counter[key] += times
+    if counter[key] <= 0:
+        del counter[key]
+
+
+class CollectionAggregates:
+    """Mergeable aggregates over the resolved songs of one collection."""
+
+    def __init__(self, collection_id: str = None):
+        self.collection_id = collection_id
+        self.rows = Counter()           # row key -> times it appears in the list
+        self.contributions = {}         # row key -> {"query", "track"} (track None if not found,
+                                        # with "checked": when, in epoch seconds)
+        self.songs = 0                  # found songs, counting repeats
+        self.not_found = 0
+        self.explicit = 0
+        self.artists = Counter()        # artist name -> appearances
+        self.genres = Counter()         # genre -> appearances (once per artist per song)
+        self.popularity = Counter()     # popularity -> songs
+        self.years = Counter()          # release year -> songs
+
+    def __len__(self):
+        return sum(self.rows.values())
+
+    def diff(self, rows: Counter) -> tuple[Counter, Counter]:
+        """Rows to add and to remove to turn this collection into `rows`."""
+        return rows - self.rows, self.rows - rows
+
+    def apply(self, contribution: dict, times: int = 1):
+        """Add a row's contribution `times` times (negative to remove it)."""
+        track = contribution["track"]
+        if track is None:
+            self.not_found += times
+            return
+        self.songs += times
+        if track["explicit"]:
+            self.explicit += times
+        _bump(self.popularity, track["popularity"], times)
+        if track["year"] is not None:
+            _bump(self.years, track["year"], times)
+        for artist, genres in zip(track["artists"], track["artist_genres"] or [[]] * len(track["artists"])):
+            _bump(self.artists, artist, times)
+            for genre in genres:
+                _bump(self.genres, genre, times)
+
+    def add_row(self, key: str, contribution: dict, times: int = 1):
+        if key in self.contributions:
+            self.replace_contribution(key, contribution)
+        self.rows[key] += times
+        self.contributions[key] = contribution
+        self.apply(contribution, times)
+
+    def replace_contribution(self, key: str, contribution: dict):
+        """Swap a row's contribution (resolved again) for every copy of it."""
+        times = self.rows[key]
+        self.apply(self.contributions[key], -times)
+        self.contributions[key] = contribution
+        self.apply(contribution, times)
+
+    def stale_not_found(self, checked_before: float) -> list:
+        """Keys of not-found rows last checked before the given time
+        (or at an unknown time)."""
+        return [
+            key for key, contribution in self.contributions.items()
+            if contribution["track"] is None and contribution.get("checked", 0) < checked_before
+        ]
+
+    def remove_row(self, key: str, times: int = 1):
+        contribution = self.contributions[key]
+        self.apply(contribution, -times)
+        self.rows[key] -= times
+        if self.rows[key] <= 0:
+            del self.rows[key]
+            del self.contributions[key]
+
+    def merge(self, other: "CollectionAggregates"):
+        """Fold another collection's rows and aggregates into this one."""
+        for key, times in other.rows.items():
+            self.add_row(key, other.contributions[key], times)
+
+    def to_dict(self) -> dict:
+        return {
+            "version": AGGREGATES_VERSION,
+            "collection_id": self.collection_id,
+            "rows": dict(self.rows),
+            "contributions": self.contributions
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CollectionAggregates":
+        aggregates = cls(data.get("collection_id"))
+        for key, times in data["rows"].items():
+            aggregates.add_row(key, data["contributions"][key], times)
+        return aggregates
+
+    def save(self, path: str):
+        """Write the collection to a gzipped JSON file (atomically)."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps(self.to_dict(), ensure_ascii=False))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, collection_id: str = None) -> "CollectionAggregates":
+        """Load a saved collection, or return an empty one."""
+        if os.path.exists(path):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == AGGREGATES_VERSION and data.get("collection_id") == collection_id:
+                return cls.from_dict(data)
+        return cls(collection_id)
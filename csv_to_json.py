@@ -5,11 +5,24 @@ Simple CSV to JSON converter for MCP tools
 Usage:
     python csv_to_json.py song_list.csv
     python csv_to_json.py song_list.csv --output my_songs.json
+
+Streaming mode (constant memory, for large exports):
+    python csv_to_json.py history.csv --ndjson songs.ndjson
+    python csv_to_json.py history.csv --chunks out_dir
+    python csv_to_json.py history.csv --chunks out_dir --chunk-bytes 500000
 """
 
 import csv
 import json
+import os
 import sys
+import time
+import unicodedata
+
+# Keep each chunk file comfortably below what an MCP client will accept as
+# tool arguments in one go
+DEFAULT_CHUNK_BYTES = 1_000_000
+
 
 def csv_to_json(csv_file, output_file=None):
     """Convert CSV to JSON format for MCP tools."""
@@ -44,15 +57,170 @@ def csv_to_json(csv_file, output_file=None):
 
     return output
 
+
+def clean_field(value):
+    """Normalize a CSV field: NFC unicode, trimmed, single spaces."""
+    if value is None:
+        return ""
+    return " ".join(unicodedata.normalize("NFC", value).split())
+
+
+class RowStats:
+    """Counts and timing for a streaming conversion."""
+
+    def __init__(self):
+        self.rows = 0
+        self.valid = 0
+        self.skipped = 0
+        self.started = time.perf_counter()
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds > 0 else 0
+
+    def summary(self):
+        return (f"{self.valid} songs written, {self.skipped} rows skipped, "
+                f"{self.rows} rows in {self.seconds:.2f}s "
+                f"({self.rows_per_second:,.0f} rows/sec)")
+
+
+def iter_songs(path, stats=None):
+    """Lazily yield validated {song_name, artist_name} dicts from a file.
+
+    Reads CSV (song_name/artist_name columns) or NDJSON (one song object per
+    line, .ndjson/.jsonl). Rows without a song name are skipped and counted.
+    An optional uri (Spotify track URI or ID) is passed through.
+    """
+    stats = stats if stats is not None else RowStats()
+    is_ndjson = path.endswith((".ndjson", ".jsonl"))
+
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        rows = (json.loads(line) for line in f if line.strip()) if is_ndjson else csv.DictReader(f)
+        for row in rows:
+            stats.rows += 1
+            song_name = clean_field(row.get("song_name"))
+            if not song_name:
+                stats.skipped += 1
+                continue
+            stats.valid += 1
+            song = {
+                "song_name": song_name,
+                "artist_name": clean_field(row.get("artist_name"))
+            }
+            uri = clean_field(row.get("uri"))
+            if uri:
+                song["uri"] = uri
+            yield song
+
+
+def write_ndjson(songs, output_file):
+    """Write songs one JSON object per line."""
+    with open(output_file, 'w', encoding='utf-8') as f:
+        for song in songs:
+            f.write(json.dumps(song, ensure_ascii=False))
+            f.write("\n")
+
+
+def write_chunks(songs, output_dir, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """Write {"songs": [...]} files, each at most chunk_bytes, one song at a time.
+
+    A song too big for a chunk of its own is still written, alone in its
+    chunk. Returns (files written, those of them over chunk_bytes).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    header, footer, separator = b'{"songs": [', b']}', b', '
+    files = []
+    oversized = []
+    f = None
+    size = 0
+
+    for song in songs:
+        item = json.dumps(song, ensure_ascii=False).encode("utf-8")
+        if f is not None and size + len(separator) + len(item) + len(footer) > chunk_bytes:
+            f.write(footer)
+            f.close()
+            f = None
+        if f is None:
+            path = os.path.join(output_dir, f"songs_{len(files) + 1:05d}.json")
+            files.append(path)
+            if len(header) + len(item) + len(footer) > chunk_bytes:
+                oversized.append(path)
+            f = open(path, 'wb')
+            f.write(header)
+            size = len(header)
+        else:
+            f.write(separator)
+            size += len(separator)
+        f.write(item)
+        size += len(item)
+
+    if f is not None:
+        f.write(footer)
+        f.close()
+    return files, oversized
+
+
+def flag_value(argv, name, default=None):
+    """Return the value following a --flag in argv.
+
+    Raises ValueError if the flag has no value after it.
+    """
+    if name not in argv:
+        return default
+    position = argv.index(name) + 1
+    if position >= len(argv) or argv[position].startswith("--"):
+        raise ValueError(f"{name} needs a value")
+    return argv[position]
+
+
+def parse_args(argv):
+    """Validate the command line; returns (input file, {option: value}).
+
+    Raises ValueError with a message for the user.
+    """
+    if len(argv) < 2 or argv[1].startswith("--"):
+        raise ValueError("No input file given")
+    options = {name: flag_value(argv, name) for name in ("--output", "--ndjson", "--chunks", "--chunk-bytes")}
+    if options["--ndjson"] and options["--chunks"]:
+        raise ValueError("Use either --ndjson or --chunks, not both")
+    if options["--chunk-bytes"] is not None:
+        if not options["--chunks"]:
+            raise ValueError("--chunk-bytes only applies to --chunks")
+        if not options["--chunk-bytes"].isdigit() or int(options["--chunk-bytes"]) <= 0:
+            raise ValueError(f"--chunk-bytes must be a positive number of bytes, not {options['--chunk-bytes']!r}")
+    return argv[1], options
+
+
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
+    try:
+        csv_file, options = parse_args(sys.argv)
+    except ValueError as e:
+        if len(sys.argv) >= 2:
+            print(f"[ERROR] {e}")
         print("Usage: python csv_to_json.py <input.csv> [--output <output.json>]")
+        print("       python csv_to_json.py <input.csv> --ndjson <output.ndjson>")
+        print("       python csv_to_json.py <input.csv> --chunks <output_dir> [--chunk-bytes N]")
         sys.exit(1)
 
-    csv_file = sys.argv[1]
-    output_file = None
-
-    if "--output" in sys.argv:
-        output_file = sys.argv[sys.argv.index("--output") + 1]
+    ndjson_file = options["--ndjson"]
+    chunks_dir = options["--chunks"]
 
-    csv_to_json(csv_file, output_file)
+    if ndjson_file or chunks_dir:
+        stats = RowStats()
+        songs = iter_songs(csv_file, stats)
+        if ndjson_file:
+            write_ndjson(songs, ndjson_file)
+            print(f"[OK] Saved to {ndjson_file}")
+        else:
+            chunk_bytes = int(options["--chunk-bytes"] or DEFAULT_CHUNK_BYTES)
+            files, oversized = write_chunks(songs, chunks_dir, chunk_bytes)
+            print(f"[OK] Saved {len(files)} chunk file(s) of at most {chunk_bytes:,} bytes to {chunks_dir}")
+            for path in oversized:
+                print(f"[WARNING] {path} holds a single song larger than {chunk_bytes:,} bytes")
+        print(f"[OK] {stats.summary()}")
+    else:
+        csv_to_json(csv_file, options["--output"])
@@ -13,15 +13,26 @@ WHAT CHANGED IN 2025:
 """
 
 import os
+import io
+import sys
+import gzip
+import hashlib
+import asyncio
+import contextvars
+import itertools
 import json
+import time
+import cProfile
+import atexit
+import pstats
 import logging
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Sequence
 from datetime import datetime
 from dotenv import load_dotenv
 
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
-
 # Load environment variables from .env file
 load_dotenv()
 from mcp.server import Server
@@ -36,25 +47,398 @@ from mcp.types import (
 from pydantic import AnyUrl
 import mcp.server.stdio
 
+from catalog_index import INDEX_VERSION, CatalogIndex
+from collection_aggregates import AGGREGATES_VERSION, CollectionAggregates
+from cache_snapshot import from_columns, read_snapshot, to_columns, write_snapshot
+from similarity_index import SimilarityIndex
+from streaming_sketches import HeavyHitters, HyperLogLog
+from csv_to_json import iter_songs, write_ndjson
+from streaming_history import DEFAULT_MIN_MS_PLAYED, ImportStats, aggregate_plays, by_plays
+from response_budget import encode_response
+from track_record import TrackRecord, track_records
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("music-server")
 
 # Initialize Spotify client
-def get_spotify_client():
-    """Initialize and return authenticated Spotify client."""
+def get_spotify_client(account: str | None = None):
+    """Initialize and return authenticated Spotify client.
+
+    Each named account gets its own OAuth token cache (.cache-<account>); the
+    default account keeps spotipy's usual .cache file.
+    """
+    # spotipy pulls in requests/urllib3, so import it only when a client is needed
+    import spotipy
+    from spotipy.oauth2 import SpotifyOAuth
+
     scope = "user-library-read user-top-read playlist-read-private playlist-modify-public playlist-modify-private"
     
-    return spotipy.Spotify(auth_manager=SpotifyOAuth(
+    token_manager = TokenManager(SpotifyOAuth(
         client_id=os.environ["SPOTIFY_CLIENT_ID"],
         client_secret=os.environ["SPOTIFY_CLIENT_SECRET"],
         redirect_uri="http://127.0.0.1:8888/callback",
-        scope=scope
-    ))
+        scope=scope,
+        cache_path=f".cache-{account}" if account else None
+    ), account)
+    token_refresher.watch(token_manager)
+    return spotipy.Spotify(auth_manager=token_manager)
+
+
+class TokenManager:
+    """Auth manager handed to spotipy that keeps the access token in memory.
+
+    Tool calls read the in-memory token without touching the cache file. When
+    it is about to expire, one thread refreshes it while the others wait and
+    reuse the result. TokenRefresher calls refresh_if_due() in the background
+    so that normally no tool call waits on the token endpoint.
+    """
+
+    # spotipy's own threshold for treating a token as expired
+    EXPIRY_SLACK = 60
+
+    def __init__(self, oauth, account: str | None = None):
+        self.oauth = oauth
+        self.account = account
+        self.background_refreshes = 0
+        self.inline_refreshes = 0
+        self.failed_refreshes = 0
+        self._token = None
+        self._lock = threading.Lock()
+
+    def _seconds_left(self) -> float:
+        return self._token["expires_at"] - time.time() if self._token else 0
+
+    def get_access_token(self, as_dict: bool = False):
+        if self._seconds_left() <= self.EXPIRY_SLACK:
+            with self._lock:
+                if self._seconds_left() <= self.EXPIRY_SLACK:
+                    # First use (may run the login flow) or a missed refresh
+                    self.inline_refreshes += 1
+                    self.oauth.get_access_token(as_dict=False)
+                    self._token = self.oauth.cache_handler.get_cached_token()
+        return self._token if as_dict else self._token["access_token"]
+
+    def refresh_if_due(self, margin: float):
+        """Refresh the token if it expires within margin seconds."""
+        if self._token is None or self._seconds_left() > margin:
+            return
+        with self._lock:
+            if self._seconds_left() > margin:
+                return
+            try:
+                self._token = self.oauth.refresh_access_token(self._token["refresh_token"])
+                self.background_refreshes += 1
+            except Exception as e:
+                # The next tool call falls back to an inline refresh
+                self.failed_refreshes += 1
+                logger.warning(f"Background token refresh failed ({self.account or 'default'}): {e}")
+
+    def stats(self) -> dict:
+        return {
+            "expires_in_seconds": round(self._seconds_left()) if self._token else None,
+            "background_refreshes": self.background_refreshes,
+            "inline_refreshes": self.inline_refreshes,
+            "failed_refreshes": self.failed_refreshes
+        }
+
+
+class TokenRefresher:
+    """Daemon thread that refreshes every watched account's token ahead of expiry.
+
+    Started by the first watch(), so importing the server or listing tools
+    doesn't spawn it.
+    """
+
+    def __init__(self, margin: float, interval: float):
+        self.margin = margin
+        self.interval = interval
+        self._managers = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self, manager: TokenManager):
+        with self._lock:
+            self._managers.append(manager)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="spotify-token-refresher", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            for manager in list(self._managers):
+                manager.refresh_if_due(self.margin)
+
+    def stats(self) -> dict:
+        return {
+            manager.account or "default": manager.stats()
+            for manager in list(self._managers)
+        }
+
+
+class RateBudget:
+    """Thread-safe token bucket shared by every Spotify API call.
+
+    Concurrent tools, batch workers and parallel analyses all draw from the
+    same budget, so adding concurrency can't push the server into 429s.
+
+    Low-priority calls (cache warm-up) only take a token while no
+    interactive call is waiting and more than `reserve` tokens are left, so
+    an interactive call always finds a token ready.
+    """
+
+    # How often a low-priority caller rechecks the bucket at most
+    LOW_PRIORITY_POLL = 0.05
+
+    def __init__(self, rate_per_second: float, burst: int, reserve: int | None = None):
+        self.rate = rate_per_second
+        self.burst = burst
+        self.reserve = burst // 2 if reserve is None else reserve
+        self.calls = 0
+        self.waited_seconds = 0.0
+        self.low_priority_calls = 0
+        self.low_priority_waited_seconds = 0.0
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._waiting = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, low_priority: bool = False):
+        """Block until a request may be sent."""
+        waiting = False
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if low_priority:
+                        needed = 1 + self.reserve
+                        if self._waiting == 0 and self._tokens >= needed:
+                            self._tokens -= 1
+                            self.calls += 1
+                            self.low_priority_calls += 1
+                            return
+                        wait = max((needed - self._tokens) / self.rate, self.LOW_PRIORITY_POLL)
+                        self.low_priority_waited_seconds += wait
+                    else:
+                        if self._tokens >= 1:
+                            self._tokens -= 1
+                            self.calls += 1
+                            return
+                        if not waiting:
+                            self._waiting += 1
+                            waiting = True
+                        wait = (1 - self._tokens) / self.rate
+                        self.waited_seconds += wait
+                time.sleep(wait)
+        finally:
+            if waiting:
+                with self._lock:
+                    self._waiting -= 1
+
+    def stats(self) -> dict:
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "calls": self.calls,
+            "waited_seconds": round(self.waited_seconds, 3),
+            "low_priority_reserve": self.reserve,
+            "low_priority_calls": self.low_priority_calls,
+            "low_priority_waited_seconds": round(self.low_priority_waited_seconds, 3)
+        }
+
+
+class LazySpotifyClient:
+    """Stand-in for the Spotify client that builds the real one on first use.
+
+    Importing this module (spotify_cli.py, analyze_songs.py, tests) or answering
+    list_tools never touches spotipy or OAuth; the first Spotify call does.
+    Every API method called through it first takes a token from rate_budget.
+    """
+
+    def __init__(self, factory, rate_budget: RateBudget | None = None):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+        self.rate_budget = rate_budget
+
+    @property
+    def client(self):
+        """Return the real client, creating it on first access."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    @property
+    def is_initialized(self) -> bool:
+        return self._client is not None
+
+    def __getattr__(self, attr):
+        value = getattr(self.client, attr)
+        if self.rate_budget is None or attr.startswith("_") or not callable(value):
+            return value
+
+        def rate_limited(*args, **kwargs):
+            self.rate_budget.acquire(low_priority.get())
+            return value(*args, **kwargs)
+        return rate_limited
+
+
+class SpotifyClientPool:
+    """One lazily created Spotify client per account, each with its own
+    token cache and rate budget.
+
+    Accounts must be listed up front so a tool call can't start an OAuth flow
+    for an arbitrary name; None is the server's default account.
+    """
+
+    def __init__(self, factory, accounts, rate_per_second: float, burst: int):
+        self._factory = factory
+        self.accounts = list(accounts)
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def check(self, account: str | None):
+        """Raise ValueError unless the account is configured."""
+        if account is not None and account not in self.accounts:
+            raise ValueError(
+                f"Unknown account: {account!r} (configured: {', '.join(self.accounts) or 'none'})"
+            )
+
+    def get(self, account: str | None = None) -> LazySpotifyClient:
+        """Return the account's client, creating its proxy on first use."""
+        client = self._clients.get(account)
+        if client is None:
+            self.check(account)
+            with self._lock:
+                client = self._clients.get(account)
+                if client is None:
+                    client = LazySpotifyClient(
+                        lambda: self._factory(account),
+                        RateBudget(self.rate_per_second, self.burst)
+                    )
+                    self._clients[account] = client
+        return client
+
+    def stats(self) -> dict:
+        return {
+            account or "default": {
+                "initialized": client.is_initialized,
+                **client.rate_budget.stats()
+            }
+            for account, client in list(self._clients.items())
+        }
+
+
+class CurrentAccountClient:
+    """The module-level `sp`: forwards to the pool client of the account the
+    current tool call runs as.
+
+    Handlers keep calling sp.search(...) etc.; call_tool sets current_account
+    and asyncio.to_thread carries it into the worker thread.
+    """
+
+    def __init__(self, pool: SpotifyClientPool):
+        self.pool = pool
+
+    def __getattr__(self, attr):
+        return getattr(self.pool.get(current_account.get()), attr)
+
+
+# Spotify requests per second (sustained) and burst size, per account
+SPOTIFY_RATE = float(os.environ.get("MUSIC_SERVER_SPOTIFY_RATE", "20"))
+SPOTIFY_BURST = int(os.environ.get("MUSIC_SERVER_SPOTIFY_BURST", "40"))
+
+# Extra Spotify accounts a tool call may act as via its "account" argument,
+# e.g. MUSIC_SERVER_ACCOUNTS=alice,bob. Without it every call uses the
+# default account.
+SPOTIFY_ACCOUNTS = [
+    a.strip() for a in os.environ.get("MUSIC_SERVER_ACCOUNTS", "").split(",") if a.strip()
+]
+
+# Tokens are refreshed in the background once they have less than
+# TOKEN_REFRESH_MARGIN seconds left; the refresher checks every
+# TOKEN_REFRESH_INTERVAL seconds. Spotify access tokens last an hour.
+TOKEN_REFRESH_MARGIN = float(os.environ.get("MUSIC_SERVER_TOKEN_REFRESH_MARGIN", "300"))
+TOKEN_REFRESH_INTERVAL = 30
+token_refresher = TokenRefresher(TOKEN_REFRESH_MARGIN, TOKEN_REFRESH_INTERVAL)
+
+# Account the current tool call runs as (None = default account)
+current_account = contextvars.ContextVar("current_account", default=None)
+
+# Set for background work (cache warm-up) whose Spotify calls must yield to
+# interactive tool calls
+low_priority = contextvars.ContextVar("low_priority", default=False)
+
+# Set by in-process callers (batch reports) that want whole results, whatever
+# the response byte budget
+full_responses = contextvars.ContextVar("full_responses", default=False)
 
 # Initialize MCP server
 app = Server("music-server")
-sp = get_spotify_client()
+spotify_pool = SpotifyClientPool(get_spotify_client, SPOTIFY_ACCOUNTS, SPOTIFY_RATE, SPOTIFY_BURST)
+sp = CurrentAccountClient(spotify_pool)
+
+# On-demand profiling. MUSIC_SERVER_PROFILE=1 profiles every tool call,
+# MUSIC_SERVER_PROFILE=tool_a,tool_b only the named tools. A single call can
+# opt in by passing "_profile": true in its arguments.
+PROFILE_TOOLS = {
+    t.strip() for t in os.environ.get("MUSIC_SERVER_PROFILE", "").split(",") if t.strip()
+}
+PROFILE_ALL = bool(PROFILE_TOOLS & {"1", "true", "all"})
+PROFILE_DIR = os.environ.get("MUSIC_SERVER_PROFILE_DIR", "profiles")
+PROFILE_TOP_N = int(os.environ.get("MUSIC_SERVER_PROFILE_TOP_N", "15"))
+
+# Filename fragments used to bucket profiled self-time into coarse categories
+PROFILE_CATEGORIES = {
+    "network": ("socket", "ssl", "http", "urllib3", "requests"),
+    "json": ("json",),
+}
+
+# Persistent caches live here (override with MUSIC_SERVER_CACHE_DIR)
+CACHE_DIR = os.environ.get(
+    "MUSIC_SERVER_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".music_cache")
+)
+
+# Local index of every track the server has resolved, consulted before
+# Spotify search. Loaded lazily on first use and saved at exit, and after
+# CATALOG_INDEX_SAVE_EVERY additions or a quarter of the index, whichever is
+# more (each save rewrites the whole file, so a fixed interval would make
+# indexing a huge collection quadratic).
+CATALOG_INDEX_PATH = os.path.join(CACHE_DIR, "catalog_index.json.gz")
+CATALOG_INDEX_SAVE_EVERY = 100
+catalog_index = CatalogIndex(
+    threshold=float(os.environ.get("MUSIC_SERVER_INDEX_THRESHOLD", "0.85"))
+)
+_catalog_index_loaded = False
+_catalog_index_lock = threading.Lock()
+
+# MinHash/LSH indexes of playlists and collections for "most similar"
+# queries, one per account (what an account indexed is its own). Each is
+# loaded on first use, saved after every indexing call and at exit.
+SIMILARITY_INDEX_PATH = os.path.join(CACHE_DIR, "similarity_index.json.gz")
+_similarity_indexes = {}
+_similarity_index_lock = threading.Lock()
+
+# Per-collection aggregates for incremental re-analysis (collection_id),
+# one gzipped JSON file each; loaded states stay in memory
+COLLECTION_STATE_DIR = os.path.join(CACHE_DIR, "collections")
+_collection_states = {}
+_collection_locks = {}
+_collection_locks_lock = threading.Lock()
+
+# Query key -> Event for song searches currently in flight
+_resolving = {}
+_resolving_lock = threading.Lock()
 
 
 @app.list_resources()
@@ -78,7 +462,21 @@ async def list_resources() -> list[Resource]:
             name="Top Artists",
             mimeType="application/json",
             description="User's most listened to artists"
+        ),
+        Resource(
+            uri=AnyUrl("music://server/stats"),
+            name="Server Stats",
+            mimeType="application/json",
+            description="Catalog index match statistics and response cache hit rates"
         )
+    ] + [
+        Resource(
+            uri=AnyUrl(COLLECTION_URI_PREFIX + name),
+            name=f"Collection: {name}",
+            mimeType="application/json",
+            description="Song collection on disk - pass this URI as songs_source to any collection tool"
+        )
+        for name in list_collections()
     ]
 
 
@@ -99,1330 +497,3465 @@ async def read_resource(uri: AnyUrl) -> str:
         artists = sp.current_user_top_artists(limit=20, time_range="medium_term")
         return json.dumps(artists, indent=2)
     
+    elif uri_str == "music://server/stats":
+        return json.dumps(server_stats(), indent=2)
+    
+    elif uri_str.startswith(COLLECTION_URI_PREFIX):
+        path = collection_path(uri_str)
+        rows = 0
+        preview = []
+        for song in iter_songs(path):
+            rows += 1
+            if len(preview) < 20:
+                preview.append(song)
+        return json.dumps({"uri": uri_str, "songs": rows, "preview": preview}, indent=2)
+    
     else:
         raise ValueError(f"Unknown resource: {uri}")
 
 
-@app.list_tools()
-async def list_tools() -> list[Tool]:
-    """List available music analysis tools."""
-    return [
-        Tool(
-            name="search_tracks",
-            description="Search for tracks on Spotify by name, artist, or keywords",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "query": {
-                        "type": "string",
-                        "description": "Search query (song name, artist, keywords)"
-                    },
-                    "limit": {
-                        "type": "integer",
-                        "description": "Number of results to return (1-50)",
-                        "default": 10
-                    }
-                },
-                "required": ["query"]
-            }
-        ),
-        Tool(
-            name="get_recommendations",
-            description="Get song recommendations based on seed tracks, artists, or genres. Provide song names, artist names, or genres and get personalized recommendations.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "seed_tracks": {
-                        "type": "array",
-                        "items": {
-                            "type": "object",
-                            "properties": {
-                                "song_name": {"type": "string"},
-                                "artist_name": {"type": "string"}
-                            },
-                            "required": ["song_name"]
-                        },
-                        "description": "Up to 5 songs to base recommendations on (provide song name and optionally artist name)"
-                    },
-                    "seed_artists": {
-                        "type": "array",
-                        "items": {"type": "string"},
-                        "description": "Up to 5 artist names to base recommendations on"
-                    },
-                    "seed_genres": {
-                        "type": "array",
-                        "items": {"type": "string"},
-                        "description": "Up to 5 genre names (e.g., 'pop', 'rock', 'hip-hop', 'electronic')"
-                    },
-                    "limit": {
-                        "type": "integer",
-                        "description": "Number of recommendations (1-100)",
-                        "default": 20
-                    }
-                }
-            }
-        ),
-        Tool(
-            name="analyze_playlist",
-            description="Analyze a Spotify playlist to get insights about its musical characteristics",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "playlist_id": {
-                        "type": "string",
-                        "description": "Spotify playlist ID"
-                    }
-                },
-                "required": ["playlist_id"]
-            }
-        ),
-        Tool(
-            name="get_artist_info",
-            description="Get detailed information about an artist including genres, popularity, and top tracks",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "artist_id": {
-                        "type": "string",
-                        "description": "Spotify artist ID"
-                    }
-                },
-                "required": ["artist_id"]
-            }
-        ),
-        Tool(
-            name="analyze_explicitness",
-            description="Analyze explicit content in a collection of songs - find out how many songs have explicit lyrics",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "songs": {
-                        "type": "array",
-                        "items": {
-                            "type": "object",
-                            "properties": {
-                                "song_name": {"type": "string"},
-                                "artist_name": {"type": "string"}
-                            },
-                            "required": ["song_name"]
-                        },
-                        "description": "List of songs to check for explicit content"
-                    }
-                },
-                "required": ["songs"]
+class TTLCache:
+    """Small thread-safe LRU cache whose entries expire after a TTL.
+
+    A ttl of None keeps entries until they are evicted to make room.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float | None = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value, or default if missing or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl: float | None = None):
+        """Store a value; ttl overrides the cache default for this entry."""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def entries(self) -> list:
+        """[(key, value, seconds left or None)] for the entries not yet expired."""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                (key, value, None if expires_at is None else expires_at - now)
+                for key, (value, expires_at) in self._data.items()
+                if expires_at is None or expires_at > now
+            ]
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0
+        }
+
+
+class PersistentCache:
+    """Thread-safe cache of values that never go stale (e.g. audio features
+    by track ID), kept in a gzipped JSON file.
+
+    Loaded on first use so startup stays fast; saved every save_every new
+    entries and at exit.
+    """
+
+    def __init__(self, path: str, save_every: int = 500):
+        self.path = path
+        self.save_every = save_every
+        self.hits = 0
+        self.misses = 0
+        self._data = {}
+        self._dirty = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                if os.path.exists(self.path):
+                    with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                        self._data.update(json.load(f))
+            except Exception as e:
+                logger.warning(f"Could not load {self.path}: {e}")
+            self._loaded = True
+
+    def get_many(self, keys) -> dict:
+        """Return {key: value} for the keys that are cached."""
+        self._ensure_loaded()
+        with self._lock:
+            found = {key: self._data[key] for key in keys if key in self._data}
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def items(self) -> dict:
+        self._ensure_loaded()
+        with self._lock:
+            return dict(self._data)
+
+    def set_many(self, items: dict):
+        self._ensure_loaded()
+        with self._lock:
+            self._data.update(items)
+            self._dirty += len(items)
+            due = self._dirty >= self.save_every
+        if due:
+            self.save()
+
+    def save(self):
+        """Write the cache to disk (atomically) if anything was added."""
+        # Never overwrite the file with a cache that was not loaded from it
+        if not self._loaded or not self._dirty:
+            return
+        with self._lock:
+            data = dict(self._data)
+            self._dirty = 0
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                f.write(json.dumps(data, ensure_ascii=False))
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"Could not save {self.path}: {e}")
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0
+        }
+
+
+# Audio features of a track never change, so they are cached for good
+AUDIO_FEATURES_BATCH_SIZE = 100
+audio_features_cache = PersistentCache(os.path.join(CACHE_DIR, "audio_features.json.gz"))
+atexit.register(audio_features_cache.save)
+
+# Artist metadata and top tracks are catalog data: shared by every tool and
+# account, refreshed hourly (popularity and followers drift)
+ARTIST_CACHE_TTL = 3600
+ARTISTS_BATCH_SIZE = 50
+TRACKS_BATCH_SIZE = 50
+artist_cache = TTLCache(max_entries=20000, ttl=ARTIST_CACHE_TTL)
+top_tracks_cache = TTLCache(max_entries=5000, ttl=ARTIST_CACHE_TTL)
+artist_name_cache = TTLCache(max_entries=20000, ttl=ARTIST_CACHE_TTL)
+# Artists seen only in the user's own data (their top artists, the artists
+# of their library and top tracks), kept out of default cache snapshots
+private_artist_ids = set()
+
+# get_recommendations responses by resolved seed set; short-lived so
+# repeated "more like this" prompts are free but results don't go stale
+RECOMMENDATIONS_CACHE_TTL = 120
+recommendations_cache = TTLCache(max_entries=512, ttl=RECOMMENDATIONS_CACHE_TTL)
+
+# Formatted search_tracks results by (query, limit), shared by single and
+# multi-query calls
+search_cache = TTLCache(max_entries=4096, ttl=300)
+MAX_SEARCH_QUERIES = 50
+
+# Songs (by query key) and track IDs Spotify has no match for. Found tracks
+# stay in the catalog index for good; misses are kept for a shorter time,
+# since a song can be released or become available in the market later.
+# Until then, asking again costs no search.
+NOT_FOUND_CACHE_TTL = float(os.environ.get("MUSIC_SERVER_NOT_FOUND_TTL", "1800"))
+not_found_cache = TTLCache(max_entries=20000, ttl=NOT_FOUND_CACHE_TTL)
+
+# The calling account's top items and saved library by (account, kind, ...),
+# shared by the taste tools and cache warm-up. Short-lived: they change as
+# the user listens and saves.
+USER_DATA_CACHE_TTL = 300
+SAVED_TRACKS_PAGE_SIZE = 50
+user_data_cache = TTLCache(max_entries=256, ttl=USER_DATA_CACHE_TTL)
+
+# Worker threads for independent Spotify calls inside one tool call; the
+# rate budget still bounds the overall request rate
+FETCH_CONCURRENCY = 8
+
+# Numeric audio features averaged over a collection
+AUDIO_FEATURE_KEYS = (
+    "danceability", "energy", "valence", "acousticness", "instrumentalness",
+    "speechiness", "liveness", "tempo", "loudness"
+)
+# What audio_features_cache keeps per track
+AUDIO_FEATURE_CACHE_KEYS = AUDIO_FEATURE_KEYS + ("key", "mode", "time_signature", "duration_ms")
+
+
+def reads_songs_source(arguments: dict) -> bool:
+    """Whether a call reads songs from a file, directly or for one of its
+    collections (diff_collections' collection_a / collection_b)."""
+    return "songs_source" in arguments or any(
+        isinstance(value, dict) and "songs_source" in value for value in arguments.values()
+    )
+
+
+class ToolSpec:
+    """A registered tool: its MCP definition, handler and performance settings.
+
+    max_concurrency caps simultaneous calls of this tool, timeout (seconds)
+    bounds how long a caller waits for a result, and cache_ttl (seconds)
+    memoizes responses for identical arguments (0 disables caching).
+    user_data marks tools whose result depends on the calling account's own
+    library, so cached responses are never shared between accounts.
+    detail_sections lists the result's per-item sections (dotted paths) that
+    may be cut to fit the response byte budget, the first listed first.
+    """
+
+    def __init__(self, name: str, description: str, input_schema: dict, handler,
+                 max_concurrency: int | None = None, timeout: float | None = None,
+                 cache_ttl: float = 0, user_data: bool = False, detail_sections: tuple = ()):
+        self.name = name
+        self.handler = handler
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.user_data = user_data
+        self.detail_sections = detail_sections
+        self.truncated_responses = 0
+        if SPOTIFY_ACCOUNTS:
+            input_schema["properties"]["account"] = ACCOUNT_SCHEMA
+        if detail_sections:
+            input_schema["properties"]["max_response_bytes"] = MAX_RESPONSE_BYTES_SCHEMA
+        # Built once at registration; list_tools just hands these out
+        self.tool = Tool(name=name, description=description, inputSchema=input_schema)
+        self.semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self.response_cache = TTLCache(max_entries=256, ttl=cache_ttl) if cache_ttl else None
+
+    async def invoke(self, arguments: dict, profile: bool = False) -> list[TextContent]:
+        """Run the handler in a worker thread under this tool's limits."""
+        cache_key = None
+        # File-backed calls aren't cached: the file can change under the same
+        # path. Nor are full_responses calls, which skip the byte budget.
+        if (self.response_cache is not None and not profile and not reads_songs_source(arguments)
+                and not full_responses.get()):
+            cache_key = json.dumps(arguments, sort_keys=True, default=str)
+            if self.user_data:
+                cache_key = f"{current_account.get()}:{cache_key}"
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return [TextContent(type="text", text=cached)]
+
+        runner = _run_tool_profiled if profile else _run_tool
+        loop = asyncio.get_running_loop()
+
+        def work():
+            try:
+                return runner(self, arguments)
+            finally:
+                # Released when the handler is done, not when a timeout stops
+                # waiting for it: a timed-out handler keeps running in its
+                # thread and still counts against max_concurrency
+                if self.semaphore is not None:
+                    loop.call_soon_threadsafe(self.semaphore.release)
+
+        async def run():
+            if self.semaphore is not None:
+                await self.semaphore.acquire()
+            return await asyncio.to_thread(work)
+
+        try:
+            content, complete = await asyncio.wait_for(run(), self.timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"{self.name} did not finish within {self.timeout} seconds")
+
+        if cache_key is not None and complete:
+            self.response_cache.set(cache_key, content[0].text)
+        return content
+
+
+# Added to every tool's schema when MUSIC_SERVER_ACCOUNTS is set
+ACCOUNT_SCHEMA = {
+    "type": "string",
+    "enum": SPOTIFY_ACCOUNTS,
+    "description": "Spotify account to act as (omit for the server's default account)"
+}
+
+# Responses are cut to this many bytes (0, the default: no limit): tools drop
+# detail sections (per-song lists) in their declared order, keep the summary
+# exact and report what was left out under "truncated". A call can ask for
+# less with max_response_bytes, never for more.
+MAX_RESPONSE_BYTES = int(os.environ.get("MUSIC_SERVER_MAX_RESPONSE_BYTES", "0"))
+
+# Added to the schema of every tool with detail sections
+MAX_RESPONSE_BYTES_SCHEMA = {
+    "type": "integer",
+    "description": "Size limit for this response in bytes"
+                   + (f" (server limit: {MAX_RESPONSE_BYTES})" if MAX_RESPONSE_BYTES else "")
+                   + "; long lists are cut to fit and 'truncated' says what was left out"
+}
+
+
+def response_byte_limit(arguments: dict) -> int | None:
+    """The byte budget for one call: the smaller of the call's and the server's.
+
+    None (no budget) when neither sets one, or for full_responses callers.
+    """
+    if full_responses.get():
+        return None
+    limits = [limit for limit in (arguments.get("max_response_bytes"), MAX_RESPONSE_BYTES) if limit]
+    if any(limit < 0 for limit in limits):
+        raise ValueError("max_response_bytes must be positive")
+    return min(limits) if limits else None
+
+
+# Tool name -> ToolSpec, filled in by @register_tool below
+TOOL_REGISTRY: dict[str, ToolSpec] = {}
+
+
+def register_tool(name: str, description: str, input_schema: dict, *,
+                  max_concurrency: int | None = None, timeout: float | None = None,
+                  cache_ttl: float = 0, user_data: bool = False, detail_sections: tuple = ()):
+    """Register a tool handler.
+
+    The handler is a plain function taking the arguments dict and returning a
+    JSON-serializable result; it runs in a worker thread so blocking Spotify
+    calls don't stall the event loop.
+    """
+    def decorator(handler):
+        TOOL_REGISTRY[name] = ToolSpec(
+            name, description, input_schema, handler,
+            max_concurrency=max_concurrency, timeout=timeout, cache_ttl=cache_ttl,
+            user_data=user_data, detail_sections=detail_sections
+        )
+        return handler
+    return decorator
+
+
+# Every collection tool takes the same list of songs
+SONG_ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "song_name": {"type": "string"},
+        "artist_name": {"type": "string"},
+        "uri": {
+            "type": "string",
+            "description": "Spotify track URI or ID, if known: looked up directly instead of searched"
+        }
+    },
+    "required": ["song_name"]
+}
+
+
+def songs_schema(description: str) -> dict:
+    """Schema for a `songs` argument built on the shared SONG_ITEM_SCHEMA."""
+    return {
+        "type": "array",
+        "items": SONG_ITEM_SCHEMA,
+        "description": description
+    }
+
+
+# Per-tool limits. Collection tools make one or more Spotify calls per song.
+SEARCH_TIMEOUT = 30
+COLLECTION_TOOL_TIMEOUT = 600
+COLLECTION_TOOL_CONCURRENCY = 4
+
+# Collection tools stop resolving when their time budget runs out and return
+# what they have. The default leaves headroom to aggregate and respond before
+# the hard COLLECTION_TOOL_TIMEOUT.
+DEFAULT_TIME_BUDGET = COLLECTION_TOOL_TIMEOUT * 0.9
+# After the budget runs out, at most this many rows of a streamed source are
+# read to count what was left; beyond that the count (and coverage) is null.
+UNPROCESSED_COUNT_LIMIT = 10000
+
+# Instead of an inline songs array, collection tools can stream rows from a
+# CSV/NDJSON file: a local path or music://collections/<name>, which maps to
+# <name>.csv/.ndjson/.jsonl in COLLECTIONS_DIR.
+COLLECTION_URI_PREFIX = "music://collections/"
+COLLECTION_EXTENSIONS = (".csv", ".ndjson", ".jsonl")
+COLLECTIONS_DIR = os.environ.get(
+    "MUSIC_SERVER_COLLECTIONS_DIR", os.path.dirname(os.path.abspath(__file__))
+)
+# Collections written by import_streaming_history, also served as
+# music://collections/<name> (kept out of COLLECTIONS_DIR, which defaults to
+# the server's own folder)
+IMPORTED_COLLECTIONS_DIR = os.path.join(CACHE_DIR, "imported")
+
+SONGS_SOURCE_SCHEMA = {
+    "type": "string",
+    "description": "Instead of 'songs': a local CSV/NDJSON file path or a "
+                   "music://collections/<name> URI to stream songs from"
+}
+
+SONGS_OFFSET_SCHEMA = {
+    "type": "integer",
+    "description": "Rows of songs_source to skip (use resume_offset from a partial result)",
+    "default": 0
+}
+
+COLLECTION_ID_SCHEMA = {
+    "type": "string",
+    "description": "Name to keep this collection's aggregates under (e.g. 'october-rsvps'). "
+                   "Later calls with the same name only resolve songs added since the last call "
+                   "and subtract removed ones."
+}
+
+# Approximate mode counts a collection with fixed-memory sketches instead of
+# keeping every resolved song: Count-Min heavy hitters for the top artists and
+# genres, HyperLogLog for unique counts. error_rate is the Count-Min epsilon
+# (maximum overcount as a fraction of everything counted); the bound holds
+# with probability 1 - SKETCH_DELTA.
+DEFAULT_ERROR_RATE = 0.001
+MIN_ERROR_RATE = 0.00001
+SKETCH_DELTA = 0.01
+# Not-found songs listed in an approximate result; the rest are only counted
+SKETCH_ERROR_SAMPLES = 20
+# Format of the sketches saved for approximate mode with a collection_id
+SKETCH_STATE_VERSION = 1
+
+APPROXIMATE_SCHEMA = {
+    "type": "boolean",
+    "description": "Count in fixed memory with streaming sketches instead of keeping every song "
+                   "(for multi-million-row sources); counts are estimates reported with error bounds. "
+                   "With collection_id, the sketches are saved and each call adds the rows it reads, "
+                   "so a source can be counted over several calls (songs_offset = resume_offset).",
+    "default": False
+}
+
+ERROR_RATE_SCHEMA = {
+    "type": "number",
+    "description": "With approximate: maximum overcount of any count, as a fraction of all counted "
+                   "items (smaller is more exact and uses more memory)",
+    "default": DEFAULT_ERROR_RATE
+}
+
+TIME_BUDGET_SCHEMA = {
+    "type": "number",
+    "description": "Seconds to spend resolving songs before returning partial results "
+                   f"with a coverage fraction (default and maximum: {DEFAULT_TIME_BUDGET:g})"
+}
+
+
+class TimeBudget:
+    """Iterate over a collection's songs until a time budget runs out.
+
+    Tools loop over the budget instead of the raw list; afterwards annotate()
+    records how much of the collection was covered and which songs were
+    skipped, so a huge input still returns within a predictable latency.
+    Works for inline lists and for songs streamed from a file.
+    """
+
+    def __init__(self, songs, seconds: float | None = None, offset: int = 0):
+        self.songs = songs
+        self.seconds = min(seconds, DEFAULT_TIME_BUDGET) if seconds else DEFAULT_TIME_BUDGET
+        self.deadline = time.monotonic() + self.seconds
+        self.offset = offset
+        self.processed = 0
+        self.complete = False
+        self._iterator = iter(songs)
+        self._held = []
+
+    def __iter__(self):
+        for song_data in self._iterator:
+            if time.monotonic() >= self.deadline:
+                self._held = [song_data]
+                self._iterator = itertools.chain(self._held, self._iterator)
+                return
+            self.processed += 1
+            yield song_data
+        self.complete = True
+
+    def annotate(self, result: dict) -> dict:
+        """Add coverage (and what was left unprocessed, if any) to a tool result."""
+        if self.complete:
+            result["coverage"] = 1.0
+            return result
+
+        result["partial"] = True
+        result["time_budget_seconds"] = self.seconds
+        if isinstance(self.songs, list):
+            remaining = self.songs[self.processed:]
+            result["unprocessed_songs"] = remaining
+            unprocessed = len(remaining)
+        else:
+            # Streamed source: say where to resume instead of echoing a
+            # possibly huge list back. The rest is only counted if that is
+            # cheap; the rows are counted from under any prefetching wrapper.
+            result["resume_offset"] = self.offset + self.processed
+            rest = self.songs.unread() if isinstance(self.songs, TrackLookups) else self.songs
+            rest = itertools.chain(self._held, rest)
+            unprocessed = sum(1 for _ in itertools.islice(rest, UNPROCESSED_COUNT_LIMIT + 1))
+            if unprocessed > UNPROCESSED_COUNT_LIMIT:
+                result["unprocessed_count"] = None
+                result["coverage"] = None
+                return result
+            result["unprocessed_count"] = unprocessed
+        total = self.processed + unprocessed
+        result["coverage"] = round(self.processed / total, 3) if total else 1.0
+        return result
+
+
+def collection_path(source: str) -> str:
+    """Map a songs_source (local path or music://collections/<name>) to a file."""
+    if source.startswith(COLLECTION_URI_PREFIX):
+        name = source[len(COLLECTION_URI_PREFIX):]
+        if not name or "/" in name or "\\" in name or name.startswith("."):
+            raise ValueError(f"Invalid collection name: {name!r}")
+        # A re-import replaces what was imported under the name before
+        for directory in (IMPORTED_COLLECTIONS_DIR, COLLECTIONS_DIR):
+            for extension in COLLECTION_EXTENSIONS:
+                path = os.path.join(directory, name + extension)
+                if os.path.exists(path):
+                    return path
+        raise ValueError(f"Unknown collection: {source}")
+
+    path = os.path.expanduser(source)
+    if not path.endswith(COLLECTION_EXTENSIONS):
+        raise ValueError(f"songs_source must be a {'/'.join(COLLECTION_EXTENSIONS)} file: {source}")
+    if not os.path.exists(path):
+        raise ValueError(f"File not found: {source}")
+    return path
+
+
+def list_collections() -> list[str]:
+    """Names of the song collections available as music://collections/<name>."""
+    files = []
+    for directory in (COLLECTIONS_DIR, IMPORTED_COLLECTIONS_DIR):
+        try:
+            files.extend(os.listdir(directory))
+        except OSError:
+            pass
+    return sorted({
+        os.path.splitext(f)[0] for f in files
+        if f.endswith(COLLECTION_EXTENSIONS) and not f.startswith(".")
+    })
+
+
+def collection_songs(arguments: dict):
+    """Songs for a collection tool: the inline list, or rows streamed from disk.
+
+    Songs that carry a uri have their tracks looked up by ID, 50 per request,
+    so resolve_song() finds them without a search.
+    """
+    if arguments.get("songs") is not None:
+        songs = arguments["songs"]
+        prefetch_song_tracks(songs)
+        return songs
+    if not arguments.get("songs_source"):
+        raise ValueError("Provide either 'songs' or 'songs_source'")
+    offset = arguments.get("songs_offset", 0)
+    rows = itertools.islice(iter_songs(collection_path(arguments["songs_source"])), offset, None)
+    return TrackLookups(rows)
+
+
+def collection_budget(arguments: dict) -> TimeBudget:
+    """TimeBudget over a collection tool's songs, honoring its budget arguments."""
+    return TimeBudget(
+        collection_songs(arguments),
+        arguments.get("time_budget_seconds"),
+        offset=0 if arguments.get("songs") is not None else arguments.get("songs_offset", 0)
+    )
+
+
+def _ensure_catalog_index_loaded():
+    """Load the saved catalog index the first time it is needed."""
+    global _catalog_index_loaded
+    if _catalog_index_loaded:
+        return
+    with _catalog_index_lock:
+        if not _catalog_index_loaded:
+            try:
+                loaded = catalog_index.load(CATALOG_INDEX_PATH)
+                logger.info(f"Loaded {loaded} tracks into the catalog index")
+            except Exception as e:
+                logger.warning(f"Could not load catalog index: {e}")
+            _catalog_index_loaded = True
+
+
+def save_catalog_index():
+    """Persist the catalog index if anything was added since the last save."""
+    # Never overwrite the saved index with one that was not loaded from it
+    if _catalog_index_loaded and catalog_index.dirty:
+        try:
+            catalog_index.save(CATALOG_INDEX_PATH)
+        except Exception as e:
+            logger.warning(f"Could not save catalog index: {e}")
+
+
+def save_catalog_index_if_due():
+    """Save after enough additions; the threshold grows with the index so
+    saving stays linear overall."""
+    if catalog_index.dirty >= max(CATALOG_INDEX_SAVE_EVERY, len(catalog_index) // 4):
+        save_catalog_index()
+
+
+atexit.register(save_catalog_index)
+
+
+def song_query(song_data: dict) -> str:
+    """Spotify search query for a {song_name, artist_name} item."""
+    query = song_data["song_name"]
+    if song_data.get("artist_name"):
+        query += f" artist:{song_data['artist_name']}"
+    return query
+
+
+def resolve_song(song_data: dict) -> TrackRecord | None:
+    """Resolve a {song_name, artist_name} item to a Spotify track.
+
+    Answers from the local catalog index when it is confident and only falls
+    back to a Spotify search on a miss; returns None if Spotify has no match.
+    """
+    _ensure_catalog_index_loaded()
+    song_name = song_data["song_name"]
+    artist_name = song_data.get("artist_name") or ""
+
+    if song_data.get("uri"):
+        track_id = track_id_from(song_data["uri"])
+        track = get_tracks([track_id]).get(track_id)
+        if track is not None:
+            return track
+
+    track, _, _ = catalog_index.lookup(song_name, artist_name)
+    if track is not None:
+        return track
+
+    key = CatalogIndex.query_key(song_name, artist_name)
+    if not_found_cache.get(key):
+        return None
+
+    # Concurrent calls (batch workers, parallel tools) asking for the same
+    # song wait for the first search instead of repeating it
+    with _resolving_lock:
+        in_flight = _resolving.get(key)
+        if in_flight is None:
+            _resolving[key] = threading.Event()
+    if in_flight is not None:
+        in_flight.wait(SEARCH_TIMEOUT)
+        track, _, _ = catalog_index.lookup(song_name, artist_name)
+        if track is not None:
+            return track
+        if not_found_cache.get(key):
+            return None
+
+    try:
+        search_results = sp.search(q=song_query(song_data), type="track", limit=1)
+        tracks = search_results["tracks"]["items"]
+        if not tracks:
+            not_found_cache.set(key, True)
+            return None
+
+        track = catalog_index.add(tracks[0], song_name, artist_name)
+        save_catalog_index_if_due()
+        return track
+    finally:
+        if in_flight is None:
+            with _resolving_lock:
+                _resolving.pop(key).set()
+
+
+def get_tracks(track_ids: list) -> dict:
+    """Tracks by ID from the catalog index, fetching the rest 50 per request.
+
+    IDs Spotify doesn't know are left out.
+    """
+    _ensure_catalog_index_loaded()
+    tracks = {}
+    missing = []
+    for track_id in dict.fromkeys(track_ids):
+        track = catalog_index.get(track_id)
+        if track is not None:
+            tracks[track_id] = track
+        elif not not_found_cache.get(("id", track_id)):
+            missing.append(track_id)
+
+    for start in range(0, len(missing), TRACKS_BATCH_SIZE):
+        batch = missing[start:start + TRACKS_BATCH_SIZE]
+        for track_id, track in zip(batch, sp.tracks(batch)["tracks"]):
+            if track:
+                tracks[track["id"]] = catalog_index.add(track, private=True)
+            else:
+                not_found_cache.set(("id", track_id), True)
+    if missing:
+        save_catalog_index_if_due()
+    return tracks
+
+
+def prefetch_song_tracks(songs: list):
+    """Look up the tracks of songs that carry a uri, 50 per request."""
+    track_ids = [track_id_from(song["uri"]) for song in songs if song.get("uri")]
+    if track_ids:
+        try:
+            get_tracks(track_ids)
+        except Exception as e:
+            # resolve_song() retries each song on its own
+            logger.warning(f"Batched track lookup failed: {e}")
+
+
+class TrackLookups:
+    """Pass streamed songs through, prefetching uri tracks a batch ahead.
+
+    unread() gives the songs not passed on yet without looking any up, so
+    counting what is left doesn't cost Spotify requests.
+    """
+
+    def __init__(self, songs):
+        self._songs = iter(songs)
+        self._batch = []
+        self._next = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._next == len(self._batch):
+            self._batch = list(itertools.islice(self._songs, TRACKS_BATCH_SIZE))
+            self._next = 0
+            if not self._batch:
+                raise StopIteration
+            prefetch_song_tracks(self._batch)
+        song_data = self._batch[self._next]
+        self._next += 1
+        return song_data
+
+    def unread(self):
+        return itertools.chain(self._batch[self._next:], self._songs)
+
+
+def run_concurrently(fn, items, max_workers: int = FETCH_CONCURRENCY) -> list:
+    """Map fn over items in worker threads, keeping the caller's account."""
+    items = list(items)
+    if len(items) <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+        # Each task needs its own copy: a context can't be entered twice at once
+        futures = [pool.submit(contextvars.copy_context().run, fn, item) for item in items]
+        return [future.result() for future in futures]
+
+
+def get_artist(artist_id: str) -> dict:
+    """Artist metadata from the shared artist cache, fetched on a miss."""
+    artist = artist_cache.get(artist_id)
+    if artist is None:
+        artist = sp.artist(artist_id)
+        artist_cache.set(artist_id, artist)
+    return artist
+
+
+def get_artists(artist_ids: list) -> dict:
+    """Artist metadata by ID, fetching cache misses 50 per request.
+
+    IDs Spotify doesn't know are left out.
+    """
+    artists = {}
+    missing = []
+    for artist_id in dict.fromkeys(artist_ids):
+        artist = artist_cache.get(artist_id)
+        if artist is None:
+            missing.append(artist_id)
+        else:
+            artists[artist_id] = artist
+
+    for start in range(0, len(missing), ARTISTS_BATCH_SIZE):
+        for artist in sp.artists(missing[start:start + ARTISTS_BATCH_SIZE])["artists"]:
+            if artist:
+                artist_cache.set(artist["id"], artist)
+                artists[artist["id"]] = artist
+    return artists
+
+
+def resolve_artist_name(name: str) -> str | None:
+    """Spotify artist ID for an artist name (best search match), or None."""
+    key = " ".join(name.casefold().split())
+    artist_id = artist_name_cache.get(key)
+    if artist_id is not None:
+        return artist_id
+
+    search_results = sp.search(q=f"artist:{name}", type="artist", limit=1)
+    artists = search_results["artists"]["items"]
+    if not artists:
+        return None
+    artist_cache.set(artists[0]["id"], artists[0])
+    artist_name_cache.set(key, artists[0]["id"])
+    return artists[0]["id"]
+
+
+def get_artist_top_tracks(artist_id: str) -> list:
+    """An artist's top tracks from the shared cache, fetched on a miss."""
+    tracks = top_tracks_cache.get(artist_id)
+    if tracks is None:
+        tracks = track_records(sp.artist_top_tracks(artist_id)["tracks"])
+        top_tracks_cache.set(artist_id, tracks)
+    return tracks
+
+
+def get_user_top(kind: str, limit: int = 50, time_range: str = "medium_term") -> dict:
+    """The calling account's top "tracks" or "artists", through the user data cache."""
+    key = (current_account.get(), "top", kind, limit, time_range)
+    top = user_data_cache.get(key)
+    if top is None:
+        if kind == "tracks":
+            top = sp.current_user_top_tracks(limit=limit, time_range=time_range)
+            top = {**top, "items": track_records(top["items"])}
+        else:
+            top = sp.current_user_top_artists(limit=limit, time_range=time_range)
+        user_data_cache.set(key, top)
+    return top
+
+
+def get_saved_tracks() -> list:
+    """Every track in the calling account's library, through the user data cache.
+
+    The tracks are added to the catalog index, so collection songs the user
+    has saved resolve without a search.
+    """
+    key = (current_account.get(), "saved_tracks")
+    tracks = user_data_cache.get(key)
+    if tracks is not None:
+        return tracks
+
+    _ensure_catalog_index_loaded()
+    tracks = []
+    offset = 0
+    while True:
+        saved = sp.current_user_saved_tracks(limit=SAVED_TRACKS_PAGE_SIZE, offset=offset)
+        page = track_records(item.get("track") for item in saved["items"])
+        for track in page:
+            catalog_index.add(track, private=True)
+        tracks.extend(page)
+        offset += SAVED_TRACKS_PAGE_SIZE
+        if len(saved["items"]) < SAVED_TRACKS_PAGE_SIZE:
+            break
+    save_catalog_index_if_due()
+    user_data_cache.set(key, tracks)
+    return tracks
+
+
+def song_contribution(song_data: dict, with_genres: bool = True) -> dict:
+    """Resolve one song into what it contributes to the collection analyses."""
+    query = song_query(song_data)
+    track = resolve_song(song_data)
+    if track is None:
+        # When, so a saved collection knows when to look the song up again
+        return {"query": query, "track": None, "checked": round(time.time())}
+
+    artist_genres = None
+    if with_genres:
+        artist_genres = []
+        for artist in track["artists"]:
+            try:
+                artist_genres.append(get_artist(artist["id"])["genres"])
+            except Exception:
+                artist_genres.append([])
+
+    release_date = track["album"]["release_date"]
+    return {
+        "query": query,
+        "track": {
+            "id": track["id"],
+            "name": track["name"],
+            "artists": [a["name"] for a in track["artists"]],
+            "artist_ids": [a["id"] for a in track["artists"]],
+            "explicit": track["explicit"],
+            "popularity": track["popularity"],
+            "year": int(release_date.split("-")[0]) if release_date else None,
+            "artist_genres": artist_genres
+        }
+    }
+
+
+class CollectionAnalysis:
+    """Resolved songs of a collection, in list order, plus their aggregates.
+
+    tracks holds the contributed track of every found song (repeats
+    included) and errors a "Not found" line for the rest.
+    """
+
+    def __init__(self, aggregates: CollectionAggregates, budget: TimeBudget, delta: dict | None = None):
+        self.aggregates = aggregates
+        self.budget = budget
+        self.delta = delta
+        self.tracks = []
+        self.errors = []
+
+    def add(self, contribution: dict):
+        if contribution["track"] is None:
+            self.errors.append(f"Not found: {contribution['query']}")
+        else:
+            self.tracks.append(contribution["track"])
+
+    def in_list_order(self, counter: Counter, values) -> dict:
+        """counter's items ordered by first appearance in the list, so ties
+        rank the same whether the aggregates were built now or by delta."""
+        ordered = {}
+        for track in self.tracks:
+            for value in values(track):
+                if value not in ordered and value in counter:
+                    ordered[value] = counter[value]
+        return ordered
+
+    def annotate(self, result: dict) -> dict:
+        """Add coverage (and the incremental delta, if any) to a tool result."""
+        result = self.budget.annotate(result)
+        if self.delta is not None:
+            result["incremental"] = self.delta
+            total = self.delta["rows"]
+            if total:
+                # The budget only covers the added rows; report the whole list
+                result["coverage"] = round(len(self.aggregates) / total, 3)
+        return result
+
+
+def _collection_lock(collection_id: str) -> threading.Lock:
+    with _collection_locks_lock:
+        return _collection_locks.setdefault(collection_id, threading.Lock())
+
+
+def _collection_state_path(collection_id: str) -> str:
+    digest = hashlib.sha1(collection_id.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(COLLECTION_STATE_DIR, f"{digest}.json.gz")
+
+
+def analyze_collection(arguments: dict, with_genres: bool = True) -> CollectionAnalysis:
+    """Resolve a collection tool's songs, within its time budget.
+
+    With a collection_id, the previous version of the collection is loaded
+    and only the rows added since then are resolved; removed rows are
+    subtracted from the saved aggregates. Saved rows that were not found are
+    resolved again once NOT_FOUND_CACHE_TTL has passed.
+    """
+    collection_id = arguments.get("collection_id")
+    if not collection_id:
+        budget = collection_budget(arguments)
+        analysis = CollectionAnalysis(CollectionAggregates(), budget)
+        for song_data in budget:
+            contribution = song_contribution(song_data, with_genres)
+            analysis.aggregates.apply(contribution)
+            analysis.add(contribution)
+        return analysis
+
+    keys = []
+    songs_by_key = {}
+    for song_data in collection_songs(arguments):
+        key = CatalogIndex.query_key(song_data["song_name"], song_data.get("artist_name") or "")
+        keys.append(key)
+        songs_by_key.setdefault(key, song_data)
+    rows = Counter(keys)
+
+    with _collection_lock(collection_id):
+        aggregates = _collection_states.get(collection_id)
+        if aggregates is None:
+            path = _collection_state_path(collection_id)
+            try:
+                aggregates = CollectionAggregates.load(path, collection_id)
+            except Exception as e:
+                logger.warning(f"Could not load collection {collection_id!r}: {e}")
+                aggregates = CollectionAggregates(collection_id)
+            _collection_states[collection_id] = aggregates
+
+        added, removed = aggregates.diff(rows)
+        for key, times in removed.items():
+            aggregates.remove_row(key, times)
+
+        # Not-found rows get another search once the not-found cache would
+        # have forgotten them; Spotify may have the song by now
+        stale = [
+            key for key in aggregates.stale_not_found(time.time() - NOT_FOUND_CACHE_TTL)
+            if key not in added
+        ]
+
+        # Genres are always stored: the saved state serves every collection tool
+        budget = TimeBudget(
+            [songs_by_key[key] for key in itertools.chain(added, stale)], arguments.get("time_budget_seconds")
+        )
+        rechecked = 0
+        for song_data in budget:
+            key = CatalogIndex.query_key(song_data["song_name"], song_data.get("artist_name") or "")
+            if key in added:
+                aggregates.add_row(key, song_contribution(song_data), added[key])
+            else:
+                aggregates.replace_contribution(key, song_contribution(song_data))
+                rechecked += 1
+
+        if added or removed or rechecked:
+            try:
+                aggregates.save(_collection_state_path(collection_id))
+            except Exception as e:
+                logger.warning(f"Could not save collection {collection_id!r}: {e}")
+
+        analysis = CollectionAnalysis(aggregates, budget, {
+            "collection_id": collection_id,
+            "rows": len(keys),
+            "added": sum(added.values()),
+            "removed": sum(removed.values()),
+            "rechecked_not_found": rechecked,
+            "resolved": budget.processed
+        })
+        for key in keys:
+            contribution = aggregates.contributions.get(key)
+            if contribution is not None:
+                analysis.add(contribution)
+    return analysis
+
+
+class CollectionSketch:
+    """Approximate aggregates of a collection's resolved songs in fixed memory.
+
+    The sketches' size depends on error_rate and top_n, not on the number of
+    songs; only the first SKETCH_ERROR_SAMPLES not-found songs are kept.
+    Resolving still adds each distinct track to the catalog index, which is
+    not bounded. A named sketch (collection_id) is saved between calls,
+    with the row each songs_source was counted up to.
+    """
+
+    def __init__(self, budget: TimeBudget, error_rate: float, top_n: int, collection_id: str = None):
+        if not MIN_ERROR_RATE <= error_rate < 1:
+            raise ValueError(f"error_rate must be between {MIN_ERROR_RATE:g} and 1")
+        self.budget = budget
+        self.error_rate = error_rate
+        self.collection_id = collection_id
+        self.sources = {}       # songs_source -> rows counted from it
+        self.songs = 0
+        self.not_found = 0
+        self.errors = []
+        # Extra candidates keep items just outside the top n from being
+        # displaced by a burst of a less frequent one
+        capacity = max(100, 4 * top_n)
+        self.artists = HeavyHitters(capacity, error_rate, SKETCH_DELTA)
+        self.genres = HeavyHitters(capacity, error_rate, SKETCH_DELTA)
+        self.unique_artists = HyperLogLog.for_error(error_rate * 10)
+        self.unique_genres = HyperLogLog.for_error(error_rate * 10)
+
+    def add(self, contribution: dict):
+        track = contribution["track"]
+        if track is None:
+            self.not_found += 1
+            if len(self.errors) < SKETCH_ERROR_SAMPLES:
+                self.errors.append(f"Not found: {contribution['query']}")
+            return
+        self.songs += 1
+        for artist, genres in zip(track["artists"], track["artist_genres"] or [[]] * len(track["artists"])):
+            self.artists.add(artist)
+            self.unique_artists.add(artist)
+            for genre in genres:
+                self.genres.add(genre)
+                self.unique_genres.add(genre)
+
+    def top(self, hitters: HeavyHitters, n: int) -> list:
+        """[(item, estimated count, percentage of all counted)] for the top n."""
+        return [
+            (item, count, round(count / hitters.total * 100, 1) if hitters.total else 0)
+            for item, count in hitters.top(n)
+        ]
+
+    def annotate(self, result: dict, hitters: HeavyHitters, unique: HyperLogLog) -> dict:
+        """Add the error bounds and coverage to an approximate tool result."""
+        result["approximate"] = {
+            "method": "count-min heavy hitters + hyperloglog",
+            "error_rate": self.error_rate,
+            "count_error_bound": hitters.error_bound,
+            "confidence": 1 - SKETCH_DELTA,
+            "unique_relative_error": round(unique.relative_error, 4),
+            "memory_bytes": hitters.memory_bytes + unique.memory_bytes
+        }
+        if self.collection_id:
+            # The counts cover every call so far; coverage only this call's rows
+            result["approximate"]["collection_id"] = self.collection_id
+            result["approximate"]["rows_counted"] = self.sources
+        return self.budget.annotate(result)
+
+    def to_dict(self) -> dict:
+        return {
+            "version": SKETCH_STATE_VERSION,
+            "collection_id": self.collection_id,
+            "error_rate": self.error_rate,
+            "sources": self.sources,
+            "songs": self.songs,
+            "not_found": self.not_found,
+            "errors": self.errors,
+            "artists": self.artists.to_dict(),
+            "genres": self.genres.to_dict(),
+            "unique_artists": self.unique_artists.to_dict(),
+            "unique_genres": self.unique_genres.to_dict()
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, budget: TimeBudget) -> "CollectionSketch":
+        sketch = cls.__new__(cls)
+        sketch.budget = budget
+        sketch.error_rate = data["error_rate"]
+        sketch.collection_id = data["collection_id"]
+        sketch.sources = data["sources"]
+        sketch.songs = data["songs"]
+        sketch.not_found = data["not_found"]
+        sketch.errors = data["errors"]
+        sketch.artists = HeavyHitters.from_dict(data["artists"])
+        sketch.genres = HeavyHitters.from_dict(data["genres"])
+        sketch.unique_artists = HyperLogLog.from_dict(data["unique_artists"])
+        sketch.unique_genres = HyperLogLog.from_dict(data["unique_genres"])
+        return sketch
+
+    def save(self, path: str):
+        """Write the sketch to a gzipped JSON file (atomically)."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps(self.to_dict(), ensure_ascii=False))
+        os.replace(tmp_path, path)
+
+
+def _sketch_state_path(collection_id: str) -> str:
+    digest = hashlib.sha1(collection_id.encode("utf-8")).hexdigest()[:16]
+    # Not .json.gz: those are the exact collection states
+    return os.path.join(COLLECTION_STATE_DIR, f"{digest}.sketch.gz")
+
+
+def _load_sketch(collection_id: str, budget: TimeBudget) -> CollectionSketch | None:
+    path = _sketch_state_path(collection_id)
+    if not os.path.exists(path):
+        return None
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") == SKETCH_STATE_VERSION and data.get("collection_id") == collection_id:
+            return CollectionSketch.from_dict(data, budget)
+    except Exception as e:
+        logger.warning(f"Could not load sketch {collection_id!r}: {e}")
+    return None
+
+
+def sketch_collection(arguments: dict, with_genres: bool = True, top_n: int = 10) -> CollectionSketch:
+    """Stream a collection tool's songs into fixed-memory sketches, within its time budget.
+
+    With a collection_id the sketches are loaded, the songs of this call are
+    added and the sketches saved again, so a source too big for one budget
+    is counted over several calls. Each songs_source must continue where the
+    previous call stopped (songs_offset = resume_offset), so no row is
+    counted twice; inline songs are simply added.
+    """
+    collection_id = arguments.get("collection_id")
+    if not collection_id:
+        budget = collection_budget(arguments)
+        sketch = CollectionSketch(budget, arguments.get("error_rate", DEFAULT_ERROR_RATE), top_n)
+        for song_data in budget:
+            sketch.add(song_contribution(song_data, with_genres))
+        return sketch
+
+    source = arguments.get("songs") is None and arguments.get("songs_source")
+    offset = arguments.get("songs_offset", 0)
+    with _collection_lock(collection_id):
+        budget = collection_budget(arguments)
+        sketch = _load_sketch(collection_id, budget)
+        if sketch is None:
+            error_rate = arguments.get("error_rate", DEFAULT_ERROR_RATE)
+            sketch = CollectionSketch(budget, error_rate, top_n, collection_id)
+        elif arguments.get("error_rate", sketch.error_rate) != sketch.error_rate:
+            raise ValueError(f"Sketch {collection_id!r} was started with error_rate {sketch.error_rate:g}; "
+                             "use a new collection_id to change it")
+        if source and sketch.sources.get(source, offset) != offset:
+            counted = sketch.sources[source]
+            raise ValueError(f"Sketch {collection_id!r} has counted {source} up to row {counted}: "
+                             f"pass songs_offset {counted} to continue, or use a new collection_id to start over")
+
+        # Genres are always counted: the saved sketch serves both tools
+        for song_data in budget:
+            sketch.add(song_contribution(song_data))
+        if source:
+            sketch.sources[source] = offset + budget.processed
+        try:
+            sketch.save(_sketch_state_path(collection_id))
+        except Exception as e:
+            logger.warning(f"Could not save sketch {collection_id!r}: {e}")
+    return sketch
+
+
+def _similarity_index_path(account: str | None) -> str:
+    """The default account's index keeps the plain file name."""
+    if account is None:
+        return SIMILARITY_INDEX_PATH
+    return os.path.join(CACHE_DIR, f"similarity_index-{account}.json.gz")
+
+
+def similarity_index_for(account: str | None) -> SimilarityIndex:
+    """An account's similarity index, loaded from disk the first time it is needed."""
+    index = _similarity_indexes.get(account)
+    if index is not None:
+        return index
+    with _similarity_index_lock:
+        index = _similarity_indexes.get(account)
+        if index is None:
+            index = SimilarityIndex()
+            try:
+                loaded = index.load(_similarity_index_path(account))
+                logger.info(f"Loaded {loaded} entries into the similarity index ({account or 'default'})")
+            except Exception as e:
+                logger.warning(f"Could not load similarity index ({account or 'default'}): {e}")
+            _similarity_indexes[account] = index
+    return index
+
+
+def save_similarity_index():
+    """Persist every loaded similarity index that changed since its last save."""
+    for account, index in list(_similarity_indexes.items()):
+        if index.dirty:
+            try:
+                index.save(_similarity_index_path(account))
+            except Exception as e:
+                logger.warning(f"Could not save similarity index ({account or 'default'}): {e}")
+
+
+atexit.register(save_similarity_index)
+
+
+def track_tokens(tracks) -> set:
+    """Similarity tokens of some tracks: their track IDs and artist IDs."""
+    tokens = set()
+    for track in tracks:
+        if not track or not track.get("id"):
+            continue
+        tokens.add(f"t:{track['id']}")
+        tokens.update(f"a:{artist['id']}" for artist in track["artists"] if artist.get("id"))
+    return tokens
+
+
+def playlist_tracks(playlist_id: str) -> list:
+    """Every track of a playlist, 100 per request."""
+    tracks = []
+    offset = 0
+    while True:
+        page = sp.playlist_items(
+            playlist_id, offset=offset, limit=100,
+            fields="items(track(id,artists(id))),next"
+        )
+        tracks.extend(item["track"] for item in page["items"] if item.get("track"))
+        if not page.get("next"):
+            return tracks
+        offset += 100
+
+
+def collection_tracks(arguments: dict, errors: list) -> list:
+    """Resolve a collection tool's songs (inline or songs_source) to tracks."""
+    tracks = []
+    for song_data in collection_songs(arguments):
+        track = resolve_song(song_data)
+        if track is None:
+            errors.append(f"Not found: {song_query(song_data)}")
+        else:
+            tracks.append(track)
+    return tracks
+
+
+# Cache warm-up: `python music_server_updated_2025.py warm` fills the caches
+# once and exits; MUSIC_SERVER_WARM_ON_START=1 runs the same in a background
+# thread when the server starts. Warm-up Spotify calls are low priority, so
+# tool calls arriving meanwhile are always served first.
+WARM_SOURCES = [
+    source.strip() for source in
+    os.environ.get("MUSIC_SERVER_WARM_SOURCES", f"{COLLECTION_URI_PREFIX}rsvp_songs").split(",")
+    if source.strip()
+]
+WARM_ON_START = os.environ.get("MUSIC_SERVER_WARM_ON_START", "").lower() in ("1", "true", "yes")
+WARM_TIME_RANGES = ("short_term", "medium_term", "long_term")
+
+
+class WarmUpProgress:
+    """Progress of the cache warm-up, for the stats resource and the warm command."""
+
+    def __init__(self):
+        self.state = "idle"
+        self.phase = None
+        self.phases = {}
+        self.errors = []
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self.state = "running"
+            self.phases = {}
+            self.errors = []
+            self.started = time.time()
+            self.finished = None
+
+    def begin(self, phase: str, total: int | None = None):
+        with self._lock:
+            self.phase = phase
+            self.phases[phase] = {"done": 0, "total": total}
+        logger.info(f"Warm-up: {phase}" + (f" ({total})" if total is not None else ""))
+
+    def advance(self, count: int = 1):
+        with self._lock:
+            self.phases[self.phase]["done"] += count
+
+    def fail(self, error: str):
+        with self._lock:
+            self.errors.append(f"{self.phase}: {error}")
+        logger.warning(f"Warm-up {self.phase} failed: {error}")
+
+    def finish(self):
+        with self._lock:
+            self.state = "done"
+            self.phase = None
+            self.finished = time.time()
+
+    def report(self) -> dict:
+        with self._lock:
+            end = self.finished or time.time()
+            return {
+                "state": self.state,
+                "phase": self.phase,
+                "phases": {name: dict(counts) for name, counts in self.phases.items()},
+                "seconds": round(end - self.started, 1) if self.started else None,
+                "errors": list(self.errors)
             }
-        ),
-        Tool(
-            name="analyze_collection_diversity",
-            description="Analyze diversity in a music collection - unique artists, genre spread, era distribution, popularity range",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "songs": {
-                        "type": "array",
-                        "items": {
+
+
+warm_up_progress = WarmUpProgress()
+
+
+def warm_caches(sources: list | None = None) -> dict:
+    """Fill the caches a cold server would otherwise fill on the first calls.
+
+    Resolves the songs of the warm sources into the catalog index, fetches
+    the user's top items and saved library, then loads the metadata of every
+    artist seen, 50 per request. Spotify calls are low priority.
+    """
+    progress = warm_up_progress
+    progress.start()
+    token = low_priority.set(True)
+    artist_ids = {}     # artist ID -> whether it was only seen in the user's own data
+
+    def note_artist(artist_id: str, private: bool):
+        artist_ids[artist_id] = private and artist_ids.get(artist_id, True)
+
+    try:
+        for source in (WARM_SOURCES if sources is None else sources):
+            progress.begin(f"songs {source}")
+            try:
+                songs = collection_songs({"songs_source": source})
+                while True:
+                    batch = list(itertools.islice(songs, TRACKS_BATCH_SIZE))
+                    if not batch:
+                        break
+                    for track in run_concurrently(resolve_song, batch):
+                        if track:
+                            private = catalog_index.is_private(track["id"])
+                            for artist in track["artists"]:
+                                note_artist(artist["id"], private)
+                    progress.advance(len(batch))
+            except Exception as e:
+                progress.fail(str(e))
+
+        progress.begin("user top items", 2 * len(WARM_TIME_RANGES))
+        try:
+            _ensure_catalog_index_loaded()
+            for time_range in WARM_TIME_RANGES:
+                for track in get_user_top("tracks", time_range=time_range)["items"]:
+                    catalog_index.add(track, private=True)
+                    for artist in track["artists"]:
+                        note_artist(artist["id"], True)
+                progress.advance()
+                for artist in get_user_top("artists", time_range=time_range)["items"]:
+                    note_artist(artist["id"], True)
+                    artist_cache.set(artist["id"], artist)
+                progress.advance()
+        except Exception as e:
+            progress.fail(str(e))
+
+        progress.begin("saved library")
+        try:
+            tracks = get_saved_tracks()
+            for track in tracks:
+                for artist in track["artists"]:
+                    note_artist(artist["id"], True)
+            progress.advance(len(tracks))
+        except Exception as e:
+            progress.fail(str(e))
+
+        missing = [artist_id for artist_id in artist_ids if artist_cache.get(artist_id) is None]
+        progress.begin("artists", len(missing))
+        for start in range(0, len(missing), ARTISTS_BATCH_SIZE):
+            batch = missing[start:start + ARTISTS_BATCH_SIZE]
+            try:
+                get_artists(batch)
+            except Exception as e:
+                progress.fail(str(e))
+                break
+            progress.advance(len(batch))
+    finally:
+        for artist_id, private in artist_ids.items():
+            if private:
+                private_artist_ids.add(artist_id)
+            else:
+                private_artist_ids.discard(artist_id)
+        low_priority.reset(token)
+        save_catalog_index()
+        progress.finish()
+    return progress.report()
+
+
+# Cache snapshots (cache_snapshot.py) carry the catalog-level caches between
+# machines: `export-cache <file>` writes one and `import-cache <file>` merges
+# one into this machine's caches. MUSIC_SERVER_CACHE_SNAPSHOT=<file> imports
+# one when the server starts, which is how the in-memory artist caches reach
+# a running server. User-private data (named collections, the similarity
+# index of the user's playlists) is only exported with --include-private;
+# the user-data cache never is.
+CACHE_SNAPSHOT_PATH = os.environ.get("MUSIC_SERVER_CACHE_SNAPSHOT")
+
+
+def _ttl_cache_columns(cache: TTLCache, to_json=None, exclude=()) -> dict:
+    entries = [entry for entry in cache.entries() if entry[0] not in exclude]
+    return {
+        "keys": [key for key, _, _ in entries],
+        "values": [value if to_json is None else to_json(value) for _, value, _ in entries],
+        "ttl": [None if ttl is None else round(ttl, 1) for _, _, ttl in entries]
+    }
+
+
+def _import_ttl_cache_columns(cache: TTLCache, columns: dict, age: float, from_json=None) -> int:
+    """Load exported entries with what is left of their TTL; returns entries loaded."""
+    loaded = 0
+    for key, value, ttl in zip(columns["keys"], columns["values"], columns["ttl"]):
+        if ttl is not None:
+            ttl -= age
+            if ttl <= 0:
+                continue
+        cache.set(key, value if from_json is None else from_json(value), ttl)
+        loaded += 1
+    return loaded
+
+
+def export_cache_snapshot(path: str, include_private: bool = False) -> dict:
+    """Write the catalog-level caches (and optionally private data) to a snapshot.
+
+    Without include_private, nothing taken from the user's own data is
+    written: no tracks that only came from their library, top tracks or
+    files (nor those tracks' audio features), no artists only seen there
+    (nor their top tracks), and no raw queries (catalog aliases, artist
+    names looked up).
+    """
+    started = time.perf_counter()
+    _ensure_catalog_index_loaded()
+    catalog = catalog_index.export_columns(include_private)
+    features = audio_features_cache.items()
+    if not include_private:
+        features = {
+            track_id: values for track_id, values in features.items()
+            if not catalog_index.is_private(track_id)
+        }
+    private_artists = set() if include_private else set(private_artist_ids)
+    sections = {
+        "catalog_index": catalog,
+        "audio_features": {"ids": list(features), **to_columns(list(features.values()), AUDIO_FEATURE_CACHE_KEYS)},
+        "artists": _ttl_cache_columns(artist_cache, exclude=private_artists),
+        "top_tracks": _ttl_cache_columns(top_tracks_cache, lambda tracks: [t.to_dict() for t in tracks],
+                                         exclude=private_artists)
+    }
+    meta = {"catalog_index_version": INDEX_VERSION, "private": include_private}
+
+    if include_private:
+        sections["private_artists"] = {"ids": list(private_artist_ids)}
+        sections["artist_names"] = _ttl_cache_columns(artist_name_cache)
+        similarity = {"account": [], "keys": [], "signatures": [], "meta": []}
+        for account in [None, *SPOTIFY_ACCOUNTS]:
+            columns = similarity_index_for(account).export_columns()
+            similarity["account"] += [account] * len(columns["keys"])
+            for name, column in columns.items():
+                similarity[name] += column
+        sections["similarity_index"] = similarity
+        meta["similarity_params"] = similarity_index_for(None).params
+        states = []
+        if os.path.isdir(COLLECTION_STATE_DIR):
+            for name in sorted(os.listdir(COLLECTION_STATE_DIR)):
+                if name.endswith(".json.gz"):
+                    with gzip.open(os.path.join(COLLECTION_STATE_DIR, name), "rt", encoding="utf-8") as f:
+                        states.append(json.load(f))
+        sections["collections"] = {"states": states}
+
+    header = write_snapshot(path, sections, meta)
+    return {
+        "path": os.path.abspath(path),
+        "bytes": os.path.getsize(path),
+        "private": include_private,
+        "sections": {section["name"]: section["rows"] for section in header["sections"]},
+        "seconds": round(time.perf_counter() - started, 2)
+    }
+
+
+def import_cache_snapshot(path: str, persist: bool = True) -> dict:
+    """Merge a snapshot into this process's caches.
+
+    With persist, the on-disk caches (catalog index, audio features,
+    similarity index) are saved right away; otherwise they are saved as
+    usual (when enough changed, and at exit).
+    """
+    started = time.perf_counter()
+    header, sections = read_snapshot(path)
+    age = max(0.0, time.time() - header["created"])
+    loaded = {}
+
+    catalog = sections.get("catalog_index")
+    if catalog is not None and header.get("catalog_index_version") == INDEX_VERSION:
+        _ensure_catalog_index_loaded()
+        loaded["catalog_index"] = catalog_index.import_columns(catalog)
+        if persist:
+            save_catalog_index()
+
+    features = sections.get("audio_features")
+    if features is not None:
+        features = dict(features)
+        ids = features.pop("ids")
+        audio_features_cache.set_many(dict(zip(ids, from_columns(features))))
+        loaded["audio_features"] = len(ids)
+        if persist:
+            audio_features_cache.save()
+
+    for name, cache, from_json in (("artists", artist_cache, None), ("artist_names", artist_name_cache, None),
+                                   ("top_tracks", top_tracks_cache, track_records)):
+        if name in sections:
+            loaded[name] = _import_ttl_cache_columns(cache, sections[name], age, from_json)
+    if "private_artists" in sections:
+        private_artist_ids.update(sections["private_artists"]["ids"])
+
+    if "similarity_index" in sections and header.get("similarity_params") == similarity_index_for(None).params:
+        # Entries of accounts not configured here are left out
+        columns = sections["similarity_index"]
+        positions = {}
+        for position, account in enumerate(columns["account"]):
+            if account is None or account in SPOTIFY_ACCOUNTS:
+                positions.setdefault(account, []).append(position)
+        loaded["similarity_index"] = 0
+        for account, rows in positions.items():
+            loaded["similarity_index"] += similarity_index_for(account).import_columns({
+                name: [columns[name][row] for row in rows] for name in ("keys", "signatures", "meta")
+            })
+        if persist:
+            save_similarity_index()
+
+    if "collections" in sections:
+        loaded["collections"] = 0
+        for data in sections["collections"]["states"]:
+            collection_id = data.get("collection_id")
+            if data.get("version") != AGGREGATES_VERSION or not collection_id:
+                continue
+            with _collection_lock(collection_id):
+                aggregates = CollectionAggregates.from_dict(data)
+                aggregates.save(_collection_state_path(collection_id))
+                _collection_states[collection_id] = aggregates
+            loaded["collections"] += 1
+
+    return {
+        "path": os.path.abspath(path),
+        "created": datetime.fromtimestamp(header["created"]).isoformat(timespec="seconds"),
+        "private": header.get("private", False),
+        "loaded": loaded,
+        "seconds": round(time.perf_counter() - started, 2)
+    }
+
+
+def prepare_caches():
+    """Startup cache work: import MUSIC_SERVER_CACHE_SNAPSHOT, then warm up if enabled."""
+    if CACHE_SNAPSHOT_PATH:
+        try:
+            report = import_cache_snapshot(CACHE_SNAPSHOT_PATH, persist=False)
+            logger.info(f"Imported cache snapshot {CACHE_SNAPSHOT_PATH}: {report['loaded']} in {report['seconds']}s")
+        except Exception as e:
+            logger.warning(f"Could not import cache snapshot {CACHE_SNAPSHOT_PATH}: {e}")
+    if WARM_ON_START:
+        warm_caches()
+
+
+def start_cache_preparation():
+    """Run prepare_caches() in a background thread."""
+    threading.Thread(target=prepare_caches, name="cache-preparation", daemon=True).start()
+
+
+def server_stats() -> dict:
+    """Cache and index statistics for the music://server/stats resource."""
+    return {
+        "spotify_accounts": spotify_pool.stats(),
+        "token_refresh": token_refresher.stats(),
+        "catalog_index": catalog_index.report(),
+        "audio_features_cache": audio_features_cache.stats(),
+        "search_cache": search_cache.stats(),
+        "not_found_cache": {**not_found_cache.stats(), "ttl_seconds": NOT_FOUND_CACHE_TTL},
+        "similarity_index": {
+            account or "default": {"entries": len(index)} for account, index in list(_similarity_indexes.items())
+        },
+        "artist_cache": artist_cache.stats(),
+        "artist_name_cache": artist_name_cache.stats(),
+        "recommendations_cache": recommendations_cache.stats(),
+        "top_tracks_cache": top_tracks_cache.stats(),
+        "user_data_cache": user_data_cache.stats(),
+        "warm_up": warm_up_progress.report(),
+        "response_caches": {
+            name: spec.response_cache.stats()
+            for name, spec in TOOL_REGISTRY.items()
+            if spec.response_cache is not None
+        },
+        "truncated_responses": {
+            "max_response_bytes": MAX_RESPONSE_BYTES or None,
+            **{name: spec.truncated_responses for name, spec in TOOL_REGISTRY.items() if spec.truncated_responses}
+        }
+    }
+
+
+@register_tool(
+    "search_tracks",
+    "Search for tracks on Spotify by name, artist, or keywords. Pass 'queries' to run many searches in one call.",
+    {
+        "type": "object",
+        "properties": {
+            "query": {
+                "type": "string",
+                "description": "Search query (song name, artist, keywords)"
+            },
+            "limit": {
+                "type": "integer",
+                "description": "Number of results to return (1-50)",
+                "default": 10
+            },
+            "queries": {
+                "type": "array",
+                "items": {
+                    "anyOf": [
+                        {"type": "string"},
+                        {
                             "type": "object",
                             "properties": {
-                                "song_name": {"type": "string"},
-                                "artist_name": {"type": "string"}
+                                "query": {"type": "string"},
+                                "limit": {"type": "integer"}
                             },
-                            "required": ["song_name"]
-                        },
-                        "description": "List of songs to analyze for diversity"
-                    }
+                            "required": ["query"]
+                        }
+                    ]
                 },
-                "required": ["songs"]
+                "description": f"Instead of 'query': up to {MAX_SEARCH_QUERIES} searches, each a string or {{query, limit}}; results are keyed by query"
             }
-        ),
-        Tool(
-            name="get_top_artists_from_collection",
-            description="Find the most frequent artists in a song collection and their contribution percentage",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "songs": {
-                        "type": "array",
-                        "items": {
-                            "type": "object",
-                            "properties": {
-                                "song_name": {"type": "string"},
-                                "artist_name": {"type": "string"}
-                            },
-                            "required": ["song_name"]
-                        },
-                        "description": "List of songs to analyze"
-                    },
-                    "top_n": {
-                        "type": "integer",
-                        "description": "Number of top artists to return",
-                        "default": 10
-                    }
-                },
-                "required": ["songs"]
+        },
+        "required": []
+    },
+    max_concurrency=8, timeout=SEARCH_TIMEOUT, cache_ttl=300,
+    detail_sections=("results",)
+)
+def handle_search_tracks(arguments: dict) -> Any:
+    """Search Spotify for tracks matching one free-text query or many."""
+    if arguments.get("queries") is None:
+        if not arguments.get("query"):
+            raise ValueError("Provide 'query' or 'queries'")
+        return search_tracks(arguments["query"], arguments.get("limit", 10))
+
+    default_limit = arguments.get("limit", 10)
+    # Results are keyed by query, so a repeated query runs once; it can't
+    # ask for two different limits
+    searches = {}
+    for item in arguments["queries"]:
+        if isinstance(item, str):
+            query, limit = item, default_limit
+        else:
+            query, limit = item["query"], item.get("limit", default_limit)
+        if searches.setdefault(query, limit) != limit:
+            raise ValueError(f"Query {query!r} is listed with different limits ({searches[query]} and {limit})")
+    if len(searches) > MAX_SEARCH_QUERIES:
+        raise ValueError(f"At most {MAX_SEARCH_QUERIES} queries per call (got {len(searches)})")
+
+    errors = {}
+
+    def run_search(query):
+        try:
+            return search_tracks(query, searches[query])
+        except Exception as e:
+            errors[query] = str(e)
+            return None
+
+    results = dict(zip(searches, run_concurrently(run_search, searches)))
+    return {
+        "results": {query: tracks for query, tracks in results.items() if tracks is not None},
+        "summary": {
+            "queries": len(searches),
+            "succeeded": len(searches) - len(errors)
+        },
+        "errors": errors if errors else None
+    }
+
+
+def search_tracks(query: str, limit: int = 10) -> list:
+    """Formatted track search results, served from search_cache when fresh."""
+    cache_key = (query, limit)
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    results = sp.search(q=query, type="track", limit=limit)
+    tracks = results["tracks"]["items"]
+
+    _ensure_catalog_index_loaded()
+    formatted_results = []
+    for track in tracks:
+        catalog_index.add(track)
+        formatted_results.append({
+            "name": track["name"],
+            "artists": [artist["name"] for artist in track["artists"]],
+            "album": track["album"]["name"],
+            "id": track["id"],
+            "uri": track["uri"],
+            "popularity": track["popularity"],
+            "preview_url": track.get("preview_url"),
+            "external_url": track["external_urls"]["spotify"]
+        })
+
+    search_cache.set(cache_key, formatted_results)
+    return formatted_results
+
+
+def track_id_from(value: str) -> str:
+    """Accept a bare track ID, a spotify:track: URI or an open.spotify.com URL."""
+    value = value.strip()
+    if value.startswith("spotify:track:"):
+        return value.rsplit(":", 1)[1]
+    if "open.spotify.com/track/" in value:
+        return value.split("/track/", 1)[1].split("?", 1)[0]
+    return value
+
+
+def fetch_audio_features(track_ids: list, errors: list) -> tuple[dict, int]:
+    """Audio features by track ID, from the cache or in batches of 100.
+
+    Returns ({id: features}, number of Spotify requests made). Tracks Spotify
+    has no features for are left out; failed batches are noted in errors.
+    """
+    unique_ids = list(dict.fromkeys(track_ids))
+    features = audio_features_cache.get_many(unique_ids)
+    missing = [track_id for track_id in unique_ids if track_id not in features]
+    requests = 0
+
+    for start in range(0, len(missing), AUDIO_FEATURES_BATCH_SIZE):
+        batch = missing[start:start + AUDIO_FEATURES_BATCH_SIZE]
+        requests += 1
+        try:
+            # 2025 API: IDs only, not URIs
+            results = sp.audio_features(batch)
+        except Exception as e:
+            errors.append(f"audio-features request for {len(batch)} tracks failed: {e}")
+            continue
+        fetched = {
+            item["id"]: {key: item.get(key) for key in AUDIO_FEATURE_CACHE_KEYS}
+            for item in results if item
+        }
+        audio_features_cache.set_many(fetched)
+        features.update(fetched)
+
+    return features, requests
+
+
+@register_tool(
+    "get_audio_features",
+    "Get audio features (danceability, energy, valence, tempo, ...) for many tracks at once, plus averages over the whole set. Accepts track IDs or song/artist names.",
+    {
+        "type": "object",
+        "properties": {
+            "track_ids": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Spotify track IDs, URIs or URLs"
+            },
+            "songs": songs_schema("Songs to resolve by name before fetching features"),
+            "songs_source": SONGS_SOURCE_SCHEMA,
+            "songs_offset": SONGS_OFFSET_SCHEMA,
+            "time_budget_seconds": TIME_BUDGET_SCHEMA,
+            "include_tracks": {
+                "type": "boolean",
+                "description": "Include per-track features (set false for aggregates only on large sets)",
+                "default": True
             }
-        ),
-        Tool(
-            name="analyze_genres_in_collection",
-            description="Analyze genre distribution in a music collection - find dominant genres, genre diversity, and trends",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "songs": {
-                        "type": "array",
-                        "items": {
-                            "type": "object",
-                            "properties": {
-                                "song_name": {"type": "string"},
-                                "artist_name": {"type": "string"}
-                            },
-                            "required": ["song_name"]
-                        },
-                        "description": "List of songs to analyze for genres"
-                    }
-                },
-                "required": ["songs"]
+        },
+        "required": []
+    },
+    max_concurrency=COLLECTION_TOOL_CONCURRENCY, timeout=COLLECTION_TOOL_TIMEOUT, cache_ttl=300,
+    detail_sections=("tracks",)
+)
+def handle_get_audio_features(arguments: dict) -> Any:
+    """Fetch audio features in batches and aggregate them."""
+    track_ids = [track_id_from(t) for t in arguments.get("track_ids") or []]
+    names = {}
+    errors = []
+    budget = None
+
+    if arguments.get("songs") is not None or arguments.get("songs_source"):
+        budget = collection_budget(arguments)
+        for song_data in budget:
+            track = resolve_song(song_data)
+            if track is None:
+                errors.append(f"Not found: {song_query(song_data)}")
+                continue
+            track_ids.append(track["id"])
+            names[track["id"]] = {
+                "name": track["name"],
+                "artists": [a["name"] for a in track["artists"]]
             }
-        ),
-        Tool(
-            name="create_playlist",
-            description="Create a new Spotify playlist from a collection of songs",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "playlist_name": {
-                        "type": "string",
-                        "description": "Name for the new playlist"
-                    },
-                    "songs": {
-                        "type": "array",
-                        "items": {
-                            "type": "object",
-                            "properties": {
-                                "song_name": {"type": "string"},
-                                "artist_name": {"type": "string"}
-                            },
-                            "required": ["song_name"]
-                        },
-                        "description": "List of songs to add to the playlist"
-                    },
-                    "description": {
-                        "type": "string",
-                        "description": "Optional description for the playlist"
-                    },
-                    "public": {
-                        "type": "boolean",
-                        "description": "Whether the playlist should be public (default: false)",
-                        "default": False
-                    }
-                },
-                "required": ["playlist_name", "songs"]
+    elif not track_ids:
+        raise ValueError("Provide 'track_ids', 'songs' or 'songs_source'")
+
+    features, requests = fetch_audio_features(track_ids, errors)
+    found = [track_id for track_id in dict.fromkeys(track_ids) if track_id in features]
+    for track_id in dict.fromkeys(track_ids):
+        if track_id not in features:
+            errors.append(f"No audio features: {track_id}")
+
+    averages = {}
+    for key in AUDIO_FEATURE_KEYS:
+        values = [features[t][key] for t in found if features[t].get(key) is not None]
+        if values:
+            averages[key] = round(sum(values) / len(values), 3)
+    tempos = [features[t]["tempo"] for t in found if features[t].get("tempo")]
+    major = sum(1 for t in found if features[t].get("mode") == 1)
+
+    result = {
+        "summary": {
+            "tracks_requested": len(dict.fromkeys(track_ids)),
+            "tracks_with_features": len(found),
+            "spotify_requests": requests
+        },
+        "aggregates": {
+            "averages": averages,
+            "tempo_range": [round(min(tempos), 1), round(max(tempos), 1)] if tempos else None,
+            "major_key_percentage": round(major / len(found) * 100, 1) if found else 0
+        },
+        "errors": errors if errors else None
+    }
+    if arguments.get("include_tracks", True):
+        result["tracks"] = [{"id": t, **names.get(t, {}), **features[t]} for t in found]
+
+    return budget.annotate(result) if budget is not None else result
+
+
+@register_tool(
+    "get_recommendations",
+    "Get song recommendations based on seed tracks, artists, or genres. Provide song names, artist names, or genres and get personalized recommendations.",
+    {
+        "type": "object",
+        "properties": {
+            "seed_tracks": {
+                "type": "array",
+                "items": SONG_ITEM_SCHEMA,
+                "description": "Up to 5 songs to base recommendations on (provide song name and optionally artist name)"
+            },
+            "seed_artists": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Up to 5 artist names to base recommendations on"
+            },
+            "seed_genres": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Up to 5 genre names (e.g., 'pop', 'rock', 'hip-hop', 'electronic')"
+            },
+            "limit": {
+                "type": "integer",
+                "description": "Number of recommendations (1-100)",
+                "default": 20
             }
-        ),
-        Tool(
-            name="generate_balanced_playlist",
-            description="Create a balanced playlist from a song collection based on genre, artist, and era distribution",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "songs": {
-                        "type": "array",
-                        "items": {
-                            "type": "object",
-                            "properties": {
-                                "song_name": {"type": "string"},
-                                "artist_name": {"type": "string"}
-                            },
-                            "required": ["song_name"]
-                        },
-                        "description": "Source collection of songs to balance from"
-                    },
-                    "target_size": {
-                        "type": "integer",
-                        "description": "Target number of songs for the balanced playlist (default: 30)",
-                        "default": 30
-                    },
-                    "balance_criteria": {
-                        "type": "string",
-                        "description": "What to balance by: 'genre', 'artist', or 'era' (default: 'genre')",
-                        "default": "genre"
-                    },
-                    "playlist_name": {
-                        "type": "string",
-                        "description": "Name for the new balanced playlist (optional - if provided, creates the playlist)"
-                    }
-                },
-                "required": ["songs"]
+        }
+    },
+    timeout=SEARCH_TIMEOUT * 2
+)
+def handle_get_recommendations(arguments: dict) -> Any:
+    """Recommend tracks from seed songs, artists and genres."""
+    seed_tracks_input = arguments.get("seed_tracks", [])
+    seed_artists_input = arguments.get("seed_artists", [])
+    seed_genres = arguments.get("seed_genres", [])
+    limit = arguments.get("limit", 20)
+
+    # Resolve all seed songs and artists at once, through the shared caches
+    seeds = [("track", t) for t in seed_tracks_input[:5]] + [("artist", a) for a in seed_artists_input[:5]]
+
+    def resolve_seed(seed):
+        kind, value = seed
+        if kind == "track":
+            track = resolve_song(value)
+            return track["id"] if track is not None else None
+        return resolve_artist_name(value)
+
+    track_ids = []
+    track_lookup_errors = []
+    artist_ids = []
+    artist_lookup_errors = []
+    for (kind, value), seed_id in zip(seeds, run_concurrently(resolve_seed, seeds)):
+        if kind == "track":
+            if seed_id is not None:
+                track_ids.append(seed_id)
+            else:
+                track_lookup_errors.append(f"Track not found: {song_query(value)}")
+        elif seed_id is not None:
+            artist_ids.append(seed_id)
+        else:
+            artist_lookup_errors.append(f"Artist not found: {value}")
+
+    # Ensure we have at least one seed
+    if not track_ids and not artist_ids and not seed_genres:
+        return {
+            "error": "At least one seed (track, artist, or genre) is required",
+            "track_lookup_errors": track_lookup_errors if track_lookup_errors else None,
+            "artist_lookup_errors": artist_lookup_errors if artist_lookup_errors else None
+        }
+
+    # Get recommendations (the same seeds, however they were spelled, reuse
+    # a recent response)
+    cache_key = (
+        tuple(sorted(track_ids)), tuple(sorted(artist_ids)),
+        tuple(sorted(seed_genres[:5] if seed_genres else [])), limit
+    )
+    recommendations = recommendations_cache.get(cache_key)
+    if recommendations is None:
+        recommendations = track_records(sp.recommendations(
+            seed_tracks=track_ids[:5] if track_ids else None,
+            seed_artists=artist_ids[:5] if artist_ids else None,
+            seed_genres=seed_genres[:5] if seed_genres else None,
+            limit=limit
+        )["tracks"])
+        recommendations_cache.set(cache_key, recommendations)
+
+    formatted_recs = []
+    for track in recommendations:
+        formatted_recs.append({
+            "name": track["name"],
+            "artists": [artist["name"] for artist in track["artists"]],
+            "album": track["album"]["name"],
+            "id": track["id"],
+            "uri": track["uri"],
+            "popularity": track["popularity"],
+            "external_url": track["external_urls"]["spotify"]
+        })
+
+    result = {
+        "recommendations": formatted_recs,
+        "seeds_used": {
+            "tracks": len(track_ids),
+            "artists": len(artist_ids),
+            "genres": len(seed_genres) if seed_genres else 0
+        }
+    }
+
+    # Include any lookup errors if they occurred
+    if track_lookup_errors or artist_lookup_errors:
+        result["lookup_warnings"] = {
+            "track_errors": track_lookup_errors if track_lookup_errors else None,
+            "artist_errors": artist_lookup_errors if artist_lookup_errors else None
+        }
+
+    return result
+
+
+@register_tool(
+    "analyze_playlist",
+    "Analyze a Spotify playlist to get insights about its musical characteristics",
+    {
+        "type": "object",
+        "properties": {
+            "playlist_id": {
+                "type": "string",
+                "description": "Spotify playlist ID"
             }
-        ),
-        Tool(
-            name="compare_to_my_taste",
-            description="Compare a song collection to your actual Spotify listening history - find overlaps, differences, and get personalized insights",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "songs": {
-                        "type": "array",
-                        "items": {
-                            "type": "object",
-                            "properties": {
-                                "song_name": {"type": "string"},
-                                "artist_name": {"type": "string"}
-                            },
-                            "required": ["song_name"]
-                        },
-                        "description": "List of songs to compare to your taste"
-                    }
-                },
-                "required": ["songs"]
+        },
+        "required": ["playlist_id"]
+    },
+    timeout=SEARCH_TIMEOUT * 4, cache_ttl=60, user_data=True
+)
+def handle_analyze_playlist(arguments: dict) -> Any:
+    """Summarize popularity and explicit content of a playlist."""
+    playlist_id = arguments["playlist_id"]
+
+    # Get playlist details
+    playlist = sp.playlist(playlist_id)
+    tracks = playlist["tracks"]["items"]
+
+    # Collect track info
+    track_info = []
+    total_popularity = 0
+    explicit_count = 0
+
+    for item in tracks:
+        if item["track"]:
+            track = item["track"]
+            track_info.append({
+                "name": track["name"],
+                "artists": [a["name"] for a in track["artists"]],
+                "popularity": track["popularity"],
+                "explicit": track["explicit"]
+            })
+            total_popularity += track["popularity"]
+            if track["explicit"]:
+                explicit_count += 1
+
+    analysis = {
+        "name": playlist["name"],
+        "description": playlist["description"],
+        "owner": playlist["owner"]["display_name"],
+        "total_tracks": playlist["tracks"]["total"],
+        "followers": playlist["followers"]["total"],
+        "stats": {
+            "average_popularity": round(total_popularity / len(track_info), 1) if track_info else 0,
+            "explicit_songs": explicit_count,
+            "explicit_percentage": round((explicit_count / len(track_info) * 100), 1) if track_info else 0
+        },
+        "external_url": playlist["external_urls"]["spotify"]
+    }
+
+    return analysis
+
+
+def format_artist_info(artist: dict, top_tracks: list) -> dict:
+    """The get_artist_info response for one artist."""
+    info = {
+        "name": artist["name"],
+        "genres": artist["genres"],
+        "popularity": artist["popularity"],
+        "followers": artist["followers"]["total"],
+        "top_tracks": [
+            {
+                "name": track["name"],
+                "album": track["album"]["name"],
+                "popularity": track["popularity"],
+                "id": track["id"]
             }
-        ),
-        Tool(
-            name="find_whats_missing",
-            description="Check which songs from a collection are NOT in your Spotify library - find songs you haven't saved yet",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "songs": {
-                        "type": "array",
-                        "items": {
-                            "type": "object",
-                            "properties": {
-                                "song_name": {"type": "string"},
-                                "artist_name": {"type": "string"}
-                            },
-                            "required": ["song_name"]
-                        },
-                        "description": "List of songs to check against your library"
-                    }
-                },
-                "required": ["songs"]
+            for track in top_tracks[:10]
+        ],
+        "external_url": artist["external_urls"]["spotify"]
+    }
+
+    return info
+
+
+@register_tool(
+    "get_artist_info",
+    "Get detailed information about an artist including genres, popularity, and top tracks. Pass artist_ids or artist_names to get many artists in one call.",
+    {
+        "type": "object",
+        "properties": {
+            "artist_id": {
+                "type": "string",
+                "description": "Spotify artist ID"
+            },
+            "artist_ids": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Several Spotify artist IDs (e.g. a festival lineup)"
+            },
+            "artist_names": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Several artist names, looked up by search"
             }
-        ),
-    ]
-
-
-@app.call_tool()
-async def call_tool(name: str, arguments: Any) -> Sequence[TextContent]:
-    """Execute music analysis tools."""
-    
-    try:
-        if name == "search_tracks":
-            query = arguments["query"]
-            limit = arguments.get("limit", 10)
-            
-            results = sp.search(q=query, type="track", limit=limit)
-            tracks = results["tracks"]["items"]
-            
-            formatted_results = []
-            for track in tracks:
-                formatted_results.append({
-                    "name": track["name"],
-                    "artists": [artist["name"] for artist in track["artists"]],
-                    "album": track["album"]["name"],
-                    "id": track["id"],
-                    "uri": track["uri"],
-                    "popularity": track["popularity"],
-                    "preview_url": track.get("preview_url"),
-                    "external_url": track["external_urls"]["spotify"]
-                })
-            
-            return [TextContent(
-                type="text",
-                text=json.dumps(formatted_results, indent=2)
-            )]
-
-        elif name == "get_recommendations":
-            seed_tracks_input = arguments.get("seed_tracks", [])
-            seed_artists_input = arguments.get("seed_artists", [])
-            seed_genres = arguments.get("seed_genres", [])
-            limit = arguments.get("limit", 20)
-
-            # Look up track IDs from song names
-            track_ids = []
-            track_lookup_errors = []
-            for track_data in seed_tracks_input[:5]:
-                song_name = track_data["song_name"]
-                artist_name = track_data.get("artist_name", "")
-
-                query = song_name
-                if artist_name:
-                    query += f" artist:{artist_name}"
-
-                search_results = sp.search(q=query, type="track", limit=1)
-                tracks = search_results["tracks"]["items"]
-
-                if tracks:
-                    track_ids.append(tracks[0]["id"])
-                else:
-                    track_lookup_errors.append(f"Track not found: {query}")
-
-            # Look up artist IDs from artist names
-            artist_ids = []
-            artist_lookup_errors = []
-            for artist_name in seed_artists_input[:5]:
-                search_results = sp.search(q=f"artist:{artist_name}", type="artist", limit=1)
-                artists = search_results["artists"]["items"]
-
-                if artists:
-                    artist_ids.append(artists[0]["id"])
-                else:
-                    artist_lookup_errors.append(f"Artist not found: {artist_name}")
-
-            # Ensure we have at least one seed
-            if not track_ids and not artist_ids and not seed_genres:
-                return [TextContent(
-                    type="text",
-                    text=json.dumps({
-                        "error": "At least one seed (track, artist, or genre) is required",
-                        "track_lookup_errors": track_lookup_errors if track_lookup_errors else None,
-                        "artist_lookup_errors": artist_lookup_errors if artist_lookup_errors else None
-                    }, indent=2)
-                )]
-
-            # Get recommendations
-            recommendations = sp.recommendations(
-                seed_tracks=track_ids[:5] if track_ids else None,
-                seed_artists=artist_ids[:5] if artist_ids else None,
-                seed_genres=seed_genres[:5] if seed_genres else None,
-                limit=limit
-            )
+        },
+        "required": []
+    },
+    max_concurrency=8, timeout=SEARCH_TIMEOUT * 4, cache_ttl=3600,
+    detail_sections=("artists",)
+)
+def handle_get_artist_info(arguments: dict) -> Any:
+    """Return artist details and top tracks for one artist or many."""
+    if arguments.get("artist_id"):
+        artist_id = arguments["artist_id"]
+        return format_artist_info(get_artist(artist_id), get_artist_top_tracks(artist_id))
+
+    errors = []
+    artist_ids = list(arguments.get("artist_ids") or [])
+
+    names = arguments.get("artist_names") or []
+    for name, artist_id in zip(names, run_concurrently(resolve_artist_name, names)):
+        if artist_id is None:
+            errors.append(f"Artist not found: {name}")
+        else:
+            artist_ids.append(artist_id)
 
-            formatted_recs = []
-            for track in recommendations["tracks"]:
-                formatted_recs.append({
-                    "name": track["name"],
-                    "artists": [artist["name"] for artist in track["artists"]],
-                    "album": track["album"]["name"],
-                    "id": track["id"],
-                    "uri": track["uri"],
-                    "popularity": track["popularity"],
-                    "external_url": track["external_urls"]["spotify"]
-                })
-
-            result = {
-                "recommendations": formatted_recs,
-                "seeds_used": {
-                    "tracks": len(track_ids),
-                    "artists": len(artist_ids),
-                    "genres": len(seed_genres) if seed_genres else 0
-                }
-            }
+    if not artist_ids and not errors:
+        raise ValueError("Provide 'artist_id', 'artist_ids' or 'artist_names'")
 
-            # Include any lookup errors if they occurred
-            if track_lookup_errors or artist_lookup_errors:
-                result["lookup_warnings"] = {
-                    "track_errors": track_lookup_errors if track_lookup_errors else None,
-                    "artist_errors": artist_lookup_errors if artist_lookup_errors else None
-                }
-
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
-        
-        elif name == "analyze_playlist":
-            playlist_id = arguments["playlist_id"]
-
-            # Get playlist details
-            playlist = sp.playlist(playlist_id)
-            tracks = playlist["tracks"]["items"]
-
-            # Collect track info
-            track_info = []
-            total_popularity = 0
-            explicit_count = 0
-
-            for item in tracks:
-                if item["track"]:
-                    track = item["track"]
-                    track_info.append({
-                        "name": track["name"],
-                        "artists": [a["name"] for a in track["artists"]],
-                        "popularity": track["popularity"],
-                        "explicit": track["explicit"]
-                    })
-                    total_popularity += track["popularity"]
-                    if track["explicit"]:
-                        explicit_count += 1
-
-            analysis = {
-                "name": playlist["name"],
-                "description": playlist["description"],
-                "owner": playlist["owner"]["display_name"],
-                "total_tracks": playlist["tracks"]["total"],
-                "followers": playlist["followers"]["total"],
-                "stats": {
-                    "average_popularity": round(total_popularity / len(track_info), 1) if track_info else 0,
-                    "explicit_songs": explicit_count,
-                    "explicit_percentage": round((explicit_count / len(track_info) * 100), 1) if track_info else 0
-                },
-                "external_url": playlist["external_urls"]["spotify"]
-            }
+    artists = get_artists(artist_ids)
+    found_ids = []
+    for artist_id in dict.fromkeys(artist_ids):
+        if artist_id in artists:
+            found_ids.append(artist_id)
+        else:
+            errors.append(f"Unknown artist ID: {artist_id}")
+
+    def top_tracks_or_none(artist_id):
+        try:
+            return get_artist_top_tracks(artist_id)
+        except Exception as e:
+            errors.append(f"Top tracks failed for {artist_id}: {e}")
+            return []
+
+    top_tracks = run_concurrently(top_tracks_or_none, found_ids)
+
+    return {
+        "artists": [
+            {"id": artist_id, **format_artist_info(artists[artist_id], tracks)}
+            for artist_id, tracks in zip(found_ids, top_tracks)
+        ],
+        "summary": {
+            "artists_requested": len(dict.fromkeys(arguments.get("artist_ids") or [])) + len(names),
+            "artists_found": len(found_ids)
+        },
+        "errors": errors if errors else None
+    }
+
+
+@register_tool(
+    "analyze_explicitness",
+    "Analyze explicit content in a collection of songs - find out how many songs have explicit lyrics",
+    {
+        "type": "object",
+        "properties": {
+            "songs": songs_schema("List of songs to check for explicit content"),
+            "songs_source": SONGS_SOURCE_SCHEMA,
+            "songs_offset": SONGS_OFFSET_SCHEMA,
+            "collection_id": COLLECTION_ID_SCHEMA,
+            "time_budget_seconds": TIME_BUDGET_SCHEMA
+        },
+        "required": []
+    },
+    max_concurrency=COLLECTION_TOOL_CONCURRENCY, timeout=COLLECTION_TOOL_TIMEOUT, cache_ttl=300,
+    detail_sections=("clean_songs", "explicit_songs")
+)
+def handle_analyze_explicitness(arguments: dict) -> Any:
+    """Split a song collection into explicit and clean tracks."""
+    analysis = analyze_collection(arguments, with_genres=False)
+    errors = analysis.errors
+
+    explicit_songs = []
+    clean_songs = []
+
+    for track in analysis.tracks:
+        song_info = {
+            "name": track["name"],
+            "artists": track["artists"],
+            "explicit": track["explicit"],
+            "popularity": track["popularity"]
+        }
+
+        if track["explicit"]:
+            explicit_songs.append(song_info)
+        else:
+            clean_songs.append(song_info)
+
+    total_songs = len(explicit_songs) + len(clean_songs)
+    explicit_percentage = (len(explicit_songs) / total_songs * 100) if total_songs > 0 else 0
+
+    result = {
+        "summary": {
+            "total_songs_analyzed": total_songs,
+            "explicit_songs_count": len(explicit_songs),
+            "clean_songs_count": len(clean_songs),
+            "explicit_percentage": round(explicit_percentage, 1),
+            "rating": "Family-Friendly" if explicit_percentage == 0 else 
+                      "Mostly Clean" if explicit_percentage < 25 else
+                      "Mixed Content" if explicit_percentage < 50 else
+                      "Mostly Explicit" if explicit_percentage < 75 else
+                      "Explicit",
+            "errors": errors if errors else None
+        },
+        "explicit_songs": explicit_songs,
+        "clean_songs": clean_songs
+    }
+
+    return analysis.annotate(result)
+
+
+@register_tool(
+    "analyze_collection_diversity",
+    "Analyze diversity in a music collection - unique artists, genre spread, era distribution, popularity range",
+    {
+        "type": "object",
+        "properties": {
+            "songs": songs_schema("List of songs to analyze for diversity"),
+            "songs_source": SONGS_SOURCE_SCHEMA,
+            "songs_offset": SONGS_OFFSET_SCHEMA,
+            "collection_id": COLLECTION_ID_SCHEMA,
+            "time_budget_seconds": TIME_BUDGET_SCHEMA
+        },
+        "required": []
+    },
+    max_concurrency=COLLECTION_TOOL_CONCURRENCY, timeout=COLLECTION_TOOL_TIMEOUT, cache_ttl=300,
+    detail_sections=("tracks", "genre_diversity.genres")
+)
+def handle_analyze_collection_diversity(arguments: dict) -> Any:
+    """Measure artist, genre, popularity and era diversity."""
+    analysis = analyze_collection(arguments)
+    aggregates = analysis.aggregates
+    errors = analysis.errors
+
+    track_info = [
+        {
+            "name": track["name"],
+            "artists": track["artists"],
+            "popularity": track["popularity"],
+            "release_year": track["year"]
+        }
+        for track in analysis.tracks
+    ]
 
-            return [TextContent(
-                type="text",
-                text=json.dumps(analysis, indent=2)
-            )]
-        
-        elif name == "get_artist_info":
-            artist_id = arguments["artist_id"]
-            
-            # Get artist details
-            artist = sp.artist(artist_id)
-            
-            # Get top tracks
-            top_tracks = sp.artist_top_tracks(artist_id)
-            
-            info = {
-                "name": artist["name"],
-                "genres": artist["genres"],
-                "popularity": artist["popularity"],
-                "followers": artist["followers"]["total"],
-                "top_tracks": [
-                    {
-                        "name": track["name"],
-                        "album": track["album"]["name"],
-                        "popularity": track["popularity"],
-                        "id": track["id"]
-                    }
-                    for track in top_tracks["tracks"][:10]
-                ],
-                "external_url": artist["external_urls"]["spotify"]
+    # Calculate diversity metrics from the (mergeable) aggregates
+    unique_artists = len(aggregates.artists)
+    total_artists = sum(aggregates.artists.values())
+    artist_diversity = unique_artists / total_artists if total_artists > 0 else 0
+
+    all_genres = set(aggregates.genres)
+    unique_genres = len(all_genres)
+
+    popularities = aggregates.popularity
+    popularity_range = max(popularities) - min(popularities) if popularities else 0
+    avg_popularity = (sum(p * n for p, n in popularities.items()) / aggregates.songs
+                      if popularities else 0)
+
+    release_years = aggregates.years
+    year_range = max(release_years) - min(release_years) if release_years else 0
+
+    # Determine diversity level
+    if artist_diversity > 0.8 and unique_genres > 10:
+        diversity_level = "Very Diverse"
+    elif artist_diversity > 0.6 and unique_genres > 5:
+        diversity_level = "Diverse"
+    elif artist_diversity > 0.4:
+        diversity_level = "Moderately Diverse"
+    else:
+        diversity_level = "Low Diversity"
+
+    result = {
+        "summary": {
+            "diversity_level": diversity_level,
+            "total_songs": len(track_info),
+            "errors": errors if errors else None
+        },
+        "artist_diversity": {
+            "unique_artists": unique_artists,
+            "total_artist_appearances": total_artists,
+            "diversity_score": round(artist_diversity, 3),
+            "interpretation": "High" if artist_diversity > 0.7 else 
+                            "Medium" if artist_diversity > 0.4 else "Low"
+        },
+        "genre_diversity": {
+            "unique_genres": unique_genres,
+            "genres": sorted(list(all_genres)),
+            "interpretation": "Very Diverse" if unique_genres > 10 else
+                            "Diverse" if unique_genres > 5 else
+                            "Limited" if unique_genres > 2 else
+                            "Very Limited"
+        },
+        "popularity_distribution": {
+            "average_popularity": round(avg_popularity, 1),
+            "range": popularity_range,
+            "interpretation": "Mainstream" if avg_popularity > 70 else
+                            "Popular" if avg_popularity > 50 else
+                            "Mixed" if avg_popularity > 30 else
+                            "Underground/Niche"
+        },
+        "era_distribution": {
+            "year_range": year_range,
+            "earliest": min(release_years) if release_years else None,
+            "latest": max(release_years) if release_years else None,
+            "interpretation": "Multi-era" if year_range > 20 else
+                            "Modern" if (min(release_years) > 2010 if release_years else False) else
+                            "Recent-focused"
+        },
+        "tracks": track_info
+    }
+
+    return analysis.annotate(result)
+
+
+@register_tool(
+    "get_top_artists_from_collection",
+    "Find the most frequent artists in a song collection and their contribution percentage",
+    {
+        "type": "object",
+        "properties": {
+            "songs": songs_schema("List of songs to analyze"),
+            "songs_source": SONGS_SOURCE_SCHEMA,
+            "songs_offset": SONGS_OFFSET_SCHEMA,
+            "collection_id": COLLECTION_ID_SCHEMA,
+            "time_budget_seconds": TIME_BUDGET_SCHEMA,
+            "top_n": {
+                "type": "integer",
+                "description": "Number of top artists to return",
+                "default": 10
+            },
+            "approximate": APPROXIMATE_SCHEMA,
+            "error_rate": ERROR_RATE_SCHEMA
+        },
+        "required": []
+    },
+    max_concurrency=COLLECTION_TOOL_CONCURRENCY, timeout=COLLECTION_TOOL_TIMEOUT, cache_ttl=300,
+    detail_sections=("top_artists",)
+)
+def handle_get_top_artists_from_collection(arguments: dict) -> Any:
+    """Rank the most frequent artists in a collection."""
+    top_n = arguments.get("top_n", 10)
+    if arguments.get("approximate"):
+        return approximate_top_artists(arguments, top_n)
+    analysis = analyze_collection(arguments, with_genres=False)
+    errors = analysis.errors
+    artist_count = analysis.in_list_order(analysis.aggregates.artists, lambda track: track["artists"])
+
+    # Song titles per artist (only needed for the artists that are shown)
+    artist_songs = {}
+    for track in analysis.tracks:
+        for artist_name in track["artists"]:
+            artist_songs.setdefault(artist_name, []).append(track["name"])
+
+    # Sort by frequency
+    sorted_artists = sorted(
+        artist_count.items(),
+        key=lambda x: x[1],
+        reverse=True
+    )[:top_n]
+
+    total_songs = sum(artist_count.values())
+
+    top_artists = []
+    for artist_name, count in sorted_artists:
+        percentage = (count / total_songs * 100) if total_songs > 0 else 0
+        top_artists.append({
+            "artist": artist_name,
+            "song_count": count,
+            "percentage": round(percentage, 1),
+            "songs": artist_songs[artist_name]
+        })
+
+    result = {
+        "summary": {
+            "total_songs_analyzed": len(analysis.tracks),
+            "unique_artists": len(artist_count),
+            "top_artist": sorted_artists[0][0] if sorted_artists else None,
+            "errors": errors if errors else None
+        },
+        "top_artists": top_artists,
+        "distribution_type": "Focused" if top_artists and top_artists[0]["percentage"] > 40 else
+                           "Balanced" if len(set(artist_count.values())) > len(artist_count) * 0.5 else
+                           "Varied"
+    }
+
+    return analysis.annotate(result)
+
+
+def approximate_top_artists(arguments: dict, top_n: int) -> dict:
+    """get_top_artists_from_collection in fixed memory (approximate mode).
+
+    Song titles per artist are not kept; counts are upper-bound estimates
+    that exceed the true count by at most count_error_bound.
+    """
+    sketch = sketch_collection(arguments, with_genres=False, top_n=top_n)
+    top_artists = [
+        {"artist": artist, "song_count": count, "percentage": percentage}
+        for artist, count, percentage in sketch.top(sketch.artists, top_n)
+    ]
+    counts = [artist["song_count"] for artist in top_artists]
+
+    result = {
+        "summary": {
+            "total_songs_analyzed": sketch.songs,
+            "unique_artists": sketch.unique_artists.count(),
+            "top_artist": top_artists[0]["artist"] if top_artists else None,
+            "not_found": sketch.not_found,
+            "errors": sketch.errors if sketch.errors else None
+        },
+        "top_artists": top_artists,
+        # Judged on the top artists only: the full distribution isn't kept
+        "distribution_type": "Focused" if top_artists and top_artists[0]["percentage"] > 40 else
+                           "Balanced" if len(set(counts)) > len(counts) * 0.5 else
+                           "Varied"
+    }
+    return sketch.annotate(result, sketch.artists, sketch.unique_artists)
+
+
+def genre_style(top_genre: str) -> str:
+    """Broad style name for a collection's most frequent genre."""
+    if "pop" in top_genre:
+        return "Pop-oriented"
+    elif "rock" in top_genre:
+        return "Rock-focused"
+    elif "hip hop" in top_genre or "rap" in top_genre:
+        return "Hip-Hop/Rap"
+    elif "electronic" in top_genre or "edm" in top_genre:
+        return "Electronic"
+    elif "indie" in top_genre or "alternative" in top_genre:
+        return "Indie/Alternative"
+    elif "r&b" in top_genre or "soul" in top_genre:
+        return "R&B/Soul"
+    elif "country" in top_genre:
+        return "Country"
+    elif "jazz" in top_genre:
+        return "Jazz"
+    elif "classical" in top_genre:
+        return "Classical"
+    return top_genre.title()
+
+
+def genre_diversity(unique_genres: int) -> str:
+    return ("Very Diverse" if unique_genres > 20 else
+            "Diverse" if unique_genres > 10 else
+            "Moderately Diverse" if unique_genres > 5 else
+            "Limited")
+
+
+def approximate_genres(arguments: dict) -> dict:
+    """analyze_genres_in_collection in fixed memory (approximate mode).
+
+    Per-track genres are not listed; counts are upper-bound estimates that
+    exceed the true count by at most count_error_bound.
+    """
+    sketch = sketch_collection(arguments)
+    top_genres = [
+        {"genre": genre, "count": count, "percentage": percentage}
+        for genre, count, percentage in sketch.top(sketch.genres, 15)
+    ]
+    unique_genres = sketch.unique_genres.count()
+    total_genre_tags = sketch.genres.total
+
+    result = {
+        "summary": {
+            "total_songs_analyzed": sketch.songs,
+            "unique_genres": unique_genres,
+            "dominant_style": genre_style(top_genres[0]["genre"]) if top_genres else "Unknown",
+            "genre_diversity": genre_diversity(unique_genres),
+            "not_found": sketch.not_found,
+            "errors": sketch.errors if sketch.errors else None
+        },
+        "top_genres": top_genres,
+        "genre_distribution": {
+            "total_genre_tags": total_genre_tags,
+            "average_genres_per_song": round(total_genre_tags / sketch.songs, 1) if sketch.songs else 0
+        }
+    }
+    return sketch.annotate(result, sketch.genres, sketch.unique_genres)
+
+
+@register_tool(
+    "analyze_genres_in_collection",
+    "Analyze genre distribution in a music collection - find dominant genres, genre diversity, and trends",
+    {
+        "type": "object",
+        "properties": {
+            "songs": songs_schema("List of songs to analyze for genres"),
+            "songs_source": SONGS_SOURCE_SCHEMA,
+            "songs_offset": SONGS_OFFSET_SCHEMA,
+            "collection_id": COLLECTION_ID_SCHEMA,
+            "time_budget_seconds": TIME_BUDGET_SCHEMA,
+            "approximate": APPROXIMATE_SCHEMA,
+            "error_rate": ERROR_RATE_SCHEMA
+        },
+        "required": []
+    },
+    max_concurrency=COLLECTION_TOOL_CONCURRENCY, timeout=COLLECTION_TOOL_TIMEOUT, cache_ttl=300,
+    detail_sections=("tracks_with_genres", "top_genres")
+)
+def handle_analyze_genres_in_collection(arguments: dict) -> Any:
+    """Break a collection down by artist genres."""
+    if arguments.get("approximate"):
+        return approximate_genres(arguments)
+    analysis = analyze_collection(arguments)
+    errors = analysis.errors
+    genre_count = analysis.in_list_order(
+        analysis.aggregates.genres,
+        lambda track: (genre for genres in track["artist_genres"] for genre in genres)
+    )
+
+    track_info = []
+    for track in analysis.tracks:
+        track_genres = [genre for genres in track["artist_genres"] for genre in genres]
+        track_info.append({
+            "name": track["name"],
+            "artists": track["artists"],
+            "genres": list(set(track_genres)) if track_genres else ["Unknown"]
+        })
+
+    # Sort genres by frequency
+    sorted_genres = sorted(
+        genre_count.items(),
+        key=lambda x: x[1],
+        reverse=True
+    )
+
+    # Calculate genre diversity
+    total_genre_tags = sum(genre_count.values())
+    unique_genres = len(genre_count)
+
+    # Top genres with percentages
+    top_genres = []
+    for genre, count in sorted_genres[:15]:
+        percentage = (count / total_genre_tags * 100) if total_genre_tags > 0 else 0
+        top_genres.append({
+            "genre": genre,
+            "count": count,
+            "percentage": round(percentage, 1)
+        })
+
+    dominant_style = genre_style(sorted_genres[0][0]) if sorted_genres else "Unknown"
+
+    result = {
+        "summary": {
+            "total_songs_analyzed": len(track_info),
+            "unique_genres": unique_genres,
+            "dominant_style": dominant_style,
+            "genre_diversity": genre_diversity(unique_genres),
+            "errors": errors if errors else None
+        },
+        "top_genres": top_genres,
+        "genre_distribution": {
+            "total_genre_tags": total_genre_tags,
+            "average_genres_per_song": round(total_genre_tags / len(track_info), 1) if track_info else 0
+        },
+        "tracks_with_genres": track_info
+    }
+
+    return analysis.annotate(result)
+
+
+COLLECTION_SIDE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "songs": songs_schema("Songs in this collection"),
+        "songs_source": SONGS_SOURCE_SCHEMA
+    },
+    "description": "A collection: inline 'songs' or a 'songs_source' file/URI"
+}
+
+
+def resolve_collection_tracks(side: dict, errors: list) -> tuple[dict, int]:
+    """Resolve one side of a diff to {track_id: track}; returns it and the row count.
+
+    Each distinct song is resolved once, however often it appears.
+    """
+    tracks = {}
+    seen = set()
+    rows = 0
+    for song_data in collection_songs(side):
+        rows += 1
+        key = CatalogIndex.query_key(song_data["song_name"], song_data.get("artist_name") or "")
+        if key in seen:
+            continue
+        seen.add(key)
+        track = resolve_song(song_data)
+        if track is None:
+            errors.append(f"Not found: {song_query(song_data)}")
+        else:
+            tracks[track["id"]] = track
+    return tracks, rows
+
+
+def set_diff(a: set, b: set, label, max_items: int) -> dict:
+    """Added/removed/common counts, Jaccard similarity and capped item lists."""
+    union = len(a | b)
+    return {
+        "added": len(b - a),
+        "removed": len(a - b),
+        "common": len(a & b),
+        "jaccard": round(len(a & b) / union, 4) if union else 1.0,
+        "added_items": sorted(label(x) for x in itertools.islice(b - a, max_items)),
+        "removed_items": sorted(label(x) for x in itertools.islice(a - b, max_items))
+    }
+
+
+@register_tool(
+    "diff_collections",
+    "Compare two song collections (e.g. two event RSVP lists): added, removed and common tracks, artists and genres, with Jaccard similarity",
+    {
+        "type": "object",
+        "properties": {
+            "collection_a": COLLECTION_SIDE_SCHEMA,
+            "collection_b": COLLECTION_SIDE_SCHEMA,
+            "include_genres": {
+                "type": "boolean",
+                "description": "Also compare artist genres (one extra request per 50 new artists)",
+                "default": True
+            },
+            "max_items": {
+                "type": "integer",
+                "description": "Maximum names listed per added/removed list (counts are always complete)",
+                "default": 50
             }
-            
-            return [TextContent(
-                type="text",
-                text=json.dumps(info, indent=2)
-            )]
-
-        elif name == "analyze_explicitness":
-            songs = arguments["songs"]
-            
-            explicit_songs = []
-            clean_songs = []
-            errors = []
-            
-            for song_data in songs:
-                song_name = song_data["song_name"]
-                artist_name = song_data.get("artist_name", "")
-                
-                # Build search query
-                query = song_name
-                if artist_name:
-                    query += f" artist:{artist_name}"
-                
-                # Search for the song
-                search_results = sp.search(q=query, type="track", limit=1)
-                tracks = search_results["tracks"]["items"]
-                
-                if not tracks:
-                    errors.append(f"Not found: {query}")
-                    continue
-                
-                track = tracks[0]
-                
-                song_info = {
-                    "name": track["name"],
-                    "artists": [a["name"] for a in track["artists"]],
-                    "explicit": track["explicit"],
-                    "popularity": track["popularity"]
-                }
-                
-                if track["explicit"]:
-                    explicit_songs.append(song_info)
-                else:
-                    clean_songs.append(song_info)
-            
-            total_songs = len(explicit_songs) + len(clean_songs)
-            explicit_percentage = (len(explicit_songs) / total_songs * 100) if total_songs > 0 else 0
-            
-            result = {
-                "summary": {
-                    "total_songs_analyzed": total_songs,
-                    "explicit_songs_count": len(explicit_songs),
-                    "clean_songs_count": len(clean_songs),
-                    "explicit_percentage": round(explicit_percentage, 1),
-                    "rating": "Family-Friendly" if explicit_percentage == 0 else 
-                              "Mostly Clean" if explicit_percentage < 25 else
-                              "Mixed Content" if explicit_percentage < 50 else
-                              "Mostly Explicit" if explicit_percentage < 75 else
-                              "Explicit",
-                    "errors": errors if errors else None
-                },
-                "explicit_songs": explicit_songs,
-                "clean_songs": clean_songs
+        },
+        "required": ["collection_a", "collection_b"]
+    },
+    max_concurrency=COLLECTION_TOOL_CONCURRENCY, timeout=COLLECTION_TOOL_TIMEOUT, cache_ttl=300,
+    detail_sections=("genres.added_items", "genres.removed_items", "artists.added_items",
+                     "artists.removed_items", "tracks.added_items", "tracks.removed_items")
+)
+def handle_diff_collections(arguments: dict) -> Any:
+    """Diff two collections by resolved track, artist and genre sets."""
+    max_items = arguments.get("max_items", 50)
+    errors = []
+    tracks_a, rows_a = resolve_collection_tracks(arguments["collection_a"], errors)
+    tracks_b, rows_b = resolve_collection_tracks(arguments["collection_b"], errors)
+
+    artist_names = {}
+    artists_a = set()
+    artists_b = set()
+    for tracks, artist_ids in ((tracks_a, artists_a), (tracks_b, artists_b)):
+        for track in tracks.values():
+            for artist in track["artists"]:
+                artist_ids.add(artist["id"])
+                artist_names[artist["id"]] = artist["name"]
+
+    def track_label(track_id):
+        track = tracks_a.get(track_id) or tracks_b[track_id]
+        return f"{track['name']} - {', '.join(a['name'] for a in track['artists'])}"
+
+    result = {
+        "summary": {
+            "collection_a": {"rows": rows_a, "tracks": len(tracks_a), "artists": len(artists_a)},
+            "collection_b": {"rows": rows_b, "tracks": len(tracks_b), "artists": len(artists_b)},
+            "errors": errors if errors else None
+        },
+        "tracks": set_diff(set(tracks_a), set(tracks_b), track_label, max_items),
+        "artists": set_diff(artists_a, artists_b, artist_names.get, max_items)
+    }
+
+    if arguments.get("include_genres", True):
+        artists = get_artists(list(artists_a | artists_b))
+        genres_a = {g for a in artists_a if a in artists for g in artists[a]["genres"]}
+        genres_b = {g for a in artists_b if a in artists for g in artists[a]["genres"]}
+        result["summary"]["collection_a"]["genres"] = len(genres_a)
+        result["summary"]["collection_b"]["genres"] = len(genres_b)
+        result["genres"] = set_diff(genres_a, genres_b, str, max_items)
+
+    return result
+
+
+@register_tool(
+    "index_playlists_for_similarity",
+    "Add playlists (or a song collection) to the local similarity index used by find_similar_playlists. Unchanged playlists are skipped, changed ones re-indexed.",
+    {
+        "type": "object",
+        "properties": {
+            "playlist_ids": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Spotify playlist IDs to index"
+            },
+            "collection_id": {
+                "type": "string",
+                "description": "Name to index 'songs' / 'songs_source' under"
+            },
+            "songs": songs_schema("Songs of the collection to index under collection_id"),
+            "songs_source": SONGS_SOURCE_SCHEMA,
+            "remove": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Keys to drop from the index (playlist:<id> or collection:<name>)"
             }
-            
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
-        
-        elif name == "analyze_collection_diversity":
-            songs = arguments["songs"]
-            
-            all_artists = []
-            all_genres = set()
-            popularities = []
-            release_years = []
-            track_info = []
-            errors = []
-            
-            for song_data in songs:
-                song_name = song_data["song_name"]
-                artist_name = song_data.get("artist_name", "")
-                
-                # Build search query
-                query = song_name
-                if artist_name:
-                    query += f" artist:{artist_name}"
-                
-                # Search for the song
-                search_results = sp.search(q=query, type="track", limit=1)
-                tracks = search_results["tracks"]["items"]
-                
-                if not tracks:
-                    errors.append(f"Not found: {query}")
-                    continue
-                
-                track = tracks[0]
-                
-                # Collect artist names
-                for artist in track["artists"]:
-                    all_artists.append(artist["name"])
-                    
-                    # Get artist genres
-                    try:
-                        artist_info = sp.artist(artist["id"])
-                        all_genres.update(artist_info["genres"])
-                    except:
-                        pass
-                
-                # Collect popularity
-                popularities.append(track["popularity"])
-                
-                # Get release year
-                release_date = track["album"]["release_date"]
-                year = None
-                if release_date:
-                    year = int(release_date.split("-")[0])
-                    release_years.append(year)
-                
-                track_info.append({
-                    "name": track["name"],
-                    "artists": [a["name"] for a in track["artists"]],
-                    "popularity": track["popularity"],
-                    "release_year": year
-                })
-            
-            # Calculate diversity metrics
-            unique_artists = len(set(all_artists))
-            total_artists = len(all_artists)
-            artist_diversity = unique_artists / total_artists if total_artists > 0 else 0
-            
-            unique_genres = len(all_genres)
-            
-            popularity_range = max(popularities) - min(popularities) if popularities else 0
-            avg_popularity = sum(popularities) / len(popularities) if popularities else 0
-            
-            year_range = max(release_years) - min(release_years) if release_years else 0
-            
-            # Determine diversity level
-            if artist_diversity > 0.8 and unique_genres > 10:
-                diversity_level = "Very Diverse"
-            elif artist_diversity > 0.6 and unique_genres > 5:
-                diversity_level = "Diverse"
-            elif artist_diversity > 0.4:
-                diversity_level = "Moderately Diverse"
-            else:
-                diversity_level = "Low Diversity"
-            
-            result = {
-                "summary": {
-                    "diversity_level": diversity_level,
-                    "total_songs": len(track_info),
-                    "errors": errors if errors else None
-                },
-                "artist_diversity": {
-                    "unique_artists": unique_artists,
-                    "total_artist_appearances": total_artists,
-                    "diversity_score": round(artist_diversity, 3),
-                    "interpretation": "High" if artist_diversity > 0.7 else 
-                                    "Medium" if artist_diversity > 0.4 else "Low"
-                },
-                "genre_diversity": {
-                    "unique_genres": unique_genres,
-                    "genres": sorted(list(all_genres)),
-                    "interpretation": "Very Diverse" if unique_genres > 10 else
-                                    "Diverse" if unique_genres > 5 else
-                                    "Limited" if unique_genres > 2 else
-                                    "Very Limited"
-                },
-                "popularity_distribution": {
-                    "average_popularity": round(avg_popularity, 1),
-                    "range": popularity_range,
-                    "interpretation": "Mainstream" if avg_popularity > 70 else
-                                    "Popular" if avg_popularity > 50 else
-                                    "Mixed" if avg_popularity > 30 else
-                                    "Underground/Niche"
-                },
-                "era_distribution": {
-                    "year_range": year_range,
-                    "earliest": min(release_years) if release_years else None,
-                    "latest": max(release_years) if release_years else None,
-                    "interpretation": "Multi-era" if year_range > 20 else
-                                    "Modern" if (min(release_years) > 2010 if release_years else False) else
-                                    "Recent-focused"
-                },
-                "tracks": track_info
+        },
+        "required": []
+    },
+    max_concurrency=1, timeout=COLLECTION_TOOL_TIMEOUT, user_data=True
+)
+def handle_index_playlists_for_similarity(arguments: dict) -> Any:
+    """Index playlists/collections as MinHash signatures, skipping unchanged ones."""
+    similarity_index = similarity_index_for(current_account.get())
+    errors = []
+    indexed = []
+    unchanged = []
+
+    def index_playlist(playlist_id):
+        key = f"playlist:{playlist_id}"
+        try:
+            playlist = sp.playlist(playlist_id, fields="name,snapshot_id")
+            known = similarity_index.meta(key)
+            # A playlist's snapshot_id changes whenever its tracks do
+            if known and known.get("snapshot_id") == playlist["snapshot_id"]:
+                unchanged.append(key)
+                return
+            tracks = playlist_tracks(playlist_id)
+            similarity_index.add(key, track_tokens(tracks), {
+                "name": playlist["name"],
+                "snapshot_id": playlist["snapshot_id"],
+                "tracks": len(tracks)
+            })
+            indexed.append(key)
+        except Exception as e:
+            errors.append(f"{key}: {e}")
+
+    run_concurrently(index_playlist, arguments.get("playlist_ids") or [])
+
+    if arguments.get("collection_id"):
+        key = f"collection:{arguments['collection_id']}"
+        tracks = collection_tracks(arguments, errors)
+        similarity_index.add(key, track_tokens(tracks), {
+            "name": arguments["collection_id"],
+            "tracks": len(tracks)
+        })
+        indexed.append(key)
+
+    removed = []
+    for key in arguments.get("remove") or []:
+        if key in similarity_index:
+            similarity_index.remove(key)
+            removed.append(key)
+
+    save_similarity_index()
+    return {
+        "indexed": indexed,
+        "unchanged": len(unchanged),
+        "removed": removed,
+        "index_size": len(similarity_index),
+        "errors": errors if errors else None
+    }
+
+
+@register_tool(
+    "find_similar_playlists",
+    "Find the indexed playlists/collections most similar to a playlist or a list of songs (by shared tracks and artists)",
+    {
+        "type": "object",
+        "properties": {
+            "playlist_id": {
+                "type": "string",
+                "description": "Spotify playlist to compare against the index"
+            },
+            "songs": songs_schema("Songs to compare against the index (instead of playlist_id)"),
+            "songs_source": SONGS_SOURCE_SCHEMA,
+            "top_n": {
+                "type": "integer",
+                "description": "Number of matches to return",
+                "default": 10
+            },
+            "min_similarity": {
+                "type": "number",
+                "description": "Smallest estimated Jaccard similarity to report (0-1)",
+                "default": 0.1
             }
-            
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
-        
-        elif name == "get_top_artists_from_collection":
-            songs = arguments["songs"]
-            top_n = arguments.get("top_n", 10)
-            
-            artist_count = {}
-            artist_songs = {}
-            errors = []
-            
-            for song_data in songs:
-                song_name = song_data["song_name"]
-                artist_name = song_data.get("artist_name", "")
-                
-                # Build search query
-                query = song_name
-                if artist_name:
-                    query += f" artist:{artist_name}"
-                
-                # Search for the song
-                search_results = sp.search(q=query, type="track", limit=1)
-                tracks = search_results["tracks"]["items"]
-                
-                if not tracks:
-                    errors.append(f"Not found: {query}")
-                    continue
-                
-                track = tracks[0]
-                
-                # Count each artist
-                for artist in track["artists"]:
-                    artist_name = artist["name"]
-                    artist_count[artist_name] = artist_count.get(artist_name, 0) + 1
-                    
-                    if artist_name not in artist_songs:
-                        artist_songs[artist_name] = []
-                    artist_songs[artist_name].append(track["name"])
-            
-            # Sort by frequency
-            sorted_artists = sorted(
-                artist_count.items(),
-                key=lambda x: x[1],
-                reverse=True
-            )[:top_n]
-            
-            total_songs = sum(artist_count.values())
-            
-            top_artists = []
-            for artist_name, count in sorted_artists:
-                percentage = (count / total_songs * 100) if total_songs > 0 else 0
-                top_artists.append({
-                    "artist": artist_name,
-                    "song_count": count,
-                    "percentage": round(percentage, 1),
-                    "songs": artist_songs[artist_name]
-                })
-            
-            result = {
-                "summary": {
-                    "total_songs_analyzed": len(songs) - len(errors),
-                    "unique_artists": len(artist_count),
-                    "top_artist": sorted_artists[0][0] if sorted_artists else None,
-                    "errors": errors if errors else None
-                },
-                "top_artists": top_artists,
-                "distribution_type": "Focused" if top_artists and top_artists[0]["percentage"] > 40 else
-                                   "Balanced" if len(set(artist_count.values())) > len(artist_count) * 0.5 else
-                                   "Varied"
+        },
+        "required": []
+    },
+    max_concurrency=COLLECTION_TOOL_CONCURRENCY, timeout=COLLECTION_TOOL_TIMEOUT,
+    user_data=True, detail_sections=("matches",)
+)
+def handle_find_similar_playlists(arguments: dict) -> Any:
+    """Rank the account's indexed playlists by estimated Jaccard similarity via LSH candidates."""
+    similarity_index = similarity_index_for(current_account.get())
+    errors = []
+    exclude = None
+    if arguments.get("playlist_id"):
+        tracks = playlist_tracks(arguments["playlist_id"])
+        exclude = f"playlist:{arguments['playlist_id']}"
+    else:
+        tracks = collection_tracks(arguments, errors)
+
+    matches, candidates = similarity_index.query(
+        track_tokens(tracks),
+        top_n=arguments.get("top_n", 10),
+        min_similarity=arguments.get("min_similarity", 0.1),
+        exclude=exclude
+    )
+    return {
+        "matches": [
+            {"key": key, "name": meta.get("name"), "similarity": round(score, 3), "tracks": meta.get("tracks")}
+            for key, score, meta in matches
+        ],
+        "summary": {
+            "query_tracks": len(tracks),
+            "index_size": len(similarity_index),
+            "candidates_scored": candidates,
+            "errors": errors if errors else None
+        }
+    }
+
+
+@register_tool(
+    "import_streaming_history",
+    "Import Spotify extended streaming history exports (Streaming_History_Audio_*.json): "
+    "count plays per track and save the played tracks as a collection for the other tools",
+    {
+        "type": "object",
+        "properties": {
+            "paths": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Export folders or Streaming_History*.json files on this machine"
+            },
+            "name": {
+                "type": "string",
+                "description": "Collection name to save the tracks as (music://collections/<name>)"
+            },
+            "min_ms_played": {
+                "type": "integer",
+                "description": "Plays shorter than this are not counted (Spotify counts a stream after 30 s)",
+                "default": DEFAULT_MIN_MS_PLAYED
+            },
+            "top_n": {
+                "type": "integer",
+                "description": "Number of most played tracks to return",
+                "default": 20
             }
-            
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
-        
-        elif name == "analyze_genres_in_collection":
-            songs = arguments["songs"]
-            
-            genre_count = {}
-            artist_genres_map = {}
-            track_info = []
-            errors = []
-            
-            for song_data in songs:
-                song_name = song_data["song_name"]
-                artist_name = song_data.get("artist_name", "")
-                
-                # Build search query
-                query = song_name
-                if artist_name:
-                    query += f" artist:{artist_name}"
-                
-                # Search for the song
-                search_results = sp.search(q=query, type="track", limit=1)
-                tracks = search_results["tracks"]["items"]
-                
-                if not tracks:
-                    errors.append(f"Not found: {query}")
-                    continue
-                
-                track = tracks[0]
-                track_genres = []
-                
-                # Get genres from all artists
-                for artist in track["artists"]:
-                    artist_name_key = artist["name"]
-                    
-                    # Cache artist info to avoid duplicate API calls
-                    if artist_name_key not in artist_genres_map:
-                        try:
-                            artist_info = sp.artist(artist["id"])
-                            artist_genres_map[artist_name_key] = artist_info["genres"]
-                        except:
-                            artist_genres_map[artist_name_key] = []
-                    
-                    artist_genres = artist_genres_map[artist_name_key]
-                    track_genres.extend(artist_genres)
-                    
-                    # Count genres
-                    for genre in artist_genres:
-                        genre_count[genre] = genre_count.get(genre, 0) + 1
-                
-                track_info.append({
-                    "name": track["name"],
-                    "artists": [a["name"] for a in track["artists"]],
-                    "genres": list(set(track_genres)) if track_genres else ["Unknown"]
-                })
-            
-            # Sort genres by frequency
-            sorted_genres = sorted(
-                genre_count.items(),
-                key=lambda x: x[1],
-                reverse=True
-            )
-            
-            # Calculate genre diversity
-            total_genre_tags = sum(genre_count.values())
-            unique_genres = len(genre_count)
-            
-            # Top genres with percentages
-            top_genres = []
-            for genre, count in sorted_genres[:15]:
-                percentage = (count / total_genre_tags * 100) if total_genre_tags > 0 else 0
-                top_genres.append({
-                    "genre": genre,
-                    "count": count,
-                    "percentage": round(percentage, 1)
-                })
-            
-            # Determine dominant style
-            if sorted_genres:
-                top_genre = sorted_genres[0][0]
-                if "pop" in top_genre:
-                    dominant_style = "Pop-oriented"
-                elif "rock" in top_genre:
-                    dominant_style = "Rock-focused"
-                elif "hip hop" in top_genre or "rap" in top_genre:
-                    dominant_style = "Hip-Hop/Rap"
-                elif "electronic" in top_genre or "edm" in top_genre:
-                    dominant_style = "Electronic"
-                elif "indie" in top_genre or "alternative" in top_genre:
-                    dominant_style = "Indie/Alternative"
-                elif "r&b" in top_genre or "soul" in top_genre:
-                    dominant_style = "R&B/Soul"
-                elif "country" in top_genre:
-                    dominant_style = "Country"
-                elif "jazz" in top_genre:
-                    dominant_style = "Jazz"
-                elif "classical" in top_genre:
-                    dominant_style = "Classical"
-                else:
-                    dominant_style = top_genre.title()
-            else:
-                dominant_style = "Unknown"
-            
-            result = {
-                "summary": {
-                    "total_songs_analyzed": len(track_info),
-                    "unique_genres": unique_genres,
-                    "dominant_style": dominant_style,
-                    "genre_diversity": "Very Diverse" if unique_genres > 20 else
-                                     "Diverse" if unique_genres > 10 else
-                                     "Moderately Diverse" if unique_genres > 5 else
-                                     "Limited",
-                    "errors": errors if errors else None
-                },
-                "top_genres": top_genres,
-                "genre_distribution": {
-                    "total_genre_tags": total_genre_tags,
-                    "average_genres_per_song": round(total_genre_tags / len(track_info), 1) if track_info else 0
-                },
-                "tracks_with_genres": track_info
+        },
+        "required": ["paths"]
+    },
+    max_concurrency=1, timeout=COLLECTION_TOOL_TIMEOUT, detail_sections=("top_tracks",)
+)
+def handle_import_streaming_history(arguments: dict) -> Any:
+    """Aggregate streaming history exports into play counts per track."""
+    stats = ImportStats()
+    tracks = by_plays(aggregate_plays(
+        arguments["paths"], arguments.get("min_ms_played", DEFAULT_MIN_MS_PLAYED), stats
+    ))
+
+    result = {
+        "import": stats.report(),
+        "unique_tracks": len(tracks),
+        "top_tracks": tracks[:arguments.get("top_n", 20)]
+    }
+
+    # One row per track, with its URI, so the collection tools look tracks
+    # up by ID in batches instead of searching for each one
+    name = arguments.get("name")
+    if name:
+        if "/" in name or "\\" in name or name.startswith("."):
+            raise ValueError(f"Invalid collection name: {name!r}")
+        os.makedirs(IMPORTED_COLLECTIONS_DIR, exist_ok=True)
+        path = os.path.join(IMPORTED_COLLECTIONS_DIR, f"{name}.ndjson")
+        tmp_path = f"{path}.tmp"
+        write_ndjson(tracks, tmp_path)
+        os.replace(tmp_path, path)
+        result["songs_source"] = f"{COLLECTION_URI_PREFIX}{name}"
+    return result
+
+
+@register_tool(
+    "create_playlist",
+    "Create a new Spotify playlist from a collection of songs",
+    {
+        "type": "object",
+        "properties": {
+            "playlist_name": {
+                "type": "string",
+                "description": "Name for the new playlist"
+            },
+            "songs": songs_schema("List of songs to add to the playlist"),
+            "songs_source": SONGS_SOURCE_SCHEMA,
+            "songs_offset": SONGS_OFFSET_SCHEMA,
+            "time_budget_seconds": TIME_BUDGET_SCHEMA,
+            "playlist_id": {
+                "type": "string",
+                "description": "Add the songs to this playlist instead of creating one "
+                               "(e.g. the rest of a partial result)"
+            },
+            "description": {
+                "type": "string",
+                "description": "Optional description for the playlist"
+            },
+            "public": {
+                "type": "boolean",
+                "description": "Whether the playlist should be public (default: false)",
+                "default": False
             }
-            
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
-
-        elif name == "create_playlist":
-            playlist_name = arguments["playlist_name"]
-            songs = arguments["songs"]
-            description = arguments.get("description", "")
-            public = arguments.get("public", False)
-
-            # Get current user ID
-            user = sp.current_user()
-            user_id = user["id"]
-
-            # Create the playlist
-            playlist = sp.user_playlist_create(
-                user=user_id,
-                name=playlist_name,
-                public=public,
-                description=description
-            )
+        },
+        "required": []
+    },
+    max_concurrency=1, timeout=COLLECTION_TOOL_TIMEOUT, user_data=True,
+    detail_sections=("added_songs", "not_found_queries")
+)
+def handle_create_playlist(arguments: dict) -> Any:
+    """Create a playlist on the user's account from a song list.
+
+    The songs are resolved (within the time budget) before the playlist is
+    created, so a timeout never leaves a half-filled playlist behind. A
+    partial result's playlist can be completed by passing its ID back as
+    playlist_id with the unprocessed songs or the resume offset.
+    """
+    if not arguments.get("playlist_name") and not arguments.get("playlist_id"):
+        raise ValueError("Provide 'playlist_name' or 'playlist_id'")
+    budget = collection_budget(arguments)
+    description = arguments.get("description", "")
+    public = arguments.get("public", False)
+
+    # Search and collect track URIs
+    track_uris = []
+    found_songs = []
+    not_found = []
+    total_requested = 0
+
+    for song_data in budget:
+        total_requested += 1
+        query = song_query(song_data)
+        track = resolve_song(song_data)
+
+        if track is not None:
+            track_uris.append(track["uri"])
+            found_songs.append({
+                "name": track["name"],
+                "artists": [a["name"] for a in track["artists"]]
+            })
+        else:
+            not_found.append(query)
 
-            # Search and collect track URIs
-            track_uris = []
-            found_songs = []
-            not_found = []
-
-            for song_data in songs:
-                song_name = song_data["song_name"]
-                artist_name = song_data.get("artist_name", "")
-
-                # Build search query
-                query = song_name
-                if artist_name:
-                    query += f" artist:{artist_name}"
-
-                # Search for the song
-                search_results = sp.search(q=query, type="track", limit=1)
-                tracks = search_results["tracks"]["items"]
-
-                if tracks:
-                    track = tracks[0]
-                    track_uris.append(track["uri"])
-                    found_songs.append({
-                        "name": track["name"],
-                        "artists": [a["name"] for a in track["artists"]]
-                    })
-                else:
-                    not_found.append(query)
-
-            # Add tracks to playlist in batches of 100 (Spotify limit)
-            for i in range(0, len(track_uris), 100):
-                batch = track_uris[i:i+100]
-                sp.playlist_add_items(playlist["id"], batch)
-
-            result = {
-                "success": True,
-                "playlist": {
-                    "id": playlist["id"],
-                    "name": playlist["name"],
-                    "url": playlist["external_urls"]["spotify"],
-                    "public": public
-                },
-                "summary": {
-                    "total_requested": len(songs),
-                    "songs_added": len(track_uris),
-                    "not_found": len(not_found)
-                },
-                "added_songs": found_songs,
-                "not_found_queries": not_found if not_found else None
+    if arguments.get("playlist_id"):
+        playlist = sp.playlist(arguments["playlist_id"], fields="id,name,public,external_urls")
+        public = playlist.get("public", public)
+    else:
+        user = sp.current_user()
+        playlist = sp.user_playlist_create(
+            user=user["id"],
+            name=arguments["playlist_name"],
+            public=public,
+            description=description
+        )
+
+    # Add tracks to playlist in batches of 100 (Spotify limit)
+    for i in range(0, len(track_uris), 100):
+        batch = track_uris[i:i+100]
+        sp.playlist_add_items(playlist["id"], batch)
+
+    result = {
+        "success": True,
+        "playlist": {
+            "id": playlist["id"],
+            "name": playlist["name"],
+            "url": playlist["external_urls"]["spotify"],
+            "public": public
+        },
+        "summary": {
+            "total_requested": total_requested,
+            "songs_added": len(track_uris),
+            "not_found": len(not_found)
+        },
+        "added_songs": found_songs,
+        "not_found_queries": not_found if not_found else None
+    }
+
+    return budget.annotate(result)
+
+
+@register_tool(
+    "generate_balanced_playlist",
+    "Create a balanced playlist from a song collection based on genre, artist, and era distribution",
+    {
+        "type": "object",
+        "properties": {
+            "songs": songs_schema("Source collection of songs to balance from"),
+            "songs_source": SONGS_SOURCE_SCHEMA,
+            "songs_offset": SONGS_OFFSET_SCHEMA,
+            "time_budget_seconds": TIME_BUDGET_SCHEMA,
+            "target_size": {
+                "type": "integer",
+                "description": "Target number of songs for the balanced playlist (default: 30)",
+                "default": 30
+            },
+            "balance_criteria": {
+                "type": "string",
+                "description": "What to balance by: 'genre', 'artist', or 'era' (default: 'genre')",
+                "default": "genre"
+            },
+            "playlist_name": {
+                "type": "string",
+                "description": "Name for the new balanced playlist (optional - if provided, creates the playlist)"
             }
+        },
+        "required": []
+    },
+    max_concurrency=1, timeout=COLLECTION_TOOL_TIMEOUT, user_data=True,
+    detail_sections=("balanced_selection",)
+)
+def handle_generate_balanced_playlist(arguments: dict) -> Any:
+    """Pick a subset balanced by genre, artist or era."""
+    budget = collection_budget(arguments)
+    target_size = arguments.get("target_size", 30)
+    balance_criteria = arguments.get("balance_criteria", "genre")
+    playlist_name = arguments.get("playlist_name")
+
+    # First, analyze the collection to understand distribution
+    track_data = []
+    errors = []
+
+    for song_data in budget:
+        query = song_query(song_data)
+        track = resolve_song(song_data)
+
+        if track is None:
+            errors.append(f"Not found: {query}")
+            continue
+
+        # Get artist info for genres
+        genres = []
+        for artist in track["artists"]:
+            try:
+                artist_info = get_artist(artist["id"])
+                genres.extend(artist_info["genres"])
+            except:
+                pass
+
+        # Get release year
+        release_date = track["album"]["release_date"]
+        year = int(release_date.split("-")[0]) if release_date else None
+
+        track_data.append({
+            "track": track,
+            "genres": list(set(genres)),
+            "year": year,
+            "artists": [a["name"] for a in track["artists"]]
+        })
+
+    # Balance based on criteria
+    selected_tracks = []
+
+    if balance_criteria == "genre":
+        # Group by genre
+        genre_groups = {}
+        for item in track_data:
+            for genre in item["genres"] if item["genres"] else ["Unknown"]:
+                if genre not in genre_groups:
+                    genre_groups[genre] = []
+                genre_groups[genre].append(item)
+
+        # Select evenly from each genre
+        import random
+        genres_list = list(genre_groups.keys())
+        random.shuffle(genres_list)
+
+        idx = 0
+        while len(selected_tracks) < min(target_size, len(track_data)):
+            genre = genres_list[idx % len(genres_list)]
+            if genre_groups[genre]:
+                item = genre_groups[genre].pop(0)
+                if item not in selected_tracks:
+                    selected_tracks.append(item)
+            idx += 1
+
+    elif balance_criteria == "artist":
+        # Ensure diversity of artists
+        artist_count = {}
+        import random
+        shuffled = track_data.copy()
+        random.shuffle(shuffled)
+
+        for item in shuffled:
+            if len(selected_tracks) >= target_size:
+                break
+            artist_key = tuple(sorted(item["artists"]))
+            if artist_count.get(artist_key, 0) < 2:  # Max 2 per artist
+                selected_tracks.append(item)
+                artist_count[artist_key] = artist_count.get(artist_key, 0) + 1
+
+    elif balance_criteria == "era":
+        # Balance by decade
+        decade_groups = {}
+        for item in track_data:
+            if item["year"]:
+                decade = (item["year"] // 10) * 10
+                if decade not in decade_groups:
+                    decade_groups[decade] = []
+                decade_groups[decade].append(item)
+
+        import random
+        decades_list = sorted(decade_groups.keys())
+
+        idx = 0
+        while len(selected_tracks) < min(target_size, len(track_data)):
+            if not decades_list:
+                break
+            decade = decades_list[idx % len(decades_list)]
+            if decade_groups[decade]:
+                item = decade_groups[decade].pop(0)
+                selected_tracks.append(item)
+            idx += 1
+
+    # Prepare result
+    balanced_songs = []
+    for item in selected_tracks:
+        track = item["track"]
+        balanced_songs.append({
+            "name": track["name"],
+            "artists": [a["name"] for a in track["artists"]],
+            "genres": item["genres"],
+            "year": item["year"],
+            "id": track["id"],
+            "uri": track["uri"]
+        })
+
+    result = {
+        "summary": {
+            "balance_criteria": balance_criteria,
+            "source_songs": len(track_data),
+            "selected_songs": len(selected_tracks),
+            "target_size": target_size
+        },
+        "balanced_selection": balanced_songs
+    }
+
+    # Create playlist if name provided
+    if playlist_name:
+        user = sp.current_user()
+        playlist = sp.user_playlist_create(
+            user=user["id"],
+            name=playlist_name,
+            public=False,
+            description=f"Balanced by {balance_criteria}"
+        )
 
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
+        track_uris = [item["track"]["uri"] for item in selected_tracks]
+        for i in range(0, len(track_uris), 100):
+            batch = track_uris[i:i+100]
+            sp.playlist_add_items(playlist["id"], batch)
+
+        result["playlist_created"] = {
+            "id": playlist["id"],
+            "name": playlist["name"],
+            "url": playlist["external_urls"]["spotify"]
+        }
+
+    return budget.annotate(result)
+
+
+@register_tool(
+    "compare_to_my_taste",
+    "Compare a song collection to your actual Spotify listening history - find overlaps, differences, and get personalized insights",
+    {
+        "type": "object",
+        "properties": {
+            "songs": songs_schema("List of songs to compare to your taste"),
+            "songs_source": SONGS_SOURCE_SCHEMA,
+            "songs_offset": SONGS_OFFSET_SCHEMA,
+            "time_budget_seconds": TIME_BUDGET_SCHEMA
+        },
+        "required": []
+    },
+    max_concurrency=COLLECTION_TOOL_CONCURRENCY, timeout=COLLECTION_TOOL_TIMEOUT,
+    user_data=True
+)
+def handle_compare_to_my_taste(arguments: dict) -> Any:
+    """Compare a collection to the user's top tracks and artists."""
+    budget = collection_budget(arguments)
+
+    # Get user's top tracks and artists
+    top_tracks = get_user_top("tracks")
+    top_artists = get_user_top("artists")
+
+    # Extract user's favorite artists and genres
+    user_artists = set([artist["name"].lower() for artist in top_artists["items"]])
+    user_genres = set()
+    for artist in top_artists["items"]:
+        user_genres.update(artist["genres"])
+
+    # Extract user's top track names for matching
+    user_tracks = set([track["name"].lower() for track in top_tracks["items"]])
+
+    # Analyze the input collection
+    matching_tracks = []
+    matching_artists = []
+    non_matching_tracks = []
+    collection_artists = set()
+    collection_genres = set()
+    errors = []
+
+    for song_data in budget:
+        query = song_query(song_data)
+        track = resolve_song(song_data)
+
+        if track is None:
+            errors.append(f"Not found: {query}")
+            continue
+        track_artists = [a["name"] for a in track["artists"]]
+
+        # Check if track is in user's top tracks
+        is_favorite_track = track["name"].lower() in user_tracks
+
+        # Check if artist is in user's top artists
+        is_favorite_artist = any(a.lower() in user_artists for a in track_artists)
+
+        # Get genres for this track
+        track_genres = []
+        for artist in track["artists"]:
+            try:
+                artist_info = get_artist(artist["id"])
+                track_genres.extend(artist_info["genres"])
+            except:
+                pass
+
+        collection_genres.update(track_genres)
+        for artist in track_artists:
+            collection_artists.add(artist.lower())
+
+        song_info = {
+            "name": track["name"],
+            "artists": track_artists,
+            "is_favorite_track": is_favorite_track,
+            "is_favorite_artist": is_favorite_artist,
+            "genres": list(set(track_genres))
+        }
+
+        if is_favorite_track or is_favorite_artist:
+            if is_favorite_track:
+                matching_tracks.append(song_info)
+            if is_favorite_artist:
+                matching_artists.append(song_info)
+        else:
+            non_matching_tracks.append(song_info)
 
-        elif name == "generate_balanced_playlist":
-            songs = arguments["songs"]
-            target_size = arguments.get("target_size", 30)
-            balance_criteria = arguments.get("balance_criteria", "genre")
-            playlist_name = arguments.get("playlist_name")
+    # Calculate overlaps
+    artist_overlap = len(collection_artists.intersection(user_artists))
+    genre_overlap = len(collection_genres.intersection(user_genres))
 
-            # First, analyze the collection to understand distribution
-            track_data = []
-            errors = []
+    # Determine taste alignment
+    total_analyzed = len(matching_tracks) + len(matching_artists) + len(non_matching_tracks)
+    match_percentage = ((len(matching_tracks) + len(matching_artists)) / total_analyzed * 100) if total_analyzed > 0 else 0
 
-            for song_data in songs:
-                song_name = song_data["song_name"]
-                artist_name = song_data.get("artist_name", "")
+    if match_percentage > 50:
+        alignment = "Strong Match - This collection aligns well with your taste!"
+    elif match_percentage > 25:
+        alignment = "Moderate Match - Some overlap with your preferences"
+    else:
+        alignment = "Low Match - This collection explores different territory"
+
+    # Find missing genres from user's taste
+    missing_genres = list(user_genres - collection_genres)[:5]
+    new_genres = list(collection_genres - user_genres)[:5]
+
+    result = {
+        "summary": {
+            "alignment": alignment,
+            "match_percentage": round(match_percentage, 1),
+            "total_analyzed": total_analyzed,
+            "errors": errors if errors else None
+        },
+        "matches": {
+            "favorite_tracks_count": len(matching_tracks),
+            "favorite_artists_count": len(matching_artists),
+            "favorite_tracks": matching_tracks[:5],
+            "favorite_artists": matching_artists[:5]
+        },
+        "overlaps": {
+            "artist_overlap": f"{artist_overlap} artists",
+            "genre_overlap": f"{genre_overlap} genres"
+        },
+        "insights": {
+            "missing_from_your_taste": missing_genres,
+            "new_genres_in_collection": new_genres,
+            "songs_to_explore": [
+                {"name": t["name"], "artists": t["artists"]}
+                for t in non_matching_tracks[:5]
+            ]
+        }
+    }
+
+    return budget.annotate(result)
+
+
+@register_tool(
+    "find_whats_missing",
+    "Check which songs from a collection are NOT in your Spotify library - find songs you haven't saved yet",
+    {
+        "type": "object",
+        "properties": {
+            "songs": songs_schema("List of songs to check against your library"),
+            "songs_source": SONGS_SOURCE_SCHEMA,
+            "songs_offset": SONGS_OFFSET_SCHEMA,
+            "time_budget_seconds": TIME_BUDGET_SCHEMA
+        },
+        "required": []
+    },
+    max_concurrency=COLLECTION_TOOL_CONCURRENCY, timeout=COLLECTION_TOOL_TIMEOUT,
+    user_data=True, detail_sections=("already_saved_songs", "missing_songs")
+)
+def handle_find_whats_missing(arguments: dict) -> Any:
+    """Find collection songs that aren't in the user's saved library."""
+    budget = collection_budget(arguments)
+
+    # Get ALL user's saved tracks (paged, cached for a few minutes)
+    saved_tracks_set = {track["id"] for track in get_saved_tracks()}
+
+    # Check which songs from the collection are missing
+    missing_songs = []
+    already_saved = []
+    errors = []
+
+    for song_data in budget:
+        query = song_query(song_data)
+        track = resolve_song(song_data)
+
+        if track is None:
+            errors.append(f"Not found: {query}")
+            continue
+
+        song_info = {
+            "name": track["name"],
+            "artists": [a["name"] for a in track["artists"]],
+            "id": track["id"],
+            "uri": track["uri"],
+            "url": track["external_urls"]["spotify"],
+            "popularity": track["popularity"]
+        }
+
+        # Check if it's in user's saved tracks
+        if track["id"] in saved_tracks_set:
+            already_saved.append(song_info)
+        else:
+            missing_songs.append(song_info)
 
-                query = song_name
-                if artist_name:
-                    query += f" artist:{artist_name}"
+    result = {
+        "summary": {
+            "total_songs_checked": budget.processed - len(errors),
+            "missing_from_library": len(missing_songs),
+            "already_saved": len(already_saved),
+            "missing_percentage": round((len(missing_songs) / (len(missing_songs) + len(already_saved)) * 100), 1) if (len(missing_songs) + len(already_saved)) > 0 else 0,
+            "errors": errors if errors else None
+        },
+        "missing_songs": missing_songs,
+        "already_saved_songs": already_saved
+    }
 
-                search_results = sp.search(q=query, type="track", limit=1)
-                tracks = search_results["tracks"]["items"]
+    return budget.annotate(result)
 
-                if not tracks:
-                    errors.append(f"Not found: {query}")
-                    continue
 
-                track = tracks[0]
+@app.list_tools()
+async def list_tools() -> list[Tool]:
+    """List available music analysis tools."""
+    return [spec.tool for spec in TOOL_REGISTRY.values()]
+
+
+def _profiling_requested(name: str, arguments: Any) -> bool:
+    """Check whether this tool call should run under the profiler."""
+    if PROFILE_ALL or name in PROFILE_TOOLS:
+        return True
+    return bool(isinstance(arguments, dict) and arguments.get("_profile"))
+
+
+def _summarize_profile(profiler: cProfile.Profile, top_n: int) -> dict:
+    """Build a top-N hotspot summary (by self time) from a finished profile."""
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    entries = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)
+
+    categories = {category: 0.0 for category in PROFILE_CATEGORIES}
+    categories["python"] = 0.0
+    for (filename, _, func), (_, _, self_time, _, _) in entries:
+        # Built-ins (e.g. socket.recv_into) have no file, so match the name too
+        location = f"{filename}:{func}"
+        for category, fragments in PROFILE_CATEGORIES.items():
+            if any(fragment in location for fragment in fragments):
+                categories[category] += self_time
+                break
+        else:
+            categories["python"] += self_time
+
+    hotspots = []
+    for (filename, line, func), (_, ncalls, self_time, cumulative, _) in entries[:top_n]:
+        hotspots.append({
+            "function": f"{os.path.basename(filename)}:{line}({func})",
+            "calls": ncalls,
+            "self_seconds": round(self_time, 4),
+            "cumulative_seconds": round(cumulative, 4)
+        })
+
+    return {
+        "total_seconds": round(stats.total_tt, 4),
+        "self_time_by_category": {k: round(v, 4) for k, v in categories.items()},
+        "hotspots": hotspots
+    }
+
+
+def _run_tool(spec: ToolSpec, arguments: dict) -> tuple[list[TextContent], bool]:
+    """Call a tool handler and serialize its result (runs in a worker thread).
+
+    Also reports whether the result is complete; partial results (time budget
+    ran out) must not be served from the response cache later. Results are
+    cut to the response byte budget (the same arguments are always cut the
+    same way, so cut responses are cached like any other).
+    """
+    limit = response_byte_limit(arguments)
+    result = spec.handler(arguments)
+    complete = not (isinstance(result, dict) and result.get("partial"))
+    text, cut = encode_response(result, limit, spec.detail_sections)
+    if cut:
+        spec.truncated_responses += 1
+    return [TextContent(
+        type="text",
+        text=text
+    )], complete
+
+
+def _run_tool_profiled(spec: ToolSpec, arguments: dict) -> tuple[list[TextContent], bool]:
+    """Run a tool under cProfile, save the profile and append a hotspot summary."""
+    # cProfile only sees the thread it is enabled in, so enable it here
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        content, complete = _run_tool(spec, arguments)
+    finally:
+        profiler.disable()
+    wall_seconds = time.perf_counter() - started
 
-                # Get artist info for genres
-                genres = []
-                for artist in track["artists"]:
-                    try:
-                        artist_info = sp.artist(artist["id"])
-                        genres.extend(artist_info["genres"])
-                    except:
-                        pass
-
-                # Get release year
-                release_date = track["album"]["release_date"]
-                year = int(release_date.split("-")[0]) if release_date else None
-
-                track_data.append({
-                    "track": track,
-                    "genres": list(set(genres)),
-                    "year": year,
-                    "artists": [a["name"] for a in track["artists"]]
-                })
-
-            # Balance based on criteria
-            selected_tracks = []
-
-            if balance_criteria == "genre":
-                # Group by genre
-                genre_groups = {}
-                for item in track_data:
-                    for genre in item["genres"] if item["genres"] else ["Unknown"]:
-                        if genre not in genre_groups:
-                            genre_groups[genre] = []
-                        genre_groups[genre].append(item)
-
-                # Select evenly from each genre
-                import random
-                genres_list = list(genre_groups.keys())
-                random.shuffle(genres_list)
-
-                idx = 0
-                while len(selected_tracks) < min(target_size, len(track_data)):
-                    genre = genres_list[idx % len(genres_list)]
-                    if genre_groups[genre]:
-                        item = genre_groups[genre].pop(0)
-                        if item not in selected_tracks:
-                            selected_tracks.append(item)
-                    idx += 1
-
-            elif balance_criteria == "artist":
-                # Ensure diversity of artists
-                artist_count = {}
-                import random
-                shuffled = track_data.copy()
-                random.shuffle(shuffled)
-
-                for item in shuffled:
-                    if len(selected_tracks) >= target_size:
-                        break
-                    artist_key = tuple(sorted(item["artists"]))
-                    if artist_count.get(artist_key, 0) < 2:  # Max 2 per artist
-                        selected_tracks.append(item)
-                        artist_count[artist_key] = artist_count.get(artist_key, 0) + 1
-
-            elif balance_criteria == "era":
-                # Balance by decade
-                decade_groups = {}
-                for item in track_data:
-                    if item["year"]:
-                        decade = (item["year"] // 10) * 10
-                        if decade not in decade_groups:
-                            decade_groups[decade] = []
-                        decade_groups[decade].append(item)
-
-                import random
-                decades_list = sorted(decade_groups.keys())
-
-                idx = 0
-                while len(selected_tracks) < min(target_size, len(track_data)):
-                    if not decades_list:
-                        break
-                    decade = decades_list[idx % len(decades_list)]
-                    if decade_groups[decade]:
-                        item = decade_groups[decade].pop(0)
-                        selected_tracks.append(item)
-                    idx += 1
-
-            # Prepare result
-            balanced_songs = []
-            for item in selected_tracks:
-                track = item["track"]
-                balanced_songs.append({
-                    "name": track["name"],
-                    "artists": [a["name"] for a in track["artists"]],
-                    "genres": item["genres"],
-                    "year": item["year"],
-                    "id": track["id"],
-                    "uri": track["uri"]
-                })
-
-            result = {
-                "summary": {
-                    "balance_criteria": balance_criteria,
-                    "source_songs": len(track_data),
-                    "selected_songs": len(selected_tracks),
-                    "target_size": target_size
-                },
-                "balanced_selection": balanced_songs
-            }
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_path = os.path.join(
+        PROFILE_DIR,
+        f"{spec.name}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{os.getpid()}.prof"
+    )
+    profiler.dump_stats(profile_path)
+    logger.info(f"Saved profile for {spec.name} to {profile_path}")
 
-            # Create playlist if name provided
-            if playlist_name:
-                user = sp.current_user()
-                playlist = sp.user_playlist_create(
-                    user=user["id"],
-                    name=playlist_name,
-                    public=False,
-                    description=f"Balanced by {balance_criteria}"
-                )
+    summary = _summarize_profile(profiler, PROFILE_TOP_N)
+    summary["wall_seconds"] = round(wall_seconds, 4)
+    summary["profile_file"] = os.path.abspath(profile_path)
 
-                track_uris = [item["track"]["uri"] for item in selected_tracks]
-                for i in range(0, len(track_uris), 100):
-                    batch = track_uris[i:i+100]
-                    sp.playlist_add_items(playlist["id"], batch)
-
-                result["playlist_created"] = {
-                    "id": playlist["id"],
-                    "name": playlist["name"],
-                    "url": playlist["external_urls"]["spotify"]
-                }
-
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
-
-        elif name == "compare_to_my_taste":
-            songs = arguments["songs"]
-
-            # Get user's top tracks and artists
-            top_tracks = sp.current_user_top_tracks(limit=50, time_range="medium_term")
-            top_artists = sp.current_user_top_artists(limit=50, time_range="medium_term")
-
-            # Extract user's favorite artists and genres
-            user_artists = set([artist["name"].lower() for artist in top_artists["items"]])
-            user_genres = set()
-            for artist in top_artists["items"]:
-                user_genres.update(artist["genres"])
-
-            # Extract user's top track names for matching
-            user_tracks = set([track["name"].lower() for track in top_tracks["items"]])
-
-            # Analyze the input collection
-            matching_tracks = []
-            matching_artists = []
-            non_matching_tracks = []
-            collection_artists = set()
-            collection_genres = set()
-            errors = []
-
-            for song_data in songs:
-                song_name = song_data["song_name"]
-                artist_name = song_data.get("artist_name", "")
-
-                # Build search query
-                query = song_name
-                if artist_name:
-                    query += f" artist:{artist_name}"
-
-                # Search for the song
-                search_results = sp.search(q=query, type="track", limit=1)
-                tracks = search_results["tracks"]["items"]
-
-                if not tracks:
-                    errors.append(f"Not found: {query}")
-                    continue
-
-                track = tracks[0]
-                track_artists = [a["name"] for a in track["artists"]]
-
-                # Check if track is in user's top tracks
-                is_favorite_track = track["name"].lower() in user_tracks
-
-                # Check if artist is in user's top artists
-                is_favorite_artist = any(a.lower() in user_artists for a in track_artists)
-
-                # Get genres for this track
-                track_genres = []
-                for artist in track["artists"]:
-                    try:
-                        artist_info = sp.artist(artist["id"])
-                        track_genres.extend(artist_info["genres"])
-                    except:
-                        pass
-
-                collection_genres.update(track_genres)
-                for artist in track_artists:
-                    collection_artists.add(artist.lower())
-
-                song_info = {
-                    "name": track["name"],
-                    "artists": track_artists,
-                    "is_favorite_track": is_favorite_track,
-                    "is_favorite_artist": is_favorite_artist,
-                    "genres": list(set(track_genres))
-                }
-
-                if is_favorite_track or is_favorite_artist:
-                    if is_favorite_track:
-                        matching_tracks.append(song_info)
-                    if is_favorite_artist:
-                        matching_artists.append(song_info)
-                else:
-                    non_matching_tracks.append(song_info)
-
-            # Calculate overlaps
-            artist_overlap = len(collection_artists.intersection(user_artists))
-            genre_overlap = len(collection_genres.intersection(user_genres))
-
-            # Determine taste alignment
-            total_analyzed = len(matching_tracks) + len(matching_artists) + len(non_matching_tracks)
-            match_percentage = ((len(matching_tracks) + len(matching_artists)) / total_analyzed * 100) if total_analyzed > 0 else 0
-
-            if match_percentage > 50:
-                alignment = "Strong Match - This collection aligns well with your taste!"
-            elif match_percentage > 25:
-                alignment = "Moderate Match - Some overlap with your preferences"
-            else:
-                alignment = "Low Match - This collection explores different territory"
-
-            # Find missing genres from user's taste
-            missing_genres = list(user_genres - collection_genres)[:5]
-            new_genres = list(collection_genres - user_genres)[:5]
-
-            result = {
-                "summary": {
-                    "alignment": alignment,
-                    "match_percentage": round(match_percentage, 1),
-                    "total_analyzed": total_analyzed,
-                    "errors": errors if errors else None
-                },
-                "matches": {
-                    "favorite_tracks_count": len(matching_tracks),
-                    "favorite_artists_count": len(matching_artists),
-                    "favorite_tracks": matching_tracks[:5],
-                    "favorite_artists": matching_artists[:5]
-                },
-                "overlaps": {
-                    "artist_overlap": f"{artist_overlap} artists",
-                    "genre_overlap": f"{genre_overlap} genres"
-                },
-                "insights": {
-                    "missing_from_your_taste": missing_genres,
-                    "new_genres_in_collection": new_genres,
-                    "songs_to_explore": [
-                        {"name": t["name"], "artists": t["artists"]}
-                        for t in non_matching_tracks[:5]
-                    ]
-                }
-            }
+    return content + [TextContent(
+        type="text",
+        text=json.dumps({"_meta": {"profile": summary}}, indent=2)
+    )], complete
 
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
 
-        elif name == "find_whats_missing":
-            songs = arguments["songs"]
+@app.call_tool()
+async def call_tool(name: str, arguments: Any) -> Sequence[TextContent]:
+    """Execute music analysis tools."""
+    try:
+        spec = TOOL_REGISTRY.get(name)
+        if spec is None:
+            raise ValueError(f"Unknown tool: {name}")
 
-            # Get ALL user's saved tracks (may require pagination)
-            saved_tracks_set = set()
-            offset = 0
-            limit = 50
+        arguments = arguments or {}
+        # Only this one check runs when profiling is off
+        profile = _profiling_requested(name, arguments)
+        if profile:
+            arguments = {k: v for k, v in arguments.items() if k != "_profile"}
 
-            while True:
-                saved = sp.current_user_saved_tracks(limit=limit, offset=offset)
-                if not saved["items"]:
-                    break
-
-                for item in saved["items"]:
-                    track = item["track"]
-                    # Create a unique identifier for the track
-                    saved_tracks_set.add(track["id"])
-
-                offset += limit
-                if len(saved["items"]) < limit:
-                    break  # No more tracks
-
-            # Check which songs from the collection are missing
-            missing_songs = []
-            already_saved = []
-            errors = []
-
-            for song_data in songs:
-                song_name = song_data["song_name"]
-                artist_name = song_data.get("artist_name", "")
-
-                # Build search query
-                query = song_name
-                if artist_name:
-                    query += f" artist:{artist_name}"
-
-                # Search for the song
-                search_results = sp.search(q=query, type="track", limit=1)
-                tracks = search_results["tracks"]["items"]
-
-                if not tracks:
-                    errors.append(f"Not found: {query}")
-                    continue
-
-                track = tracks[0]
-
-                song_info = {
-                    "name": track["name"],
-                    "artists": [a["name"] for a in track["artists"]],
-                    "id": track["id"],
-                    "uri": track["uri"],
-                    "url": track["external_urls"]["spotify"],
-                    "popularity": track["popularity"]
-                }
-
-                # Check if it's in user's saved tracks
-                if track["id"] in saved_tracks_set:
-                    already_saved.append(song_info)
-                else:
-                    missing_songs.append(song_info)
-
-            result = {
-                "summary": {
-                    "total_songs_checked": len(songs) - len(errors),
-                    "missing_from_library": len(missing_songs),
-                    "already_saved": len(already_saved),
-                    "missing_percentage": round((len(missing_songs) / (len(missing_songs) + len(already_saved)) * 100), 1) if (len(missing_songs) + len(already_saved)) > 0 else 0,
-                    "errors": errors if errors else None
-                },
-                "missing_songs": missing_songs,
-                "already_saved_songs": already_saved
-            }
+        account = arguments.get("account")
+        if account is None:
+            return await spec.invoke(arguments, profile)
 
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
+        spotify_pool.check(account)
+        arguments = {k: v for k, v in arguments.items() if k != "account"}
+        token = current_account.set(account)
+        try:
+            return await spec.invoke(arguments, profile)
+        finally:
+            current_account.reset(token)
 
-        else:
-            raise ValueError(f"Unknown tool: {name}")
-    
     except Exception as e:
         logger.error(f"Error executing tool {name}: {str(e)}")
         return [TextContent(
@@ -1433,6 +3966,8 @@ async def call_tool(name: str, arguments: Any) -> Sequence[TextContent]:
 
 async def main():
     """Run the MCP server."""
+    if CACHE_SNAPSHOT_PATH or WARM_ON_START:
+        start_cache_preparation()
     async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
         await app.run(
             read_stream,
@@ -1442,5 +3977,21 @@ async def main():
 
 
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(main())
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "warm":
+        # python music_server_updated_2025.py warm [songs_source ...]
+        print(json.dumps(warm_caches(sys.argv[2:] or None), indent=2))
+    elif command in ("export-cache", "import-cache"):
+        # python music_server_updated_2025.py export-cache <file> [--include-private]
+        # python music_server_updated_2025.py import-cache <file>
+        if len(sys.argv) < 3:
+            print(f"Usage: python {os.path.basename(__file__)} {command} <snapshot file>"
+                  + (" [--include-private]" if command == "export-cache" else ""))
+            sys.exit(1)
+        if command == "export-cache":
+            report = export_cache_snapshot(sys.argv[2], "--include-private" in sys.argv)
+        else:
+            report = import_cache_snapshot(sys.argv[2])
+        print(json.dumps(report, indent=2))
+    else:
+        asyncio.run(main())
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Response Budget - Keep tool responses under a byte limit
+
+A tool result is serialized incrementally and encoding stops as soon as the
+text passes the budget, so an oversized result is never encoded in full.
+A result that doesn't fit is cut down:
+
+    1. Summary  - every key that isn't a declared detail section is kept
+                  exactly as the tool returned it
+    2. Details  - the tool's detail sections (per-song lists and the like)
+                  are filled in item by item, most important section first,
+                  until the budget is used up; the section listed first
+                  gives way first
+    3. Report   - "truncated" lists each cut section with the number of
+                  items kept and the number the tool returned
+
+Sections are named by dotted paths into the result ("tracks",
+"genre_diversity.genres") and may be lists or dicts. Text is ASCII
+(json's default ensure_ascii), so characters and bytes are the same count.
+"""
+
+import json
+import itertools
+
+INDENT = 2
+
+
+def encode_within(obj, max_bytes: int) -> str | None:
+    """obj as indented JSON, or None as soon as it grows past max_bytes."""
+    chunks = []
+    size = 0
+    for chunk in json.JSONEncoder(indent=INDENT).iterencode(obj):
+        size += len(chunk)
+        if size > max_bytes:
+            return None
+        chunks.append(chunk)
+    return "".join(chunks)
+
+
+def _get_path(result: dict, path: str):
+    value = result
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def _set_path(result: dict, path: str, value) -> dict:
+    """Copy of result with path set to value (only dicts on the path are copied)."""
+    keys = path.split(".")
+    result = dict(result)
+    node = result
+    for key in keys[:-1]:
+        node[key] = dict(node[key])
+        node = node[key]
+    node[keys[-1]] = value
+    return result
+
+
+def _items_within(section, level: int, room: int) -> tuple[int, int]:
+    """How many leading items of a list/dict section fit in room bytes.
+
+    level is the section's nesting depth in the result. Returns (items,
+    bytes they add over the empty "[]"/"{}"). Items are encoded one at a
+    time, and encoding stops at the first one that doesn't fit.
+    """
+    item_indent = INDENT * (level + 1)
+    used = 1 + INDENT * level       # newline and indent before the closing bracket
+    count = 0
+    items = section.items() if isinstance(section, dict) else section
+    for item in items:
+        if isinstance(section, dict):
+            text = f"{json.dumps(item[0])}: {json.dumps(item[1], indent=INDENT)}"
+        else:
+            text = json.dumps(item, indent=INDENT)
+        # Each item sits on its own line, with its lines indented to its depth
+        cost = len(text) + text.count("\n") * item_indent + 1 + item_indent + (1 if count else 0)
+        if used + cost > room:
+            break
+        used += cost
+        count += 1
+    return count, used if count else 0
+
+
+def encode_response(result, max_bytes: int | None, detail_sections=()) -> tuple[str, list | None]:
+    """Serialize a tool result within max_bytes; returns (text, cut sections).
+
+    The cut sections are the "truncated" report entries (None if the result
+    fit as it was). Without max_bytes, or without detail sections to cut,
+    the result is serialized whole.
+    """
+    if not max_bytes:
+        return json.dumps(result, indent=INDENT), None
+    text = encode_within(result, max_bytes)
+    if text is not None:
+        return text, None
+
+    sections = []
+    if isinstance(result, dict):
+        for path in detail_sections:
+            value = _get_path(result, path)
+            if isinstance(value, (list, dict)) and value:
+                sections.append((path, value))
+    if not sections:
+        return json.dumps(result, indent=INDENT), None
+
+    # The summary with every section emptied, plus room for the report at
+    # its largest (every section cut, with the widest counts)
+    summary = result
+    for path, value in sections:
+        summary = _set_path(summary, path, type(value)())
+    largest_report = {
+        "max_response_bytes": max_bytes,
+        "sections": [{"section": path, "kept": len(value), "total": len(value)} for path, value in sections]
+    }
+    room = max_bytes - len(json.dumps({**summary, "truncated": largest_report}, indent=INDENT))
+
+    kept = {}
+    for path, value in reversed(sections):
+        count, used = _items_within(value, path.count(".") + 1, max(room, 0))
+        kept[path] = count
+        room -= used
+
+    truncated = result
+    cut = []
+    for path, value in sections:
+        count = kept[path]
+        if count < len(value):
+            if isinstance(value, dict):
+                part = dict(itertools.islice(value.items(), count))
+            else:
+                part = value[:count]
+            truncated = _set_path(truncated, path, part)
+            cut.append({"section": path, "kept": count, "total": len(value)})
+    truncated = {**truncated, "truncated": {"max_response_bytes": max_bytes, "sections": cut}}
+    return json.dumps(truncated, indent=INDENT), cut
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Similarity Index - "Which of our playlists are most like this one?"
+
+Each indexed playlist or collection is reduced to a MinHash signature over
+its track and artist IDs. The fraction of equal signature slots estimates
+the Jaccard similarity of two sets without keeping the sets around.
+
+Signatures are split into bands; playlists whose signatures agree on all
+rows of any band land in the same LSH bucket. A query only scores the
+playlists it shares a bucket with, so it does not scan the whole index.
+With the defaults (128 slots, 32 bands of 4 rows) a pair with Jaccard 0.5
+becomes a candidate ~87% of the time, and a pair with 0.2 ~5% of the time.
+
+Re-adding a key replaces its signature and buckets, so playlists can be
+updated one at a time as they change.
+"""
+
+import os
+import gzip
+import json
+import random
+import hashlib
+import threading
+
+SIMILARITY_INDEX_VERSION = 1
+
+# Mersenne prime larger than any 32-bit token hash
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def _token_hash(token: str) -> int:
+    """Hash that is stable across processes (unlike hash())."""
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=4).digest(), "little")
+
+
+class SimilarityIndex:
+    """MinHash signatures of token sets with an LSH table for candidate lookup."""
+
+    def __init__(self, num_perm: int = 128, bands: int = 32, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.seed = seed
+        rng = random.Random(seed)
+        self._perms = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+        self._signatures = {}       # key -> signature (list of ints)
+        self._meta = {}             # key -> {"name", "size", ...}
+        self._buckets = [{} for _ in range(bands)]   # band -> band hash -> set of keys
+        self._lock = threading.RLock()
+        self._dirty = 0
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def __contains__(self, key):
+        return key in self._signatures
+
+    def signature(self, tokens) -> list:
+        """MinHash signature of a set of string tokens."""
+        hashes = {_token_hash(token) for token in tokens}
+        if not hashes:
+            return [_MAX_HASH] * self.num_perm
+        return [
+            min((a * h + b) % _PRIME for h in hashes) & _MAX_HASH
+            for a, b in self._perms
+        ]
+
+    def _band_keys(self, signature: list):
+        for band in range(self.bands):
+            yield band, tuple(signature[band * self.rows:(band + 1) * self.rows])
+
+    def add(self, key: str, tokens, meta: dict = None):
+        """Index (or re-index) a token set under key."""
+        signature = self.signature(tokens)
+        with self._lock:
+            self._put(key, signature, dict(meta or {}))
+            self._dirty += 1
+
+    def _put(self, key: str, signature: list, meta: dict):
+        self._remove(key)
+        self._signatures[key] = signature
+        self._meta[key] = meta
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band].setdefault(band_key, set()).add(key)
+
+    def remove(self, key: str):
+        with self._lock:
+            if self._remove(key):
+                self._dirty += 1
+
+    def _remove(self, key: str) -> bool:
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return False
+        self._meta.pop(key, None)
+        for band, band_key in self._band_keys(signature):
+            bucket = self._buckets[band].get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band][band_key]
+        return True
+
+    def meta(self, key: str) -> dict | None:
+        return self._meta.get(key)
+
+    @staticmethod
+    def estimate(a: list, b: list) -> float:
+        """Estimated Jaccard similarity of two signatures."""
+        return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+    def query(self, tokens, top_n: int = 10, min_similarity: float = 0.0, exclude: str = None):
+        """Most similar indexed keys to a token set.
+
+        Returns (matches, candidates_scored); each match is
+        (key, estimated Jaccard, meta).
+        """
+        signature = self.signature(tokens)
+        with self._lock:
+            candidates = set()
+            for band, band_key in self._band_keys(signature):
+                candidates.update(self._buckets[band].get(band_key, ()))
+            candidates.discard(exclude)
+            scored = [
+                (key, self.estimate(signature, self._signatures[key]), self._meta[key])
+                for key in candidates
+            ]
+        scored = [match for match in scored if match[1] >= min_similarity]
+        scored.sort(key=lambda match: match[1], reverse=True)
+        return scored[:top_n], len(candidates)
+
+    def save(self, path: str):
+        """Write the index to a gzipped JSON file (atomically)."""
+        with self._lock:
+            data = {
+                "version": SIMILARITY_INDEX_VERSION,
+                "num_perm": self.num_perm,
+                "bands": self.bands,
+                "seed": self.seed,
+                "entries": {
+                    key: {"signature": signature, "meta": self._meta[key]}
+                    for key, signature in self._signatures.items()
+                }
+            }
+            self._dirty = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps(data, ensure_ascii=False))
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> int:
+        """Load a saved index built with the same parameters; returns entries loaded."""
+        if not os.path.exists(path):
+            return 0
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if (data.get("version") != SIMILARITY_INDEX_VERSION
+                or (data["num_perm"], data["bands"], data["seed"]) != (self.num_perm, self.bands, self.seed)):
+            return 0
+        with self._lock:
+            for key, entry in data["entries"].items():
+                self._put(key, entry["signature"], entry["meta"])
+            self._dirty = 0
+        return len(data["entries"])
+
+    @property
+    def params(self) -> list:
+        """Signatures are only comparable between indexes with equal params."""
+        return [self.num_perm, self.bands, self.seed]
+
+    def export_columns(self) -> dict:
+        """Keys, signatures and meta as aligned columns."""
+        with self._lock:
+            keys = list(self._signatures)
+            return {
+                "keys": keys,
+                "signatures": [self._signatures[key] for key in keys],
+                "meta": [self._meta[key] for key in keys]
+            }
+
+    def import_columns(self, columns: dict) -> int:
+        """Add (or replace) the entries export_columns() returned."""
+        with self._lock:
+            for key, signature, meta in zip(columns["keys"], columns["signatures"], columns["meta"]):
+                self._put(key, signature, meta)
+            self._dirty += len(columns["keys"])
+        return len(columns["keys"])
+
+    @property
+    def dirty(self) -> int:
+        """Number of changes since the last save/load."""
+        return self._dirty
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Streaming History Importer - Play counts from Spotify "extended streaming history" exports
+
+The export is one or more multi-GB JSON files (Streaming_History_Audio_*.json),
+each a single array of play records. Files are memory-mapped and parsed one
+record at a time, so memory stays flat however large they are. Plays are
+aggregated by track URI; the result is one row per track, which the
+collection tools look up by ID (50 tracks per Spotify request) instead of
+searching for each song.
+
+Usage:
+    python streaming_history.py my_spotify_data/
+    python streaming_history.py Streaming_History_Audio_2023.json --ndjson plays.ndjson
+    python streaming_history.py my_spotify_data/ --ndjson plays.ndjson --min-ms 0
+"""
+
+import os
+import sys
+import json
+import mmap
+import time
+import codecs
+
+from csv_to_json import clean_field, flag_value, write_ndjson
+
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+
+# Spotify counts a play as a stream after 30 seconds
+DEFAULT_MIN_MS_PLAYED = 30000
+
+# Bytes of the mapped file decoded at a time
+READ_CHUNK_BYTES = 1 << 20
+
+# Parsed pages are dropped from the mapping where the platform allows it
+_MADV_DONTNEED = getattr(mmap, "MADV_DONTNEED", None) if hasattr(mmap.mmap, "madvise") else None
+
+
+def peak_rss_mb() -> float | None:
+    """Peak resident memory of this process so far, in MB (None if unknown)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class ImportStats:
+    """Counts, throughput and memory for a streaming-history import."""
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.records = 0
+        self.plays = 0
+        self.skipped_no_track = 0       # podcast episodes, audiobooks, unknown tracks
+        self.skipped_short = 0          # played for less than min_ms_played
+        self.started = time.perf_counter()
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.started
+
+    def report(self) -> dict:
+        seconds = self.seconds
+        return {
+            "files": self.files,
+            "megabytes": round(self.bytes / 1e6, 1),
+            "records": self.records,
+            "plays": self.plays,
+            "skipped_no_track": self.skipped_no_track,
+            "skipped_short": self.skipped_short,
+            "seconds": round(seconds, 2),
+            "records_per_second": round(self.records / seconds) if seconds > 0 else 0,
+            "megabytes_per_second": round(self.bytes / 1e6 / seconds, 1) if seconds > 0 else 0,
+            "peak_rss_mb": peak_rss_mb()
+        }
+
+    def summary(self):
+        report = self.report()
+        return (f"{report['plays']} plays from {report['records']} records in {report['files']} file(s), "
+                f"{report['megabytes']} MB in {report['seconds']}s "
+                f"({report['records_per_second']:,} records/sec, {report['megabytes_per_second']} MB/sec), "
+                f"peak RSS {report['peak_rss_mb']} MB")
+
+
+def iter_json_array(path: str, stats: ImportStats = None):
+    """Yield the items of a file holding one top-level JSON array, one at a time.
+
+    The file is memory-mapped and decoded READ_CHUNK_BYTES at a time; pages
+    already parsed are released, so only the current chunk is resident.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            utf8 = codecs.getincrementaldecoder("utf-8-sig")()
+            text, pos, offset, released = "", 0, 0, 0
+
+            def refill():
+                nonlocal text, pos, offset, released
+                chunk = mapped[offset:offset + READ_CHUNK_BYTES]
+                offset += len(chunk)
+                # The chunk is copied out; drop its whole pages from the mapping
+                boundary = offset - offset % mmap.PAGESIZE
+                if _MADV_DONTNEED is not None and boundary > released:
+                    mapped.madvise(_MADV_DONTNEED, released, boundary - released)
+                    released = boundary
+                if stats is not None:
+                    stats.bytes += len(chunk)
+                text = text[pos:] + utf8.decode(chunk, final=offset >= size)
+                pos = 0
+
+            def skip(separators):
+                nonlocal pos
+                while True:
+                    while pos < len(text) and text[pos] in separators:
+                        pos += 1
+                    if pos < len(text) or offset >= size:
+                        return
+                    refill()
+
+            skip(" \t\r\n")
+            if pos >= len(text):
+                return
+            if text[pos] != "[":
+                raise ValueError(f"{path}: expected a JSON array")
+            pos += 1
+
+            while True:
+                skip(" \t\r\n,")
+                if pos >= len(text):
+                    raise ValueError(f"{path}: unexpected end of file")
+                if text[pos] == "]":
+                    return
+                try:
+                    item, end = decoder.raw_decode(text, pos)
+                except json.JSONDecodeError:
+                    if offset >= size:
+                        raise
+                    refill()
+                    continue
+                if offset < size and type(item) in (int, float) and (
+                        end >= len(text) or text[end] not in " \t\r\n,]"):
+                    # A bare number might continue in the next chunk ("1." of "1.5")
+                    refill()
+                    continue
+                pos = end
+                yield item
+
+
+def history_files(paths) -> list[str]:
+    """Expand files and export folders into the JSON files to import.
+
+    A folder contributes its Streaming_History*.json files (audio and video
+    histories alike: video records without a track URI are skipped).
+    """
+    files = []
+    for path in paths:
+        path = os.path.expanduser(path)
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.startswith("Streaming_History") and name.endswith(".json")
+            )
+        elif os.path.exists(path):
+            files.append(path)
+        else:
+            raise ValueError(f"File not found: {path}")
+    if not files:
+        raise ValueError("No Streaming_History*.json files found")
+    return files
+
+
+def aggregate_plays(paths, min_ms_played: int = DEFAULT_MIN_MS_PLAYED, stats: ImportStats = None) -> dict:
+    """Play counts by track URI over every record of the given exports.
+
+    Returns {uri: {"song_name", "artist_name", "uri", "plays", "ms_played"}}.
+    """
+    stats = stats if stats is not None else ImportStats()
+    tracks = {}
+    for path in history_files(paths):
+        stats.files += 1
+        for record in iter_json_array(path, stats):
+            stats.records += 1
+            uri = record.get("spotify_track_uri")
+            if not uri or not record.get("master_metadata_track_name"):
+                stats.skipped_no_track += 1
+                continue
+            ms_played = record.get("ms_played") or 0
+            if ms_played < min_ms_played:
+                stats.skipped_short += 1
+                continue
+            stats.plays += 1
+            track = tracks.get(uri)
+            if track is None:
+                track = tracks[uri] = {
+                    "song_name": clean_field(record["master_metadata_track_name"]),
+                    "artist_name": clean_field(record.get("master_metadata_album_artist_name")),
+                    "uri": uri,
+                    "plays": 0,
+                    "ms_played": 0
+                }
+            track["plays"] += 1
+            track["ms_played"] += ms_played
+    return tracks
+
+
+def by_plays(tracks: dict) -> list:
+    """Aggregated tracks, most played first."""
+    return sorted(tracks.values(), key=lambda track: (-track["plays"], -track["ms_played"]))
+
+
+if __name__ == "__main__":
+    inputs = []
+    for index, arg in enumerate(sys.argv[1:], 1):
+        if not arg.startswith("--") and not sys.argv[index - 1].startswith("--"):
+            inputs.append(arg)
+    try:
+        if not inputs:
+            raise ValueError("No export folder or file given")
+        min_ms = flag_value(sys.argv, "--min-ms", str(DEFAULT_MIN_MS_PLAYED))
+        if not min_ms.isdigit():
+            raise ValueError(f"--min-ms must be a number of milliseconds, not {min_ms!r}")
+        ndjson_file = flag_value(sys.argv, "--ndjson")
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        print("Usage: python streaming_history.py <export folder or file>... "
+              "[--ndjson <output.ndjson>] [--min-ms N]")
+        sys.exit(1)
+
+    stats = ImportStats()
+    tracks = aggregate_plays(inputs, int(min_ms), stats)
+    ranked = by_plays(tracks)
+    print(f"[OK] {stats.summary()}")
+    print(f"[OK] {len(ranked)} unique tracks")
+    for track in ranked[:10]:
+        print(f"  {track['plays']:>6}  {track['song_name']} - {track['artist_name']}")
+
+    if ndjson_file:
+        write_ndjson(ranked, ndjson_file)
+        print(f"[OK] Saved to {ndjson_file} (use it as songs_source)")
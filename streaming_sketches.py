@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Streaming Sketches - Top-N and unique counts over any number of rows in fixed memory
+
+    CountMinSketch  - approximate counts; never undercounts, and overcounts by
+                      at most epsilon * total with probability 1 - delta
+    HeavyHitters    - a Count-Min sketch plus a bounded set of candidates for
+                      the most frequent items
+    HyperLogLog     - approximate number of distinct items, with a relative
+                      standard error of 1.04 / sqrt(2 ** precision)
+
+Memory depends only on the error settings, never on the input size. Each
+sketch round-trips through to_dict()/from_dict() (JSON-ready, counters as
+base64), so counting can stop and resume in another call or process.
+"""
+
+import sys
+import math
+import base64
+import hashlib
+from array import array
+
+
+def _hash64(item: str) -> int:
+    """64-bit hash that is stable across processes."""
+    return int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _encode_counters(row: array) -> str:
+    """Little-endian base64 of an array of counters."""
+    if sys.byteorder == "big":
+        row = array(row.typecode, row)
+        row.byteswap()
+    return base64.b64encode(row.tobytes()).decode("ascii")
+
+
+def _decode_counters(text: str, typecode: str) -> array:
+    row = array(typecode, base64.b64decode(text))
+    if sys.byteorder == "big":
+        row.byteswap()
+    return row
+
+
+class CountMinSketch:
+    """Approximate item counts in depth x width counters."""
+
+    def __init__(self, epsilon: float = 0.001, delta: float = 0.01):
+        self.epsilon = epsilon
+        self.delta = delta
+        self.width = math.ceil(math.e / epsilon)
+        self.depth = math.ceil(math.log(1 / delta))
+        self.total = 0
+        self._rows = [array("q", bytes(8 * self.width)) for _ in range(self.depth)]
+
+    def _columns(self, item: str):
+        # Double hashing: depth independent-enough columns from one hash
+        h = _hash64(item)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, item: str, count: int = 1) -> int:
+        """Count an item; returns its new estimate."""
+        self.total += count
+        estimate = None
+        for row, column in zip(self._rows, self._columns(item)):
+            row[column] += count
+            estimate = row[column] if estimate is None else min(estimate, row[column])
+        return estimate
+
+    def estimate(self, item: str) -> int:
+        return min(row[column] for row, column in zip(self._rows, self._columns(item)))
+
+    @property
+    def error_bound(self) -> int:
+        """Maximum overcount (with probability 1 - delta) at the current total."""
+        return math.ceil(self.epsilon * self.total)
+
+    @property
+    def memory_bytes(self) -> int:
+        return 8 * self.width * self.depth
+
+    def to_dict(self) -> dict:
+        return {
+            "epsilon": self.epsilon,
+            "delta": self.delta,
+            "total": self.total,
+            "rows": [_encode_counters(row) for row in self._rows]
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CountMinSketch":
+        sketch = cls(data["epsilon"], data["delta"])
+        rows = [_decode_counters(row, "q") for row in data["rows"]]
+        if len(rows) != sketch.depth or any(len(row) != sketch.width for row in rows):
+            raise ValueError("Count-Min rows don't match epsilon and delta")
+        sketch.total = data["total"]
+        sketch._rows = rows
+        return sketch
+
+
+class HeavyHitters:
+    """The most frequent items of a stream, tracked with a Count-Min sketch.
+
+    Keeps at most `capacity` candidates; an item displaces the weakest
+    candidate once its estimate is higher.
+    """
+
+    def __init__(self, capacity: int = 100, epsilon: float = 0.001, delta: float = 0.01):
+        self.capacity = capacity
+        self.sketch = CountMinSketch(epsilon, delta)
+        self._candidates = {}
+        # Lower bound on the weakest candidate's count (counts only grow),
+        # so most non-candidates are rejected without scanning
+        self._floor = 0
+
+    def add(self, item: str, count: int = 1):
+        estimate = self.sketch.add(item, count)
+        if item in self._candidates or len(self._candidates) < self.capacity:
+            self._candidates[item] = estimate
+            return
+        if estimate <= self._floor:
+            return
+        weakest = min(self._candidates, key=self._candidates.get)
+        self._floor = self._candidates[weakest]
+        if estimate > self._floor:
+            del self._candidates[weakest]
+            self._candidates[item] = estimate
+
+    def top(self, n: int) -> list:
+        """[(item, estimated count)] for the n most frequent candidates."""
+        ranked = sorted(
+            ((item, self.sketch.estimate(item)) for item in self._candidates),
+            key=lambda pair: pair[1], reverse=True
+        )
+        return ranked[:n]
+
+    @property
+    def total(self) -> int:
+        return self.sketch.total
+
+    @property
+    def error_bound(self) -> int:
+        return self.sketch.error_bound
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.sketch.memory_bytes
+
+    def to_dict(self) -> dict:
+        return {"capacity": self.capacity, "sketch": self.sketch.to_dict(), "candidates": list(self._candidates)}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "HeavyHitters":
+        hitters = cls(data["capacity"])
+        hitters.sketch = CountMinSketch.from_dict(data["sketch"])
+        hitters._candidates = {item: hitters.sketch.estimate(item) for item in data["candidates"]}
+        return hitters
+
+
+class HyperLogLog:
+    """Approximate distinct count in 2 ** precision one-byte registers."""
+
+    def __init__(self, precision: int = 14):
+        if not 4 <= precision <= 18:
+            raise ValueError("precision must be between 4 and 18")
+        self.precision = precision
+        self.m = 1 << precision
+        self._registers = bytearray(self.m)
+        self._alpha = 0.7213 / (1 + 1.079 / self.m)
+
+    @classmethod
+    def for_error(cls, relative_error: float) -> "HyperLogLog":
+        """Smallest sketch whose standard error is at most relative_error."""
+        precision = math.ceil(math.log2((1.04 / relative_error) ** 2))
+        return cls(min(18, max(4, precision)))
+
+    def add(self, item: str):
+        h = _hash64(item)
+        index = h >> (64 - self.precision)
+        rest = (h << self.precision) & 0xFFFFFFFFFFFFFFFF
+        rank = 64 - self.precision + 1 if rest == 0 else 65 - rest.bit_length()
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def count(self) -> int:
+        estimate = self._alpha * self.m * self.m / sum(2.0 ** -r for r in self._registers)
+        zeros = self._registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            # Small-range correction (linear counting)
+            estimate = self.m * math.log(self.m / zeros)
+        return round(estimate)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.m
+
+    def to_dict(self) -> dict:
+        return {"precision": self.precision, "registers": base64.b64encode(self._registers).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "HyperLogLog":
+        counter = cls(data["precision"])
+        registers = bytearray(base64.b64decode(data["registers"]))
+        if len(registers) != counter.m:
+            raise ValueError("HyperLogLog registers don't match the precision")
+        counter._registers = registers
+        return counter
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Unit tests for cache snapshot files
+"""
+
+import os
+import tempfile
+import unittest
+
+from cache_snapshot import from_columns, read_snapshot, to_columns, write_snapshot
+
+FEATURES = [
+    {"id": "4uLU6hMCjMI75M1A2tKUQC", "tempo": 113.0, "energy": 0.39, "key": 1},
+    {"id": "7GhIk7Il098yCjg4BQjzvb", "tempo": 92.51, "energy": 0.823, "key": None},
+    {"id": "0VjIjW4GlUZAMYd2vXMi3b", "tempo": 171.005, "energy": 0.73, "key": 1},
+]
+
+SECTIONS = {
+    "audio_features": to_columns(FEATURES, ["id", "tempo", "energy", "key"]),
+    "genres": {"artist_ids": ["a1", "a2"], "genres": [["indie pop", "chillwave"], []]},
+    "names": {"id": ["x"], "name": ["Beyoncé – Halo 🎵"]},
+    "empty": {"id": []},
+}
+
+
+class TestCacheSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "snapshots", "cache.musicsnap")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        written = write_snapshot(self.path, SECTIONS, {"server": "test"})
+        header, sections = read_snapshot(self.path)
+        self.assertEqual(sections, SECTIONS)
+        self.assertEqual(header, written)
+        self.assertEqual(header["server"], "test")
+        self.assertEqual([(s["name"], s["rows"]) for s in header["sections"]],
+                         [("audio_features", 3), ("genres", 2), ("names", 1), ("empty", 0)])
+        self.assertEqual(from_columns(sections["audio_features"]), FEATURES)
+        self.assertFalse(os.path.exists(f"{self.path}.tmp"))
+
+    def test_read_named_sections(self):
+        write_snapshot(self.path, SECTIONS)
+        _, sections = read_snapshot(self.path, names={"genres", "empty"})
+        self.assertEqual(sections, {"genres": SECTIONS["genres"], "empty": SECTIONS["empty"]})
+
+    def test_rejects_other_files(self):
+        with open(self.path.replace("snapshots", ""), "wb") as f:
+            f.write(b"not a snapshot")
+        with self.assertRaises(ValueError):
+            read_snapshot(self.path.replace("snapshots", ""))
+
+
+if __name__ == "__main__":
+    unittest.main()
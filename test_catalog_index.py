@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the local catalog index's matching rules
+"""
+
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+from catalog_index import CatalogIndex, normalize
+
+
+def track(track_id: str, name: str, artist: str) -> dict:
+    return {
+        "id": track_id,
+        "name": name,
+        "uri": f"spotify:track:{track_id}",
+        "artists": [{"id": f"artist-{artist}", "name": artist}],
+        "album": {"name": "Album", "release_date": "2001-01-01"}
+    }
+
+
+class TestNormalize(unittest.TestCase):
+    def test_drops_featuring_and_remaster_decorations(self):
+        self.assertEqual(normalize("Sweater Weather (Remastered)"), "sweater weather")
+        self.assertEqual(normalize("Yesterday - Remastered 2009"), "yesterday")
+        self.assertEqual(normalize("Stay (feat. Justin Bieber)"), "stay")
+        self.assertEqual(normalize("Beyoncé"), "beyonce")
+
+    def test_keeps_version_markers(self):
+        self.assertEqual(normalize("Hello - Live"), "hello live")
+        self.assertEqual(normalize("Love Story (Taylor's Version)"), "love story taylor s version")
+        self.assertEqual(normalize("Titanium (Remix)"), "titanium remix")
+
+
+class TestLookup(unittest.TestCase):
+    def setUp(self):
+        self.index = CatalogIndex(threshold=0.85)
+        for args in [
+            ("s5", "Symphony No. 5 in C Minor", "Ludwig van Beethoven"),
+            ("tv", "Love Story (Taylor's Version)", "Taylor Swift"),
+            ("hl", "Hello - Live", "Adele"),
+            ("sw", "Sweater Weather", "The Neighbourhood")
+        ]:
+            self.index.add(track(*args))
+
+    def test_versions_are_not_exact_hits_for_the_bare_title(self):
+        self.assertIsNone(self.index.lookup("Love Story", "Taylor Swift")[0])
+        self.assertIsNone(self.index.lookup("Hello", "Adele")[0])
+        self.assertEqual(self.index.lookup("Love Story (Taylor's Version)", "Taylor Swift")[1], "exact")
+
+    def test_fuzzy_needs_the_same_numbers(self):
+        self.assertIsNone(self.index.lookup("Symphony No. 7 in A Minor", "Ludwig van Beethoven")[0])
+        found, match, _ = self.index.lookup("Symphony No 5 in C Minr", "Ludwig van Beethoven")
+        self.assertEqual((found.id, match), ("s5", "fuzzy"))
+
+    def test_fuzzy_hits_are_not_saved_as_aliases(self):
+        found, match, _ = self.index.lookup("Sweater Wether", "The Neighborhood")
+        self.assertEqual((found.id, match), ("sw", "fuzzy"))
+        self.assertEqual(self.index.lookup("Sweater Wether", "The Neighborhood")[1], "fuzzy")
+        self.assertEqual(self.index.report()["aliases"], 0)
+
+    def test_searched_queries_are_aliases(self):
+        self.index.add(track("bh", "Bohemian Rhapsody - Remastered 2011", "Queen"), "bohemian rapsody", "queen")
+        self.assertEqual(self.index.lookup("Bohemian Rapsody", "Queen")[1], "alias")
+
+
+class TestPrivateTracks(unittest.TestCase):
+    def setUp(self):
+        self.index = CatalogIndex()
+        self.index.add(track("searched", "Searched", "A"), "my list song", "a")
+        self.index.add(track("saved", "Saved", "B"), private=True)
+        self.index.add(track("both", "Both", "C"), private=True)
+        self.index.add(track("both", "Both", "C"))
+
+    def test_public_export_leaves_out_private_tracks_and_aliases(self):
+        columns = self.index.export_columns(include_private=False)
+        self.assertEqual(columns["tracks"]["id"], ["searched", "both"])
+        self.assertEqual(columns["titles"], ["searched", "both"])
+        self.assertEqual((columns["alias_keys"], columns["private_tracks"]), ([], []))
+
+    def test_private_export_keeps_origins(self):
+        columns = self.index.export_columns()
+        self.assertEqual(columns["tracks"]["id"], ["searched", "saved", "both"])
+        self.assertEqual(columns["private_tracks"], [1])
+        loaded = CatalogIndex()
+        loaded.import_columns(columns)
+        self.assertTrue(loaded.is_private("saved"))
+        self.assertFalse(loaded.is_private("both"))
+        self.assertEqual(loaded.lookup("My List Song", "A")[1], "alias")
+
+
+class TestSaveLoad(unittest.TestCase):
+    def test_round_trip(self):
+        index = CatalogIndex()
+        index.add(track("hl", "Hello - Live", "Adele"), "hello live", "adele")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index.json.gz")
+            index.save(path)
+            loaded = CatalogIndex()
+            self.assertEqual(loaded.load(path), 1)
+            self.assertEqual(loaded.dirty, 0)
+            self.assertEqual(loaded.get("hl"), index.get("hl"))
+            self.assertEqual(loaded.lookup("Hello - Live", "Adele")[1], "alias")
+
+    def test_other_versions_are_ignored(self):
+        index = CatalogIndex()
+        index.add(track("hl", "Hello - Live", "Adele"))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index.json.gz")
+            with gzip.open(path, "wt", encoding="utf-8") as f:
+                json.dump({**index.export_columns(), "version": 0}, f)
+            loaded = CatalogIndex()
+            self.assertEqual(loaded.load(path), 0)
+        self.assertIsNone(loaded.get("hl"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Unit tests for incrementally maintained collection aggregates
+"""
+
+import os
+import random
+import tempfile
+import unittest
+from collections import Counter
+
+from collection_aggregates import CollectionAggregates
+
+GENRES = ["pop", "rock", "indie", "jazz", "soul", "house"]
+
+
+def contribution(key: str, checked: float = 0) -> dict:
+    """Deterministic contribution for a row key (every 7th song is not found)."""
+    rng = random.Random(key)
+    if rng.randrange(7) == 0:
+        return {"query": key, "track": None, "checked": checked}
+    artists = [f"Artist {rng.randrange(12)}" for _ in range(rng.randint(1, 3))]
+    return {
+        "query": key,
+        "track": {
+            "id": f"id-{key}",
+            "name": key,
+            "artists": artists,
+            "artist_ids": [f"aid-{artist}" for artist in artists],
+            "explicit": rng.random() < 0.3,
+            "popularity": rng.randrange(100),
+            "year": rng.choice([None, 1999, 2010, 2024]),
+            "artist_genres": [rng.sample(GENRES, rng.randint(0, 2)) for _ in artists]
+        }
+    }
+
+
+def recompute(rows: Counter, collection_id: str = "c") -> CollectionAggregates:
+    aggregates = CollectionAggregates(collection_id)
+    for key, times in rows.items():
+        aggregates.add_row(key, contribution(key), times)
+    return aggregates
+
+
+def totals(aggregates: CollectionAggregates) -> tuple:
+    return (aggregates.rows, aggregates.songs, aggregates.not_found, aggregates.explicit,
+            aggregates.artists, aggregates.genres, aggregates.popularity, aggregates.years)
+
+
+class TestCollectionAggregates(unittest.TestCase):
+    def test_delta_updates_equal_full_recompute(self):
+        rng = random.Random(4)
+        songs = [f"Song {i}" for i in range(60)]
+        aggregates = CollectionAggregates("c")
+        rows = Counter()
+        for _ in range(25):
+            # The list grows, loses some rows and repeats others
+            rows = Counter({key: times for key, times in rows.items() if rng.random() > 0.1})
+            rows.update(rng.choices(songs, k=rng.randint(0, 8)))
+            added, removed = aggregates.diff(rows)
+            for key, times in removed.items():
+                aggregates.remove_row(key, times)
+            for key, times in added.items():
+                aggregates.add_row(key, contribution(key), times)
+            self.assertEqual(totals(aggregates), totals(recompute(rows)))
+            self.assertEqual(len(aggregates), sum(rows.values()))
+
+        aggregates.diff(Counter())
+        for key, times in list(aggregates.rows.items()):
+            aggregates.remove_row(key, times)
+        self.assertEqual(totals(aggregates), totals(CollectionAggregates("c")))
+
+    def test_merge_equals_combined_rows(self):
+        first = Counter({"Song 1": 2, "Song 2": 1, "Song 3": 1})
+        second = Counter({"Song 3": 2, "Song 4": 1})
+        merged = recompute(first)
+        merged.merge(recompute(second))
+        self.assertEqual(totals(merged), totals(recompute(first + second)))
+
+    def test_replace_contribution_of_rechecked_row(self):
+        key = next(f"Song {i}" for i in range(100) if contribution(f"Song {i}")["track"] is None)
+        found = next(contribution(f"Song {i}") for i in range(100)
+                     if contribution(f"Song {i}")["track"] is not None)
+        aggregates = recompute(Counter({key: 3, "Other": 1}))
+        aggregates.contributions[key]["checked"] = 100
+        self.assertIn(key, aggregates.stale_not_found(200))
+        self.assertNotIn(key, aggregates.stale_not_found(50))
+
+        aggregates.replace_contribution(key, found)
+        expected = CollectionAggregates("c")
+        expected.add_row(key, found, 3)
+        expected.add_row("Other", contribution("Other"), 1)
+        self.assertEqual(totals(aggregates), totals(expected))
+        self.assertNotIn(key, aggregates.stale_not_found(200))
+
+    def test_save_load(self):
+        aggregates = recompute(Counter({"Song 1": 2, "Song 2": 1, "Song 9": 4}))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "collection.json.gz")
+            aggregates.save(path)
+            self.assertEqual(totals(CollectionAggregates.load(path, "c")), totals(aggregates))
+            self.assertEqual(len(CollectionAggregates.load(path, "other")), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
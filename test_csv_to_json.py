@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the streaming CSV/NDJSON converters
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+from csv_to_json import RowStats, iter_songs, parse_args, write_chunks, write_ndjson
+
+
+class ConverterTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name: str, text: str) -> str:
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        return path
+
+
+class TestIterSongs(ConverterTest):
+    def test_csv_rows_are_cleaned_and_validated(self):
+        path = self.write("songs.csv", "song_name,artist_name,uri\r\n"
+                                       "  Sweater   Weather ,The Neighbourhood,\r\n"
+                                       ",Nobody,\r\n"
+                                       "Café,Someone,spotify:track:abc\r\n")
+        stats = RowStats()
+        self.assertEqual(list(iter_songs(path, stats)), [
+            {"song_name": "Sweater Weather", "artist_name": "The Neighbourhood"},
+            {"song_name": "Café", "artist_name": "Someone", "uri": "spotify:track:abc"},
+        ])
+        self.assertEqual((stats.rows, stats.valid, stats.skipped), (3, 2, 1))
+
+    def test_ndjson_round_trip(self):
+        songs = [{"song_name": f"Song {i}", "artist_name": "Édith"} for i in range(5)]
+        path = os.path.join(self.directory.name, "songs.ndjson")
+        write_ndjson(iter(songs), path)
+        self.assertEqual(list(iter_songs(path)), songs)
+
+
+class TestWriteChunks(ConverterTest):
+    SONGS = [{"song_name": f"Song {i}", "artist_name": "Artist " + "x" * (i % 40)} for i in range(500)]
+
+    def test_chunks_stay_within_chunk_bytes(self):
+        for chunk_bytes in (200, 1000, 4096, 10 ** 6):
+            with self.subTest(chunk_bytes=chunk_bytes):
+                output_dir = os.path.join(self.directory.name, str(chunk_bytes))
+                files, oversized = write_chunks(iter(self.SONGS), output_dir, chunk_bytes)
+                self.assertEqual(oversized, [])
+                songs = []
+                for path in files:
+                    self.assertLessEqual(os.path.getsize(path), chunk_bytes)
+                    with open(path, encoding="utf-8") as f:
+                        songs += json.load(f)["songs"]
+                self.assertEqual(songs, self.SONGS)
+        self.assertEqual(len(files), 1)
+
+    def test_oversized_song_gets_a_chunk_of_its_own(self):
+        songs = [{"song_name": "a", "artist_name": "b"},
+                 {"song_name": "x" * 500, "artist_name": "b"},
+                 {"song_name": "c", "artist_name": "d"}]
+        files, oversized = write_chunks(iter(songs), self.directory.name, 100)
+        self.assertEqual(len(files), 3)
+        self.assertEqual(oversized, [files[1]])
+        with open(files[1], encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["songs"], [songs[1]])
+
+    def test_no_songs_writes_no_files(self):
+        self.assertEqual(write_chunks(iter([]), self.directory.name), ([], []))
+
+
+class TestParseArgs(unittest.TestCase):
+    def test_valid_command_lines(self):
+        self.assertEqual(parse_args(["csv_to_json.py", "in.csv"])[0], "in.csv")
+        _, options = parse_args(["csv_to_json.py", "in.csv", "--chunks", "out", "--chunk-bytes", "5000"])
+        self.assertEqual((options["--chunks"], options["--chunk-bytes"], options["--ndjson"]), ("out", "5000", None))
+
+    def test_invalid_command_lines(self):
+        for argv in (
+            ["csv_to_json.py"],
+            ["csv_to_json.py", "--ndjson", "out.ndjson"],
+            ["csv_to_json.py", "in.csv", "--ndjson"],
+            ["csv_to_json.py", "in.csv", "--output"],
+            ["csv_to_json.py", "in.csv", "--chunks", "--chunk-bytes", "10"],
+            ["csv_to_json.py", "in.csv", "--chunks", "out", "--chunk-bytes"],
+            ["csv_to_json.py", "in.csv", "--chunks", "out", "--chunk-bytes", "1MB"],
+            ["csv_to_json.py", "in.csv", "--chunks", "out", "--chunk-bytes", "0"],
+            ["csv_to_json.py", "in.csv", "--chunk-bytes", "10"],
+            ["csv_to_json.py", "in.csv", "--ndjson", "a.ndjson", "--chunks", "out"],
+        ):
+            with self.subTest(argv=argv):
+                with self.assertRaises(ValueError):
+                    parse_args(argv)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Unit tests for keeping tool responses under a byte limit
+"""
+
+import json
+import unittest
+
+from response_budget import encode_response, encode_within
+
+
+def sample_result(songs: int = 200) -> dict:
+    return {
+        "total_songs": songs,
+        "average_popularity": 61.5,
+        "tracks": [
+            {"name": f"Song {i}", "artist": f"Artist {i % 17}", "popularity": i % 100}
+            for i in range(songs)
+        ],
+        "genre_diversity": {
+            "unique_genres": 40,
+            "genres": {f"genre {i}": 40 - i for i in range(40)}
+        }
+    }
+
+
+SECTIONS = ["genre_diversity.genres", "tracks"]
+
+
+class TestEncodeResponse(unittest.TestCase):
+    def test_without_limit_result_is_whole(self):
+        result = sample_result()
+        self.assertEqual(encode_response(result, None, SECTIONS), (json.dumps(result, indent=2), None))
+        self.assertEqual(encode_response(result, 0, SECTIONS), (json.dumps(result, indent=2), None))
+
+    def test_result_that_fits_is_unchanged(self):
+        result = sample_result(3)
+        text = json.dumps(result, indent=2)
+        self.assertEqual(encode_response(result, len(text), SECTIONS), (text, None))
+        self.assertEqual(encode_within(result, len(text)), text)
+        self.assertIsNone(encode_within(result, len(text) - 1))
+
+    def test_stays_within_max_bytes(self):
+        result = sample_result()
+        full = len(json.dumps(result, indent=2))
+        for max_bytes in range(600, full, 97):
+            with self.subTest(max_bytes=max_bytes):
+                text, cut = encode_response(result, max_bytes, SECTIONS)
+                self.assertLessEqual(len(text.encode("utf-8")), max_bytes)
+                decoded = json.loads(text)
+
+                # The summary is kept exactly; details are leading items
+                self.assertEqual(decoded["total_songs"], result["total_songs"])
+                self.assertEqual(decoded["genre_diversity"]["unique_genres"], 40)
+                tracks = decoded["tracks"]
+                self.assertEqual(tracks, result["tracks"][:len(tracks)])
+                genres = decoded["genre_diversity"]["genres"]
+                self.assertEqual(list(genres.items()),
+                                 list(result["genre_diversity"]["genres"].items())[:len(genres)])
+
+                # The report matches what was kept
+                self.assertEqual(decoded["truncated"]["sections"], cut)
+                self.assertEqual(decoded["truncated"]["max_response_bytes"], max_bytes)
+                kept = {"tracks": len(tracks), "genre_diversity.genres": len(genres)}
+                totals = {"tracks": 200, "genre_diversity.genres": 40}
+                for entry in cut:
+                    self.assertEqual(entry["kept"], kept[entry["section"]])
+                    self.assertEqual(entry["total"], totals[entry["section"]])
+                self.assertEqual({entry["section"] for entry in cut},
+                                 {path for path in kept if kept[path] < totals[path]})
+
+    def test_first_listed_section_gives_way_first(self):
+        result = sample_result(20)
+        text, cut = encode_response(result, len(json.dumps(result, indent=2)) - 300, SECTIONS)
+        self.assertEqual(len(json.loads(text)["tracks"]), 20)
+        self.assertEqual([entry["section"] for entry in cut], ["genre_diversity.genres"])
+
+    def test_without_sections_result_is_whole(self):
+        result = sample_result()
+        self.assertEqual(encode_response(result, 100, ["missing"]), (json.dumps(result, indent=2), None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the MinHash/LSH similarity index
+"""
+
+import os
+import random
+import tempfile
+import unittest
+
+from similarity_index import SimilarityIndex
+
+
+def pair_with_jaccard(rng: random.Random, jaccard: float, size: int = 90) -> tuple[set, set]:
+    """Two token sets of the given size whose Jaccard similarity is jaccard."""
+    shared = round(2 * size * jaccard / (1 + jaccard))
+    tokens = [f"track:{rng.getrandbits(64):x}" for _ in range(2 * size - shared)]
+    return set(tokens[:size]), set(tokens[:shared] + tokens[size:])
+
+
+class TestSimilarityIndex(unittest.TestCase):
+    PAIRS = 100
+
+    def candidate_rate(self, jaccard: float) -> tuple[float, float]:
+        """Fraction of pairs found by a query, and the mean estimate error."""
+        rng = random.Random(int(jaccard * 100))
+        index = SimilarityIndex()
+        pairs = [pair_with_jaccard(rng, jaccard) for _ in range(self.PAIRS)]
+        for i, (indexed, _) in enumerate(pairs):
+            index.add(f"playlist {i}", indexed)
+        found, error = 0, 0.0
+        for i, (indexed, query) in enumerate(pairs):
+            self.assertAlmostEqual(len(indexed & query) / len(indexed | query), jaccard, delta=0.01)
+            matches, _ = index.query(query, top_n=self.PAIRS)
+            scores = {key: score for key, score, _ in matches}
+            if f"playlist {i}" in scores:
+                found += 1
+            error += abs(SimilarityIndex.estimate(index.signature(indexed), index.signature(query)) - jaccard)
+        return found / self.PAIRS, error / self.PAIRS
+
+    def test_recall_at_jaccard_one_half(self):
+        # 32 bands of 4 rows: 1 - (1 - 0.5 ** 4) ** 32 = 0.87
+        recall, error = self.candidate_rate(0.5)
+        self.assertGreaterEqual(recall, 0.75)
+        self.assertLess(error, 0.06)
+
+    def test_dissimilar_pairs_are_rarely_candidates(self):
+        # 1 - (1 - 0.2 ** 4) ** 32 = 0.05
+        rate, _ = self.candidate_rate(0.2)
+        self.assertLessEqual(rate, 0.15)
+
+    def test_identical_sets_always_match(self):
+        index = SimilarityIndex()
+        index.add("a", {"x", "y", "z"}, {"name": "A"})
+        matches, candidates = index.query({"z", "y", "x"})
+        self.assertEqual((matches, candidates), ([("a", 1.0, {"name": "A"})], 1))
+        self.assertEqual(index.query({"z", "y", "x"}, exclude="a"), ([], 0))
+
+    def test_readd_and_remove(self):
+        index = SimilarityIndex()
+        index.add("a", {"x", "y"})
+        index.add("a", {"p", "q"})
+        self.assertEqual(index.query({"x", "y"})[0], [])
+        self.assertEqual(index.query({"p", "q"})[0][0][0], "a")
+        index.remove("a")
+        self.assertEqual((len(index), index.query({"p", "q"})[1]), (0, 0))
+
+    def test_save_load(self):
+        index = SimilarityIndex()
+        index.add("a", {"x", "y", "z"}, {"name": "A"})
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "similarity.json.gz")
+            index.save(path)
+            loaded = SimilarityIndex()
+            loaded.load(path)
+        self.assertEqual(loaded.query({"x", "y", "z"}), index.query({"x", "y", "z"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
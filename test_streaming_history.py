@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the streaming history importer's chunked JSON array parser
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+import streaming_history
+from streaming_history import iter_json_array
+
+
+class TestIterJsonArray(unittest.TestCase):
+    def setUp(self):
+        self.chunk_bytes = streaming_history.READ_CHUNK_BYTES
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        streaming_history.READ_CHUNK_BYTES = self.chunk_bytes
+        self.directory.cleanup()
+
+    def parse(self, text: str, chunk_bytes: int) -> list:
+        path = os.path.join(self.directory.name, "history.json")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        streaming_history.READ_CHUNK_BYTES = chunk_bytes
+        return list(iter_json_array(path))
+
+    def assert_parses_at_every_chunk_size(self, text: str):
+        expected = json.loads(text)
+        for chunk_bytes in range(1, len(text.encode("utf-8")) + 2):
+            with self.subTest(chunk_bytes=chunk_bytes):
+                self.assertEqual(self.parse(text, chunk_bytes), expected)
+
+    def test_numbers_split_across_chunks(self):
+        self.assert_parses_at_every_chunk_size("[1.5, 2, -30, 4e2, 5.25E-1, 600]")
+
+    def test_number_before_closing_bracket(self):
+        self.assert_parses_at_every_chunk_size("[10.75]")
+
+    def test_records_split_across_chunks(self):
+        self.assert_parses_at_every_chunk_size(
+            '[{"ms_played": 1.5, "master_metadata_track_name": "Sóng ✨", "skipped": null},\n'
+            ' {"ms_played": 31000, "shuffle": true, "offline": false}]'
+        )
+
+    def test_byte_order_mark_and_whitespace(self):
+        self.assertEqual(self.parse('\ufeff \n[ 1 ,\n 2 ]\n', 1), [1, 2])
+
+    def test_empty_files(self):
+        self.assertEqual(self.parse("", 4), [])
+        self.assertEqual(self.parse("[]", 1), [])
+
+    def test_not_an_array(self):
+        with self.assertRaises(ValueError):
+            self.parse('{"a": 1}', 4)
+
+    def test_truncated_file(self):
+        with self.assertRaises(ValueError):
+            self.parse("[1, 2", 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Accuracy tests for the fixed-memory streaming sketches
+"""
+
+import json
+import random
+import unittest
+from collections import Counter
+
+from streaming_sketches import CountMinSketch, HeavyHitters, HyperLogLog
+
+
+def zipf_stream(items: int, length: int, seed: int = 7) -> list:
+    """length draws from items distinct strings with Zipf-like frequencies."""
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, items + 1)]
+    return [f"item {i}" for i in rng.choices(range(items), weights, k=length)]
+
+
+class TestCountMinSketch(unittest.TestCase):
+    def test_error_bound(self):
+        stream = zipf_stream(5000, 50000)
+        sketch = CountMinSketch(epsilon=0.001, delta=0.01)
+        for item in stream:
+            sketch.add(item)
+        exact = Counter(stream)
+        self.assertEqual(sketch.total, len(stream))
+        overcounts = [sketch.estimate(item) - count for item, count in exact.items()]
+        # Never below the true count...
+        self.assertGreaterEqual(min(overcounts), 0)
+        # ...and above it by more than epsilon * total for at most delta of the items
+        beyond = sum(1 for overcount in overcounts if overcount > sketch.error_bound)
+        self.assertLessEqual(beyond, 0.01 * len(exact))
+
+    def test_weighted_counts(self):
+        sketch = CountMinSketch(epsilon=0.01)
+        sketch.add("a", 5)
+        sketch.add("b", 3)
+        self.assertEqual((sketch.total, sketch.estimate("a")), (8, 5))
+
+    def test_round_trip(self):
+        sketch = CountMinSketch(epsilon=0.01)
+        for item in zipf_stream(500, 5000):
+            sketch.add(item)
+        restored = CountMinSketch.from_dict(json.loads(json.dumps(sketch.to_dict())))
+        self.assertEqual(restored.total, sketch.total)
+        for i in range(500):
+            self.assertEqual(restored.estimate(f"item {i}"), sketch.estimate(f"item {i}"))
+
+
+class TestHeavyHitters(unittest.TestCase):
+    def test_finds_the_most_frequent_items(self):
+        stream = zipf_stream(20000, 100000)
+        hitters = HeavyHitters(capacity=100, epsilon=0.001)
+        for item in stream:
+            hitters.add(item)
+        exact = Counter(stream)
+        top = hitters.top(10)
+        self.assertEqual([item for item, _ in top], [item for item, _ in exact.most_common(10)])
+        for item, estimate in top:
+            self.assertGreaterEqual(estimate, exact[item])
+            self.assertLessEqual(estimate - exact[item], hitters.error_bound)
+
+    def test_resumed_counting_matches_one_pass(self):
+        stream = zipf_stream(3000, 30000)
+        one_pass = HeavyHitters(capacity=50, epsilon=0.002)
+        for item in stream:
+            one_pass.add(item)
+        resumed = HeavyHitters(capacity=50, epsilon=0.002)
+        for start in range(0, len(stream), 7000):
+            resumed = HeavyHitters.from_dict(json.loads(json.dumps(resumed.to_dict())))
+            for item in stream[start:start + 7000]:
+                resumed.add(item)
+        self.assertEqual(resumed.total, one_pass.total)
+        self.assertEqual(resumed.top(10), one_pass.top(10))
+
+
+class TestHyperLogLog(unittest.TestCase):
+    def test_relative_error(self):
+        for distinct in (10, 1000, 50000):
+            with self.subTest(distinct=distinct):
+                counter = HyperLogLog(precision=12)
+                for i in range(distinct):
+                    counter.add(f"artist {i}")
+                    counter.add(f"artist {i // 2}")     # repeats don't count
+                error = abs(counter.count() - distinct) / distinct
+                # Three standard errors
+                self.assertLessEqual(error, 3 * counter.relative_error)
+
+    def test_for_error(self):
+        self.assertLessEqual(HyperLogLog.for_error(0.01).relative_error, 0.01)
+        with self.assertRaises(ValueError):
+            HyperLogLog(precision=3)
+
+    def test_round_trip(self):
+        counter = HyperLogLog(precision=10)
+        for i in range(5000):
+            counter.add(str(i))
+        restored = HyperLogLog.from_dict(json.loads(json.dumps(counter.to_dict())))
+        self.assertEqual(restored.count(), counter.count())
+        restored.add("one more")
+        self.assertEqual(restored.precision, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Track Records - Compact, immutable tracks instead of raw Spotify payloads
+
+A Spotify track payload is a nest of dicts and lists: album images, the
+album's and the track's available_markets (180+ country codes each),
+external IDs, disc/track numbers... The server reads a handful of those
+fields, so every payload is projected into a TrackRecord as soon as it
+arrives and the raw dict is dropped.
+
+    TrackRecord - id, name, uri, artists, album, popularity, explicit,
+                  preview_url and the open.spotify.com URL
+    ArtistRef   - (id, name) of one of the track's artists
+    AlbumRef    - (name, release_date) of the track's album
+
+Records read like the Spotify dicts they replace (track["artists"][0]["name"],
+track.get("preview_url"), track["external_urls"]["spotify"]), but only for
+the fields they keep, and they can't be modified. Each is a tuple subclass
+with empty __slots__: one tuple per record, no per-instance dict. to_dict()
+gives the Spotify-shaped dict back; from_spotify() accepts that dict, a full
+payload or a record. Many records at once are saved as columns
+(to_track_columns / from_track_columns), which load without building a
+dict per track.
+"""
+
+
+def _field(position: int) -> property:
+    # operator.itemgetter would go through the dict-style __getitem__
+    return property(lambda self: tuple.__getitem__(self, position))
+
+
+class _Record(tuple):
+    """Read-only tuple of named fields with dict-style access to them.
+
+    Subclasses list their fields in _fields and get one property per field.
+    """
+
+    __slots__ = ()
+    _fields = ()
+    _positions = {}
+
+    def __init_subclass__(cls):
+        super().__init_subclass__()
+        cls._positions = {field: i for i, field in enumerate(cls._fields)}
+        for i, field in enumerate(cls._fields):
+            setattr(cls, field, _field(i))
+
+    def __getitem__(self, key):
+        return tuple.__getitem__(self, self._positions[key])
+
+    def get(self, key, default=None):
+        position = self._positions.get(key)
+        return default if position is None else tuple.__getitem__(self, position)
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def __repr__(self):
+        fields = ", ".join(f"{f}={v!r}" for f, v in zip(self._fields, self))
+        return f"{type(self).__name__}({fields})"
+
+    def __getnewargs__(self):
+        return tuple(self)
+
+
+class ArtistRef(_Record):
+    """One artist of a track: {"id", "name"}."""
+
+    __slots__ = ()
+    _fields = ("id", "name")
+
+    def __new__(cls, id, name):
+        return tuple.__new__(cls, (id, name))
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "name": self.name}
+
+
+class AlbumRef(_Record):
+    """A track's album: {"name", "release_date"}."""
+
+    __slots__ = ()
+    _fields = ("name", "release_date")
+
+    def __new__(cls, name, release_date):
+        return tuple.__new__(cls, (name, release_date))
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "release_date": self.release_date}
+
+
+_NO_ALBUM = AlbumRef(None, None)
+
+
+class TrackRecord(_Record):
+    """The fields of a Spotify track the server reads.
+
+    Records with the same ID are equal (and hash alike), so they work as
+    set members and dict keys the way track IDs do.
+    """
+
+    __slots__ = ()
+    _fields = ("id", "name", "uri", "artists", "album", "popularity", "explicit",
+               "preview_url", "url")
+
+    def __new__(cls, id, name, uri=None, artists=(), album=_NO_ALBUM, popularity=0,
+                explicit=False, preview_url=None, url=None):
+        return tuple.__new__(cls, (id, name, uri, tuple(artists), album, popularity, explicit,
+                                   preview_url, url))
+
+    @property
+    def external_urls(self) -> dict:
+        url = tuple.__getitem__(self, 8)
+        return {"spotify": url} if url else {}
+
+    def __getitem__(self, key):
+        if key == "external_urls":
+            return self.external_urls
+        return tuple.__getitem__(self, self._positions[key])
+
+    def get(self, key, default=None):
+        if key == "external_urls":
+            return self.external_urls
+        return super().get(key, default)
+
+    def __contains__(self, key):
+        return key == "external_urls" or key in self._positions
+
+    def __eq__(self, other):
+        if type(other) is not TrackRecord:
+            return NotImplemented
+        return self.id == other.id
+
+    def __ne__(self, other):
+        if type(other) is not TrackRecord:
+            return NotImplemented
+        return self.id != other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    @classmethod
+    def from_spotify(cls, track) -> "TrackRecord":
+        """Project a Spotify track payload (or a to_dict() dict) into a record."""
+        if type(track) is cls:
+            return track
+        album = track.get("album")
+        urls = track.get("external_urls")
+        return tuple.__new__(cls, (
+            track.get("id"),
+            track.get("name"),
+            track.get("uri"),
+            tuple([ArtistRef(a.get("id"), a.get("name")) for a in track.get("artists") or ()]),
+            AlbumRef(album.get("name"), album.get("release_date")) if album else _NO_ALBUM,
+            track.get("popularity") or 0,
+            bool(track.get("explicit")),
+            track.get("preview_url"),
+            urls.get("spotify") if urls else None
+        ))
+
+    def to_dict(self) -> dict:
+        """Spotify-shaped dict of the kept fields (for JSON)."""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "uri": self.uri,
+            "artists": [artist.to_dict() for artist in self.artists],
+            "album": self.album.to_dict(),
+            "popularity": self.popularity,
+            "explicit": self.explicit,
+            "preview_url": self.preview_url,
+            "external_urls": self.external_urls
+        }
+
+
+def track_records(tracks) -> list:
+    """from_spotify() over a list of payloads, skipping empty entries."""
+    return [TrackRecord.from_spotify(track) for track in tracks if track]
+
+
+TRACK_URI_PREFIX = "spotify:track:"
+
+
+def to_track_columns(records) -> dict:
+    """Records as aligned columns (one list per field) for JSON files.
+
+    The uri column is None wherever it is spotify:track:<id>, which it
+    nearly always is (the ID would otherwise be stored twice).
+    """
+    return {
+        "id": [r.id for r in records],
+        "name": [r.name for r in records],
+        "uri": [None if r.uri == TRACK_URI_PREFIX + str(r.id) else r.uri for r in records],
+        "artist_ids": [[a.id for a in r.artists] for r in records],
+        "artist_names": [[a.name for a in r.artists] for r in records],
+        "album": [r.album.name for r in records],
+        "release_date": [r.album.release_date for r in records],
+        "popularity": [r.popularity for r in records],
+        "explicit": [r.explicit for r in records],
+        "preview_url": [r.preview_url for r in records],
+        "url": [r.url for r in records]
+    }
+
+
+def from_track_columns(columns: dict) -> list:
+    """Records from to_track_columns(), built without a dict per track."""
+    new_record = tuple.__new__
+    return [
+        new_record(TrackRecord, (
+            track_id, name, uri or TRACK_URI_PREFIX + track_id,
+            tuple([ArtistRef(a, n) for a, n in zip(artist_ids, artist_names)]),
+            AlbumRef(album, release_date), popularity, explicit, preview_url, url
+        ))
+        for track_id, name, uri, artist_ids, artist_names, album, release_date, popularity, explicit,
+        preview_url, url in zip(
+            columns["id"], columns["name"], columns["uri"], columns["artist_ids"], columns["artist_names"],
+            columns["album"], columns["release_date"], columns["popularity"], columns["explicit"],
+            columns["preview_url"], columns["url"]
+        )
+    ]